@@ -56,12 +56,12 @@ class GameWindow(QtWidgets.QMainWindow):
 
     def stop_dispatcher(self):
         self.dispatcher.stop()
-        self.dispatcher.wait()
+        self.dispatcher.join()
 
     def start_dispatcher(self):
-        self.dispatcher_queues = { self.config['network']['tcp_dispatcher']['server_ip'] : queue.Queue() }
-        self.dispatcher = TCPDispatcher(self,
-            queues      = self.dispatcher_queues,
+        self.dispatcher = TCPDispatcher(self.config,
+            abonents    = [ self.config['network']['tcp_dispatcher']['server_ip'] ],
+            on_packet   = lambda **packet: QtWidgets.QApplication.postEvent(self, TCPDispatcherEvent(**packet)),
             bind_ip     = str(self.config['network']['tcp_dispatcher']['abonent']['ip']),
             bind_port   = int(self.config['network']['tcp_dispatcher']['abonent']['port']))
         self.dispatcher.start()
@@ -82,6 +82,9 @@ class GameWindow(QtWidgets.QMainWindow):
                 self.game.start(int(event.data[0]))
             if event.code == ExchangeProtocol.GAME_EVENT_STOP:
                 self.game.stop()
+            if event.code in (ExchangeProtocol.GAME_EVENT_UP, ExchangeProtocol.GAME_EVENT_DOWN,
+                              ExchangeProtocol.GAME_EVENT_LEFT, ExchangeProtocol.GAME_EVENT_RIGHT):
+                self.game.move(event.code, echo = False)
 
     def closeEvent(self, event):
         self.game.stop()
@@ -244,32 +247,37 @@ class Game(QtWidgets.QFrame):
 
     def send_event(self, event_code: int, game_score: int):
         server_ip = self.parent.config['network']['tcp_dispatcher']['server_ip']
-        self.parent.dispatcher_queues[server_ip].put(
-            (event_code, 0, 32, 4, [game_score]))
+        self.parent.dispatcher.post(server_ip,
+            (event_code, 0, 32, 4, [game_score]), timeout=0)
 
     def keyPressEvent(self, event):
+        keys = {
+            QtCore.Qt.Key_Left  : ExchangeProtocol.GAME_EVENT_LEFT,
+            QtCore.Qt.Key_Right : ExchangeProtocol.GAME_EVENT_RIGHT,
+            QtCore.Qt.Key_Up    : ExchangeProtocol.GAME_EVENT_UP,
+            QtCore.Qt.Key_Down  : ExchangeProtocol.GAME_EVENT_DOWN
+        }
+        if event.key() in keys:
+            self.move(keys[event.key()])
+
+    def move(self, event_code: int, echo: bool = True):
+        # Key presses are echoed to the server (recorded as labeled windows), model decisions are not
         if not self.timer.isActive():
             return
 
-        key = event.key()
-        send_event = None
         changed = False
-        if key == QtCore.Qt.Key_Left:
+        if event_code == ExchangeProtocol.GAME_EVENT_LEFT:
             changed = self.move_left()
-            send_event = ExchangeProtocol.GAME_EVENT_LEFT
-        elif key == QtCore.Qt.Key_Right:
+        elif event_code == ExchangeProtocol.GAME_EVENT_RIGHT:
             changed = self.move_right()
-            send_event = ExchangeProtocol.GAME_EVENT_RIGHT
-        elif key == QtCore.Qt.Key_Up:
+        elif event_code == ExchangeProtocol.GAME_EVENT_UP:
             changed = self.move_up()
-            send_event = ExchangeProtocol.GAME_EVENT_UP
-        elif key == QtCore.Qt.Key_Down:
+        elif event_code == ExchangeProtocol.GAME_EVENT_DOWN:
             changed = self.move_down()
-            send_event = ExchangeProtocol.GAME_EVENT_DOWN
 
-        if send_event:
+        if echo:
             score = self.score if changed else 0
-            self.send_event(send_event, score)
+            self.send_event(event_code, score)
 
         if changed:
             self.new_cell()
@@ -0,0 +1,244 @@
+import json
+import queue
+import signal
+import argparse
+import threading
+import numpy as np
+from dispatchers import *
+from recorder import *
+from filters import *
+from ringbuffer import *
+from devices import *
+from replay import *
+from features import *
+from inference import *
+from metrics import *
+
+
+def load_config(path: str):
+    with open(path, 'r') as config:
+        config = json.loads(config.read())
+
+    assert config['adc']['sampling_rate']
+    assert config['adc']['resolution']
+    assert config['adc']['channels']
+    assert config['adc']['range']
+    assert config['adc']['vref']
+
+    assert config['dataset']['sampling_time']
+    assert config['dataset']['update_delay']
+    assert config['dataset']['batch_delay']
+    assert config['dataset']['batch_samples']
+    assert config['dataset']['dest_path']
+
+    assert config['network']['tcp_dispatcher']['server_ip']
+    assert config['network']['tcp_dispatcher']['server_port']
+    assert config['network']['tcp_dispatcher']['abonents']
+    assert type(config['network']['tcp_dispatcher']['abonents']) is list
+    for abonent in config['network']['tcp_dispatcher']['abonents']:
+        assert 'name' in abonent
+        assert 'ip' in abonent
+        assert 'port' in abonent
+    return config
+
+
+#
+# Acquisition pipeline, no GUI
+#
+# UDP ingest -> decoding -> IIR filter -> features -> subscribers, plus the TCP event
+# server and the recorder of event windows. Runs on plain threads; the
+# dashboard is an optional subscriber:
+#   on_batch(adc_values, filtered, lost_packets, device) - UDP dispatcher thread
+#   on_packet(data, event_code, event_iter, event_bits)  - TCP dispatcher thread
+#   on_features(features, device)                        - UDP dispatcher thread, (channels, FEATURES)
+# Every device (headset) has its own filter state and history; event windows
+# are recorded with the channels of all devices stacked in device order.
+# ----------------------------------------------------------------------------------
+class Acquisition():
+    def __init__(self, config):
+        self.config         = config
+        self.adc_channels   = int(self.config['adc']['channels'])
+        self.adc_vref       = float(self.config['adc']['vref'])
+        self.sampling_rate  = int(self.config['adc']['sampling_rate'])
+        self.sampling_time  = int(self.config['dataset']['sampling_time'])
+        self.batch_samples  = int(self.config['dataset']['batch_samples'])
+
+        self.lock           = threading.Lock()
+        self.batch_subscribers  = []
+        self.packet_subscribers = []
+        self.feature_subscribers = []
+        self.sample_iter    = 0
+        self.recorder       = None
+        self.recorder_queue = None
+        self.metrics        = None
+        METRICS.gauge('recorder_queue', lambda: self.recorder_queue.qsize() if self.recorder_queue else 0)
+
+        # IIR filter, Butterworth, all channels of every device
+        self.devices = udp_devices(self.config)
+        self.iir = [ButterworthFilter(
+            order           = int(self.config['dataset'].get('iir_order', 10)),
+            fcut            = int(self.config['dataset'].get('iir_cutoff', 60)),
+            sampling_rate   = self.sampling_rate,
+            channels        = self.adc_channels) for device in self.devices]
+        # Last sampling_time window of raw values, recorded on every game event
+        self.history = [RingBuffer(self.sampling_rate * self.sampling_time, self.adc_channels) for device in self.devices]
+        # dataset.features: { "window", "hop", "segment" } ms - feature frames of the filtered values
+        features = self.config['dataset'].get('features')
+        self.features = [FeatureExtractor(
+            sampling_rate   = self.sampling_rate,
+            channels        = self.adc_channels,
+            window          = int(self.sampling_rate * features['window'] / 1000),
+            hop             = int(self.sampling_rate * features['hop'] / 1000),
+            segment         = int(self.sampling_rate * features.get('segment', 1000) / 1000)) for device in self.devices] if features else None
+
+        # dataset.replay: { "path", "speed", "events" } - a recorded session instead of the UDP stream
+        replay = self.config['dataset'].get('replay')
+        if replay:
+            self.udp_dispatcher = SessionReplay(self.config, replay['path'], on_batch = self.on_batch, speed = float(replay.get('speed', 1.0)),
+                                                events = tuple(replay['events']) if replay.get('events') else None)
+        else:
+            self.udp_dispatcher = UDPDispatcher(self.config, on_batch = self.on_batch)
+        self.tcp_dispatcher = TCPDispatcher(self.config, abonents = [str(abonent['ip']) for abonent in self.config['network']['tcp_dispatcher']['abonents']], on_packet = self.on_packet, type = ExchangeProtocol.TCP_SERVER)
+
+        # inference: { "model", "abonent", "device", "threshold", "cooldown" ms, "budget" ms } - direction events of a model
+        inference = self.config.get('inference')
+        self.inference = InferenceService(self, load_model(inference['model']),
+            abonent     = str(inference.get('abonent', 'game')).lower(),
+            device      = int(inference.get('device', 0)),
+            threshold   = float(inference.get('threshold', 0.6)),
+            cooldown    = float(inference.get('cooldown', 500)) / 1000,
+            budget      = float(inference.get('budget', 50)) / 1000) if inference else None
+
+    def subscribe(self, on_batch = None, on_packet = None, on_features = None):
+        if on_batch:
+            self.batch_subscribers.append(on_batch)
+        if on_packet:
+            self.packet_subscribers.append(on_packet)
+        if on_features:
+            self.feature_subscribers.append(on_features)
+
+    def start(self):
+        # metrics: { "enabled", "ip", "port", "dump", "interval" } - stage latencies and queue depths
+        self.metrics = metrics_setup(self.config)
+        self.tcp_dispatcher.start()
+        if self.inference:
+            self.inference.start()
+        self.udp_dispatcher.start()
+
+    def stop(self):
+        self.udp_dispatcher.stop()
+        self.udp_dispatcher.join()
+        if self.inference:
+            self.inference.stop()
+            self.inference.join()
+        self.tcp_dispatcher.stop()
+        self.tcp_dispatcher.join()
+        self.stop_recorder()
+        if self.metrics:
+            self.metrics.stop()
+            self.metrics.join()
+
+    def set_cutoff(self, fcut: int):
+        with self.lock:
+            for iir in self.iir:
+                iir.set_cutoff(fcut)
+
+    #
+    # Recorder methods
+    # --------------------------------------------------------------
+    def start_recorder(self, on_progress = None):
+        self.recorder_queue = queue.Queue()
+        self.recorder = Recorder(self.config, queue = self.recorder_queue, on_progress = on_progress, channels = self.adc_channels * len(self.devices))
+        self.recorder.start_session()
+
+    def stop_recorder(self):
+        if self.recorder:
+            self.recorder_queue = None
+            self.recorder.stop()
+            if self.recorder.is_alive():
+                self.recorder.join()
+            self.recorder = None
+
+    def record(self, event_id: int, iter: int, adc_values: np.ndarray):
+        recorder_queue = self.recorder_queue
+        if recorder_queue:
+            recorder_queue.put((event_id, iter, adc_values))
+
+    #
+    # Thread sending
+    # --------------------------------------------------------------
+    def send_event(self, abonent_name: str, event_code: int, event_iter: int, event_bits: int, data_size: int, data: list, timeout: float = None):
+        for abonent in self.config['network']['tcp_dispatcher']['abonents']:
+            if str(abonent['name']).lower() == abonent_name:
+                abonent_ip = str(abonent['ip'])
+                return self.tcp_dispatcher.post(abonent_ip, (event_code, event_iter, event_bits, data_size, data), timeout)
+        return False
+
+    #
+    # Thread events
+    # --------------------------------------------------------------
+    def on_batch(self, adc_values: np.ndarray, lost_packets: int, device: int = 0):
+        with self.lock:
+            if lost_packets:
+                self.history[device].fill(self.adc_vref, lost_packets * self.batch_samples)
+            self.history[device].append(adc_values)
+            filtered = self.iir[device].process(adc_values)
+            stamps = METRICS.current() if METRICS.enabled else None
+            if stamps:
+                METRICS.stamp(stamps, 'filter')
+            frames = self.features[device].update(filtered) if self.features else 0
+            if frames and stamps:
+                METRICS.stamp(stamps, 'features')
+        for on_batch in self.batch_subscribers:
+            on_batch(adc_values, filtered, lost_packets, device)
+        if frames:
+            features = self.features[device].features
+            for on_features in self.feature_subscribers:
+                on_features(features, device)
+
+    def on_packet(self, data: list, event_code: int = 0, event_iter: int = 0, event_bits: int = 8):
+        if event_code in (ExchangeProtocol.GAME_EVENT_UP, ExchangeProtocol.GAME_EVENT_DOWN,
+                          ExchangeProtocol.GAME_EVENT_LEFT, ExchangeProtocol.GAME_EVENT_RIGHT):
+            with self.lock:
+                adc_values = np.concatenate([history.view() for history in self.history])
+            self.record(event_code, self.sample_iter, adc_values)
+            self.sample_iter = (self.sample_iter + 1) % 32
+        for on_packet in self.packet_subscribers:
+            on_packet(data = data, event_code = event_code, event_iter = event_iter, event_bits = event_bits)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Headless EEG acquisition: UDP ingest, filtering, recording and TCP event server')
+    parser.add_argument('--config', default='config.json')
+    parser.add_argument('--record', action='store_true', help='record event windows to dataset.dest_path')
+    parser.add_argument('--format', choices=['wav', 'chunks'], help='recording format, overrides dataset.recorder_format')
+    parser.add_argument('--replay', metavar='SESSION', help='replay a recorded session (<tm>.wav or <tm> of chunks) instead of UDP')
+    parser.add_argument('--speed', type=float, default=1.0, help='replay speed, x real time, 0 - as fast as possible')
+    parser.add_argument('--events', type=int, nargs=2, metavar=('FIRST', 'LAST'), help='replay event windows [FIRST, LAST) only')
+    parser.add_argument('--model', help='send direction events of a model (inference.py) to the Game abonent')
+    args = parser.parse_args()
+
+    config = load_config(args.config)
+    if args.format:
+        config['dataset']['recorder_format'] = args.format
+    if args.replay:
+        config['dataset']['replay'] = { 'path' : args.replay, 'speed' : args.speed, 'events' : args.events }
+    if args.model:
+        config['inference'] = dict(config.get('inference', {}), model = args.model)
+
+    acquisition = Acquisition(config)
+    stop = threading.Event()
+    signal.signal(signal.SIGINT, lambda signum, frame: stop.set())
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+
+    acquisition.start()
+    if args.record:
+        acquisition.start_recorder()
+    # A replay ends with the session
+    while not stop.wait(1) and acquisition.udp_dispatcher.is_alive():
+        pass
+    acquisition.stop()
+    if args.replay:
+        print(acquisition.udp_dispatcher.stats())
+    if acquisition.inference:
+        print(acquisition.inference.stats())
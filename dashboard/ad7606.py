@@ -0,0 +1,30 @@
+import numpy as np
+
+
+#
+# AD7606 batch packet (805 bytes), see batch_packet_t in firmwares/sources/main.c
+#
+# uint8_t   sync[2]             - offset 0; 0xAA,0xBB
+# uint8_t   counter             - offset 2; packet counter
+# int16_t   adc_values[5 * 80]  - offset 3; interleaved: sample0 ch0..ch4, sample1 ch0..ch4, ...
+# uint16_t  crc16               - offset 803;
+# ----------------------------------------------------------------------------------
+BATCH_PACKET_SYNC       = b'\xAA\xBB'
+BATCH_PACKET_CHANNELS   = 5
+BATCH_PACKET_SAMPLES    = 80
+BATCH_PACKET_VALUES     = 3
+BATCH_PACKET_CRC16      = BATCH_PACKET_VALUES + 2 * BATCH_PACKET_CHANNELS * BATCH_PACKET_SAMPLES
+BATCH_PACKET_SIZE       = BATCH_PACKET_CRC16 + 2
+
+
+def ad7606_scale(adc_range, adc_vref):
+    # Volts per ADC unit: (adc_range * value) / ((32768 * adc_vref) / 2.5)
+    return np.float32(adc_range / ((32768 * adc_vref) / 2.5))
+
+
+def ad7606_decode(packet, scale, channels: int = BATCH_PACKET_CHANNELS, samples: int = BATCH_PACKET_SAMPLES):
+    # Returns (channels, samples) float32 volts
+    values = np.frombuffer(packet, dtype='<i2', count=channels * samples, offset=BATCH_PACKET_VALUES)
+    result = values.reshape(samples, channels).T * scale
+    return np.ascontiguousarray(result, dtype=np.float32)
+
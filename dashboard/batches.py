@@ -0,0 +1,89 @@
+import threading
+import collections
+import numpy as np
+
+
+#
+# Batch of decoded samples delivered to a consumer (GUI thread)
+#
+# While the consumer hasn't taken a batch, the producer may merge newer
+# blocks into it. Blocks are (channels, samples) arrays. stamps - metrics
+# stamps of the first (oldest) block, see metrics.py.
+# ----------------------------------------------------------------------------------
+class Batch():
+    def __init__(self, adc_values: np.ndarray, lost_packets: int, stamps: dict = None):
+        self.lock           = threading.Lock()
+        self.stamps         = stamps
+        self.blocks         = [adc_values]
+        self.samples        = adc_values.shape[-1]
+        self.lost_packets   = lost_packets
+        self.consumed       = False
+
+    def merge(self, adc_values: np.ndarray, lost_packets: int, max_samples: int):
+        # Returns (merged, dropped blocks); the oldest blocks are dropped above max_samples
+        with self.lock:
+            if self.consumed:
+                return False, 0
+            self.blocks.append(adc_values)
+            self.samples += adc_values.shape[-1]
+            self.lost_packets += lost_packets
+            dropped = 0
+            while self.samples > max_samples and len(self.blocks) > 1:
+                self.samples -= self.blocks.pop(0).shape[-1]
+                dropped += 1
+            # Dropped blocks are presented as lost packets
+            self.lost_packets += dropped
+            return True, dropped
+
+    def take(self):
+        # Returns (adc_values, lost_packets)
+        with self.lock:
+            self.consumed = True
+            adc_values = self.blocks[0] if len(self.blocks) == 1 else np.concatenate(self.blocks, axis=-1)
+            self.blocks = []
+            return adc_values, self.lost_packets
+
+
+#
+# Coalesces batches under consumer backpressure
+#
+# At most `max_in_flight` batches are posted and not yet taken; beyond that,
+# new blocks are merged into the newest in-flight batch.
+# ----------------------------------------------------------------------------------
+class BatchCoalescer():
+    def __init__(self, post, max_in_flight: int = 1, max_samples: int = 4000):
+        self.post           = post
+        self.max_in_flight  = max_in_flight
+        self.max_samples    = max_samples
+        self.in_flight      = collections.deque()
+
+        # Counters
+        self.posted         = 0
+        self.coalesced      = 0
+        self.dropped        = 0
+
+    def release(self):
+        while self.in_flight and self.in_flight[0].consumed:
+            self.in_flight.popleft()
+
+    def push(self, adc_values: np.ndarray, lost_packets: int, stamps: dict = None):
+        self.release()
+        if len(self.in_flight) >= self.max_in_flight:
+            merged, dropped = self.in_flight[-1].merge(adc_values, lost_packets, self.max_samples)
+            if merged:
+                self.coalesced += 1
+                self.dropped += dropped
+                return
+            self.release()
+        batch = Batch(adc_values, lost_packets, dict(stamps) if stamps else None)
+        self.in_flight.append(batch)
+        self.posted += 1
+        self.post(batch)
+
+    def stats(self):
+        return {
+            'posted'    : self.posted,
+            'coalesced' : self.coalesced,
+            'dropped'   : self.dropped,
+            'in_flight' : len(self.in_flight)
+        }
@@ -0,0 +1,1601 @@
+import os
+import sys
+import time
+import json
+import wave
+import queue
+import argparse
+import platform
+import struct
+import shutil
+import tempfile
+import socket
+import select
+import threading
+import numpy as np
+from bits import *
+from crc import *
+from ad7606 import *
+from framing import *
+from ingest import *
+from batches import *
+from ringbuffer import *
+from filters import *
+from spectrum import *
+from display import *
+from recorder import *
+from exchange import *
+from dispatchers import ExchangeProtocol, TCPDispatcher, UDPDispatcher
+from devices import *
+from outbound import *
+from generator import *
+from replay import *
+from dataset import *
+from features import *
+from inference import *
+from acquisition import Acquisition
+from metrics import *
+
+
+#
+# Helpers
+# ----------------------------------------------------------------------------------
+def measure(func, *args, repeat: int = 5, min_time: float = 0.2):
+    # Returns the best calls/s over `repeat` runs of at least `min_time` seconds
+    best = 0
+    for _ in range(repeat):
+        calls = 0
+        since = time.perf_counter()
+        while True:
+            func(*args)
+            calls += 1
+            elapsed = time.perf_counter() - since
+            if elapsed >= min_time:
+                break
+        best = max(best, calls / elapsed)
+    return best
+
+
+# Results of the run: name -> { value, unit, lower }, see compare()
+RESULTS = {}
+
+
+def record(name: str, value: float, unit: str, lower: bool = False):
+    RESULTS[name] = { 'value' : float(value), 'unit' : unit, 'lower' : lower }
+
+
+def report_value(name: str, value: float, unit: str, lower: bool = False):
+    record(name, value, unit, lower)
+    print("{:<32s} {:>12.1f} {:s}".format(name, value, unit))
+
+
+def report(name: str, before: float, after: float, unit: str, lower: bool = False):
+    # lower: the unit is a cost (time, CPU), the speedup is before / after
+    record(name, after, unit, lower)
+    speedup = before / after if lower else after / before
+    print("{:<32s} before: {:>12.1f} {:s}  after: {:>12.1f} {:s}  x{:.1f}".format(name, before, unit, after, unit, speedup))
+
+
+def make_batch_packet(counter: int, adc_values: np.ndarray):
+    # adc_values: (samples, channels) int16
+    packet = bytearray(BATCH_PACKET_SIZE)
+    packet[0:2] = BATCH_PACKET_SYNC
+    packet[2] = counter & 0xFF
+    packet[BATCH_PACKET_VALUES:BATCH_PACKET_CRC16] = adc_values.astype('<i2').tobytes()
+    packet[BATCH_PACKET_CRC16:BATCH_PACKET_SIZE] = crc16(packet).to_bytes(2, 'little')
+    return bytes(packet)
+
+
+def random_batch_packet(rng, counter: int = 0):
+    values = rng.integers(-32768, 32768, size=(BATCH_PACKET_SAMPLES, BATCH_PACKET_CHANNELS))
+    return make_batch_packet(counter, values)
+
+
+#
+# Reference implementations (bit-walking, as shipped before vectorization)
+# ----------------------------------------------------------------------------------
+def legacy_ad7606_decode(packet: bytes, adc_range, adc_vref, channels: int, samples: int):
+    bits = LegacyBits(packet)
+    adc_values = [[0] * samples ] * channels
+    for idx_channel, channel in enumerate(adc_values):
+        values = []
+        for idx_sample, sample in enumerate(channel):
+            value = int(bits.get_sbits((3 + idx_sample * 10) * 8 + idx_channel * 16, 16))
+            value = (adc_range * value) / ((32768 * adc_vref) / 2.5)
+            values.append(value)
+        adc_values[idx_channel] = values
+    return adc_values
+
+
+def legacy_crc16_update(data: bytearray, length):
+    crc = 0xFFFF
+    for i in range(0, length):
+        crc ^= data[i]
+        for j in range(0,8):
+            if (crc & 1) > 0:
+                crc = (crc >> 1) ^ 0xA001
+            else:
+                crc = (crc >> 1)
+    return crc & 0xFFFF
+
+
+def legacy_crc8_update(data: bytearray, length):
+    crc = 0xFF
+    for i in range(0, length):
+        crc ^= data[i]
+        for j in range(0,8):
+            if(crc & 0x80) > 0:
+                crc = (crc << 1) ^ 0x31
+            else:
+                crc = (crc << 1)
+    return crc & 0xFF
+
+
+class LegacyBits():
+    # Bit by bit fields, a bytes copy of the buffer per written bit
+    def __init__(self, data):
+        self.data = data
+        self.barray = bytearray(self.data)
+
+    def get_ubits(self, offset, size):
+        result = 0
+        for i in range(size):
+            result |= self.get_bit(offset + i) << i
+        return result
+
+    def get_sbits(self, offset, size):
+        result = self.get_ubits(offset, size)
+        if result & ( 1 << (size - 1)) != 0:
+            result = result - (1 << size)
+        return result
+
+    def get_bit(self, offset: int):
+        return 1 if self.barray[offset // 8] & (1 << (offset % 8)) > 0 else 0
+
+    def set_bits(self, offset, value, size):
+        for i in range(size):
+            self.set_bit(offset + i, 1 if value & (1 << i) > 0 else 0)
+
+    def set_bit(self, offset: int, value):
+        if value == 0:
+            self.barray[offset // 8] &= ~(1 << (offset % 8))
+        else:
+            self.barray[offset // 8] |= (1 << (offset % 8))
+        self.data = bytes(self.barray)
+
+    def get_bytes(self):
+        return self.data
+
+    def get_barray(self):
+        return self.barray
+
+    @staticmethod
+    def crc16_update(data: bytearray, length):
+        return legacy_crc16_update(data, length)
+
+    @staticmethod
+    def crc8_update(data: bytearray, length):
+        return legacy_crc8_update(data, length)
+
+
+def legacy_resync(buffer: bytearray, packet_size: int = BATCH_PACKET_SIZE):
+    # UDPDispatcher.run loop before BatchScanner: returns the accepted packets
+    packets = []
+    prev_crc16 = 0
+    while len(buffer) >= packet_size:
+        for offset in range(0, len(buffer)):
+            found_packet = False
+            if buffer[ offset ] == 0xAA and buffer[ offset + 1 ] == 0xBB:
+                packet_crc16 = int.from_bytes(buffer[offset + packet_size - 2:offset + packet_size], 'little')
+                raw_packet = buffer[offset:offset + packet_size]
+                raw_packet[packet_size - 2] = raw_packet[packet_size - 1] = 0
+                if packet_crc16 == crc16(raw_packet) and prev_crc16 != packet_crc16:
+                    prev_crc16 = packet_crc16
+                    found_packet = True
+                    packets.append(bytes(buffer[offset:offset + packet_size]))
+            if found_packet:
+                del buffer[offset:offset + packet_size]
+                break
+            buffer = buffer[1:]
+            break
+    return packets
+
+
+def lossy_batch_stream(rng, count: int):
+    # Batch packets with garbage, truncated and duplicated packets in between
+    chunks = []
+    for counter in range(count):
+        packet = random_batch_packet(rng, counter)
+        event = rng.random()
+        if event < 0.05:
+            chunks.append(rng.integers(0, 256, size=int(rng.integers(1, 1500)), dtype=np.uint8).tobytes())
+        elif event < 0.10:
+            chunks.append(packet[:int(rng.integers(1, BATCH_PACKET_SIZE))])
+        elif event < 0.15:
+            chunks.append(packet)
+        chunks.append(packet)
+    return b''.join(chunks)
+
+
+LEGACY_IIR_POLYNOMS = {
+    60: {
+        'b' : [3.114845493979219e-11, 3.114845493979219e-10, 1.4016804722906485e-09, 3.737814592775063e-09, 6.54117553735636e-09, 7.849410644827632e-09, 6.54117553735636e-09, 3.737814592775063e-09, 1.4016804722906485e-09, 3.114845493979219e-10, 3.114845493979219e-11],
+        'a' : [-8.795170347593166, 34.87498281940547, -82.09589684558945, 127.04294385875566, -135.03554288399235, 99.83507904006187, -50.6918184336482, 16.916722791727487, -3.3503054451435945, 0.29900547791228027]
+    },
+    100: {
+        'b' : [3.6196950776160545e-09, 3.619695077616054e-08, 1.6288627849272245e-07, 4.3436340931392657e-07, 7.601359662993715e-07, 9.121631595592458e-07, 7.601359662993715e-07, 4.3436340931392657e-07, 1.6288627849272245e-07, 3.619695077616054e-08, 3.6196950776160545e-09],
+        'a' : [-7.99229666239913, 28.912194584176586, -62.315352281547256, 88.58766325126386, -86.76706804056137, 59.28095157409917, -27.89029917249328, 8.64568213752646, -1.594239767690205, 0.13276808419292055]
+    },
+    160: {
+        'b' : [2.44156580e-07, 2.44156580e-06, 1.09870461e-05, 2.92987896e-05, 5.12728818e-05, 6.15274581e-05, 5.12728818e-05, 2.92987896e-05, 1.09870461e-05, 2.44156580e-06, 2.44156580e-07],
+        'a' : [-6.78896079e+00, 2.11186057e+01, -3.95466389e+01, 4.92807282e+01, -4.26412048e+01, 2.59155697e+01, -1.09133701e+01, 3.04505316e+00, -5.07983531e-01, 3.84514437e-02]
+    },
+    200: {
+        'b' : [1.683581407232949e-06, 1.683581407232949e-05, 7.57611633254827e-05, 0.00020202976886795387, 0.0003535520955189193, 0.00042426251462270313, 0.0003535520955189193, 0.00020202976886795387, 7.57611633254827e-05, 1.683581407232949e-05, 1.683581407232949e-06],
+        'a' : [-5.987589629816667, 16.672193323002656, -28.25878790020053, 32.15975648769458, -25.601749597053352, 14.405687426207791, -5.647074344132482, 1.473727936973908, -0.23091934586202878, 0.01647963054713087]
+    }
+}
+
+
+def legacy_iir_filter(fcut: int, f_data: list, iir_buffer: list, points: list):
+    # ADCChannel.iir_filter: direct form, one output per sample
+    iir_buffer += points
+    for i in range(len(iir_buffer)):
+        x = iir_buffer[i:i + 11]
+        if len(x) < 11:
+            iir_buffer = iir_buffer[i:]
+            break
+        y = f_data[-10:]
+        y.reverse()
+        bcc = sum((b * x[idx]) for idx, b in enumerate(LEGACY_IIR_POLYNOMS[fcut]['b']))
+        acc = sum((a * y[idx]) for idx, a in enumerate(LEGACY_IIR_POLYNOMS[fcut]['a']))
+        f_data = f_data[1:]
+        f_data.append(bcc - acc)
+    return f_data, iir_buffer
+
+
+def legacy_pack_packet(data: list, event_code: int = 0, event_iter: int = 0, event_bits: int = 8, data_size: int = 0):
+    # ExchangeProtocol.pack_packet: bit by bit, values at a 2 byte stride
+    packet_size = ExchangeProtocol.PACKET_HEADER_SIZE + data_size
+    packet = LegacyBits(bytes(bytearray(packet_size)))
+    packet.set_bits(0 * 8, 0xAA, 8)
+    packet.set_bits(1 * 8, 0xCC, 8)
+    packet.set_bits(2 * 8, event_code, 8)
+    packet.set_bits(3 * 8, event_iter, 8)
+    packet.set_bits(4 * 8, event_bits, 8)
+    packet.set_bits(5 * 8, data_size, 16)
+    packet.set_bits(7 * 8, 0, 16)
+    for idx, sample in enumerate(data):
+        packet.set_bits(int((9 + idx * 2) * 8), sample, event_bits)
+    packet.set_bits(7 * 8, LegacyBits.crc16_update(packet.get_barray(), packet_size), 16)
+    return bytes(packet.get_barray())
+
+
+def legacy_exchange_recv(data: bytearray):
+    # ExchangeProtocol.recv: returns (result, data_size, values), zeroes the crc16 field of data
+    if data[0] != 0xAA or data[1] != 0xCC:
+        return ExchangeProtocol.RECV_RESULT_NOT_FOUND, 0, None
+    packet = LegacyBits(bytes(data))
+    data_size = packet.get_ubits(5 * 8, 16)
+    if (len(data) - ExchangeProtocol.PACKET_HEADER_SIZE) < data_size:
+        return ExchangeProtocol.RECV_RESULT_AWAITING_DATA, data_size, None
+    packet_size = ExchangeProtocol.PACKET_HEADER_SIZE + data_size
+    crc16 = packet.get_ubits(7 * 8, 16)
+    data[7] = data[8] = 0
+    if crc16 != legacy_crc16_update(data, packet_size):
+        return ExchangeProtocol.RECV_RESULT_BAD_CRC16, data_size, None
+    event_bits = packet.get_ubits(4 * 8, 8)
+    values = [int(packet.get_ubits((ExchangeProtocol.PACKET_HEADER_SIZE + idx) * 8, event_bits)) for idx in range(0, data_size, int(event_bits / 8))]
+    return ExchangeProtocol.RECV_RESULT_FOUND, data_size, (packet.get_ubits(2 * 8, 8), packet.get_ubits(3 * 8, 8), event_bits, values)
+
+
+def legacy_exchange_on_recv(buffer: bytearray, data: bytes, packets: list):
+    # TCPDispatcher.on_recv: a copy of the rest of the buffer per attempt, one byte dropped per resync
+    buffer += bytearray(data)
+    while len(buffer) >= ExchangeProtocol.PACKET_HEADER_SIZE:
+        result, data_size, packet = legacy_exchange_recv(buffer[0:])
+        if result == ExchangeProtocol.RECV_RESULT_FOUND or result == ExchangeProtocol.RECV_RESULT_BAD_CRC16:
+            del buffer[0:ExchangeProtocol.PACKET_HEADER_SIZE + data_size]
+            if packet:
+                packets.append(packet)
+        elif result == ExchangeProtocol.RECV_RESULT_AWAITING_DATA:
+            break
+        else:
+            buffer = buffer[1:]
+    return buffer
+
+
+def exchange_stream(rng, count: int, net_values: int = 2000):
+    # Pings, game events and large Net results, with garbage and corrupted frames
+    codec = ExchangeCodec()
+    stream = bytearray()
+    for idx in range(count):
+        kind = idx % 4
+        if kind == 0:
+            packet = codec.pack_packet([], ExchangeProtocol.DISPATCHER_EVENT_PING)
+        elif kind == 1:
+            packet = codec.pack_packet([int(rng.integers(0, 2 ** 32))], ExchangeProtocol.GAME_EVENT_UP, 0, 32, 4)
+        else:
+            packet = codec.pack_packet(rng.integers(0, 2 ** 16, net_values).tolist(), 1, idx % 256, 16, 2 * net_values)
+        packet = bytearray(packet)
+        if idx % 10 == 7:
+            packet[-1] ^= 0xFF
+        stream += packet
+        if idx % 10 == 3:
+            stream += bytes(rng.integers(0, 256, 100, dtype=np.uint8))
+    return bytes(stream)
+
+
+def legacy_tcp_loop(sock, outbound: queue.Queue, stop: threading.Event):
+    # ExchangeProtocol.loop + TCPDispatcher.run: ping every pass, select 10 ms, sleep 10 ms
+    codec = ExchangeCodec()
+    while not stop.is_set():
+        sock.sendall(codec.pack_packet([], ExchangeProtocol.DISPATCHER_EVENT_PING))
+        r_list, w_list, e_list = select.select([sock], [sock], [sock], 0.01)
+        if r_list:
+            sock.recv(65536)
+        if w_list:
+            try:
+                event_code, event_iter, event_bits, data_size, data = outbound.get_nowait()
+            except queue.Empty:
+                pass
+            else:
+                sock.send(codec.pack_packet(data, event_code, event_iter, event_bits, data_size))
+        time.sleep(0.01)
+
+
+class ExchangeCodec(ExchangeProtocol):
+    # ExchangeProtocol without sockets, keeps the last received packet
+    def __init__(self):
+        self.send_buffer = bytearray(ExchangeProtocol.PACKET_HEADER_SIZE)
+        self.packet = None
+
+    def on_packet(self, data: list, event_code: int = 0, event_iter: int = 0, event_bits: int = 8):
+        self.packet = (event_code, event_iter, event_bits, data)
+
+
+def legacy_record(wave_file, adc_values: np.ndarray, adc_range: float = 5, adc_power: int = 2 ** 16):
+    # Recorder.run: per channel list conversion, one writeframes per sample
+    channels = [[int(((volt - adc_range / 2) * adc_power) / adc_range) for volt in data] for data in adc_values]
+    for samples in zip(*channels):
+        for sample in samples:
+            wave_file.writeframes(struct.pack('<h', sample))
+
+
+#
+# Benchmarks
+# ----------------------------------------------------------------------------------
+def bench_bits():
+    rng = np.random.default_rng(0)
+    packet = random_batch_packet(rng)
+    bits, legacy = Bits(packet), LegacyBits(packet)
+    assert bits.get_ubits(16, 8) == packet[2]
+    assert bits.get_sbits(24, 16) == int.from_bytes(packet[3:5], 'little', signed=True)
+    assert Bits.crc16_update(bytearray(packet), BATCH_PACKET_CRC16) == crc16(packet[:BATCH_PACKET_CRC16])
+
+    # Random fields, aligned and not, read and written as the bit by bit implementation does
+    for _ in range(2000):
+        size = int(rng.integers(1, 65))
+        offset = int(rng.integers(0, BATCH_PACKET_SIZE * 8 - size))
+        value = int(rng.integers(-2 ** 63, 2 ** 63))
+        assert bits.get_ubits(offset, size) == legacy.get_ubits(offset, size)
+        assert bits.get_sbits(offset, size) == legacy.get_sbits(offset, size)
+        assert bits.get_bit(offset) == legacy.get_bit(offset)
+        bits.set_bits(offset, value, size)
+        legacy.set_bits(offset, value, size)
+        assert bits.get_bytes() == legacy.data
+        bits.set_bit(offset, value & 1)
+        legacy.set_bit(offset, value & 1)
+    assert bits.get_bytes() == legacy.data and bits.get_barray() == legacy.barray
+
+    # Bulk fields against get_ubits/get_sbits
+    for offset, count, width in ((24, 400, 16), (24, 50, 64), (8, 3, 8), (27, 100, 16), (5, 60, 12), (3, 10, 64), (0, 200, 1)):
+        for signed in (False, True):
+            get = bits.get_sbits if signed else bits.get_ubits
+            values = bits.get_array(offset, count, width, signed)
+            assert values.tolist() == [get(offset + idx * width, width) for idx in range(count)], (offset, width, signed)
+    values = np.frombuffer(packet, dtype='<i2', count=BATCH_PACKET_SAMPLES * BATCH_PACKET_CHANNELS, offset=BATCH_PACKET_VALUES)
+    assert np.array_equal(Bits(packet).get_array(BATCH_PACKET_VALUES * 8, len(values), 16, True), values)
+
+    report("bits get_ubits (16 bit)", measure(legacy.get_ubits, 27, 16), measure(bits.get_ubits, 27, 16), "calls/s")
+    report("bits get_sbits (16 bit, byte)", measure(legacy.get_sbits, 24, 16), measure(bits.get_sbits, 24, 16), "calls/s")
+    report("bits set_bits (16 bit)", measure(legacy.set_bits, 27, 0x1234, 16), measure(bits.set_bits, 27, 0x1234, 16), "calls/s")
+
+    def legacy_values():
+        return [legacy.get_sbits(BATCH_PACKET_VALUES * 8 + idx * 16, 16) for idx in range(BATCH_PACKET_SAMPLES * BATCH_PACKET_CHANNELS)]
+
+    report("bits 400 values (get_array)", measure(legacy_values, repeat=3),
+           measure(bits.get_array, BATCH_PACKET_VALUES * 8, BATCH_PACKET_SAMPLES * BATCH_PACKET_CHANNELS, 16, True), "packets/s")
+    def legacy_unaligned():
+        return [legacy.get_sbits(BATCH_PACKET_VALUES * 8 + 3 + idx * 12, 12) for idx in range(BATCH_PACKET_SAMPLES * BATCH_PACKET_CHANNELS)]
+
+    assert bits.get_array(BATCH_PACKET_VALUES * 8 + 3, BATCH_PACKET_SAMPLES * BATCH_PACKET_CHANNELS, 12, True).tolist() == legacy_unaligned()
+    report("bits 400 x 12 bit unaligned", measure(legacy_unaligned, repeat=3),
+           measure(bits.get_array, BATCH_PACKET_VALUES * 8 + 3, BATCH_PACKET_SAMPLES * BATCH_PACKET_CHANNELS, 12, True), "packets/s")
+    report_value("bits crc16_update", measure(Bits.crc16_update, bytearray(packet), BATCH_PACKET_CRC16), "packets/s")
+
+
+def bench_ad7606_decode():
+    rng = np.random.default_rng(0)
+    adc_range, adc_vref = 5, 2.5
+    packet = random_batch_packet(rng)
+    scale = ad7606_scale(adc_range, adc_vref)
+
+    expected = np.array(legacy_ad7606_decode(packet, adc_range, adc_vref, BATCH_PACKET_CHANNELS, BATCH_PACKET_SAMPLES))
+    assert np.allclose(ad7606_decode(packet, scale), expected, rtol=1e-6, atol=1e-6)
+
+    before = measure(legacy_ad7606_decode, packet, adc_range, adc_vref, BATCH_PACKET_CHANNELS, BATCH_PACKET_SAMPLES)
+    after = measure(ad7606_decode, packet, scale)
+    report("ad7606_decode", before, after, "packets/s")
+
+
+def bench_crc():
+    # Bit-exactness is checked by tests/test_crc.py
+    rng = np.random.default_rng(0)
+    packet = random_batch_packet(rng)
+    before = measure(legacy_crc16_update, packet, BATCH_PACKET_SIZE)
+    after = measure(crc16, packet)
+    report("crc16", before, after, "packets/s")
+    before = measure(legacy_crc8_update, packet, BATCH_PACKET_SIZE)
+    after = measure(crc8, packet)
+    report("crc8", before, after, "packets/s")
+
+    # Bulk validation of every sync-aligned window of a receive buffer
+    packets = [random_batch_packet(rng, counter) for counter in range(64)]
+    buffer = b''.join(packets)
+    buffer = buffer[:100] + bytes(BATCH_PACKET_SIZE) + buffer[100:]
+    offsets = np.array([idx for idx in range(len(buffer) - BATCH_PACKET_SIZE + 1) if buffer[idx:idx + 2] == BATCH_PACKET_SYNC])
+
+    def one_by_one():
+        for offset in offsets:
+            packet = buffer[offset:offset + BATCH_PACKET_SIZE]
+            crc16_zeros(2, crc16(packet[:BATCH_PACKET_CRC16])) == int.from_bytes(packet[BATCH_PACKET_CRC16:], 'little')
+
+    before = measure(one_by_one) * len(offsets)
+    after = measure(crc16_check_many, buffer, offsets, BATCH_PACKET_SIZE) * len(offsets)
+    report("crc16_check_many", before, after, "packets/s")
+
+
+def bench_resync():
+    rng = np.random.default_rng(0)
+    stream = lossy_batch_stream(rng, 100)
+    datagrams = [stream[idx:idx + 1024] for idx in range(0, len(stream), 1024)]
+
+    def scan():
+        scanner = BatchScanner()
+        packets = []
+        for data in datagrams:
+            scanner.feed(data)
+            packets += [bytes(packet) for packet in scanner.frames()]
+        return packets, scanner
+
+    packets, scanner = scan()
+    assert packets == legacy_resync(bytearray(stream))
+    print("{:<32s} {}".format("resync counters", scanner.stats()))
+
+    before = measure(legacy_resync, bytearray(stream), repeat=1) * len(packets)
+    after = measure(scan) * len(packets)
+    report("resync", before, after, "packets/s")
+
+
+def loopback_ingest(receive, count: int = 20000, burst: int = 32):
+    # Sends `count` batch packets over loopback UDP in bursts, returns (packets/s, decoded, syscalls)
+    rng = np.random.default_rng(0)
+    packets = [random_batch_packet(rng, counter) for counter in range(256)]
+    receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+    receiver.bind(('127.0.0.1', 0))
+    address = receiver.getsockname()
+    done = threading.Event()
+
+    def send():
+        sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        for idx in range(0, count, burst):
+            for counter in range(idx, min(idx + burst, count)):
+                sender.sendto(packets[counter % 256], address)
+            time.sleep(0)
+        sender.close()
+        done.set()
+
+    thread = threading.Thread(target=send)
+    since = time.perf_counter()
+    thread.start()
+    decoded, syscalls = receive(receiver, done, count)
+    elapsed = time.perf_counter() - since
+    thread.join()
+    receiver.close()
+    return decoded / elapsed, decoded, syscalls
+
+
+def bench_ingest():
+    scale = ad7606_scale(5, 2.5)
+
+    def legacy_receive(sock, done, count):
+        # select + recv + bytearray concatenation per datagram
+        sock.setblocking(False)
+        scanner = BatchScanner()
+        decoded = syscalls = 0
+        while decoded < count:
+            ready = select.select([sock], [], [], 0.1)
+            syscalls += 1
+            if not ready[0]:
+                if done.is_set():
+                    break
+                continue
+            data = sock.recv(2048)
+            syscalls += 1
+            scanner.feed(bytearray(data))
+            for packet in scanner.frames():
+                ad7606_decode(packet, scale)
+                decoded += 1
+        return decoded, syscalls
+
+    def receive(sock, done, count):
+        receiver = DatagramReceiver(sock)
+        scanner = BatchScanner()
+        decoded = 0
+        while decoded < count:
+            datagrams = receiver.drain()
+            if not datagrams and done.is_set():
+                break
+            for buffer, start, end in datagrams:
+                for packet in scanner.frames_from(buffer, start, end):
+                    ad7606_decode(packet, scale)
+                    decoded += 1
+        return decoded, receiver.syscalls
+
+    before, before_decoded, before_syscalls = loopback_ingest(legacy_receive)
+    after, after_decoded, after_syscalls = loopback_ingest(receive)
+    report("ingest", before, after, "packets/s")
+    print("{:<32s} before: {:>12.2f} {:s}  after: {:>12.2f} {:s}".format(
+        "ingest syscalls", before_syscalls / max(before_decoded, 1), "/packet", after_syscalls / max(after_decoded, 1), "/packet"))
+
+
+def bench_coalesce():
+    # Producer at 25 packets/s x 100 (4 s of data), consumer stalls for the first half
+    scale = ad7606_scale(5, 2.5)
+    block = ad7606_decode(random_batch_packet(np.random.default_rng(0)), scale)
+    posted = []
+    coalescer = BatchCoalescer(posted.append, max_in_flight=1, max_samples=4000)
+    samples = lost_packets = 0
+    for idx in range(100):
+        coalescer.push(block, 0)
+        if idx >= 50:
+            for batch in posted:
+                adc_values, lost = batch.take()
+                samples += adc_values.shape[-1]
+                lost_packets += lost
+            posted.clear()
+    assert samples + lost_packets * BATCH_PACKET_SAMPLES == 100 * BATCH_PACKET_SAMPLES
+    print("{:<32s} {}".format("coalesce counters", coalescer.stats()))
+
+    def deliver():
+        coalescer.push(block, 0)
+        for batch in posted:
+            batch.take()
+        posted.clear()
+
+    after = measure(deliver)
+    report_value("coalesce deliver", after, "packets/s")
+
+
+def bench_ringbuffer():
+    # ADCChannel raw trace storage at the default 2 s window: update_data + lost packets
+    window = 2000 * 2
+    points = np.random.default_rng(0).random(BATCH_PACKET_SAMPLES).astype(np.float32)
+    points_list = points.tolist()
+
+    def legacy_update():
+        y_data = [0] * window
+        for idx in range(25):
+            y_data = y_data[len(points_list):]
+            y_data = y_data + points_list
+            if idx % 5 == 0:
+                y_data = y_data[len(points_list):]
+                y_data = y_data + [2.5] * len(points_list)
+        return y_data
+
+    def update():
+        y_data = RingBuffer(window)
+        for idx in range(25):
+            y_data.append(points)
+            if idx % 5 == 0:
+                y_data.fill(2.5, len(points))
+        return y_data
+
+    assert np.allclose(update().view(), legacy_update())
+    before = measure(legacy_update) * 30
+    after = measure(update) * 30
+    report("ringbuffer", before, after, "packets/s")
+
+
+def bench_iir():
+    rng = np.random.default_rng(0)
+    channels, window = BATCH_PACKET_CHANNELS, 2000 * 2
+
+    # Design, response and accuracy against the cascade and the legacy direct form: tests/test_filters.py
+    engine = ButterworthFilter(10, 60, 2000, channels)
+    points = rng.standard_normal((channels, BATCH_PACKET_SAMPLES)).astype(np.float32)
+    state = [([0] * window, []) for _ in range(channels)]
+
+    def legacy_packet():
+        for channel in range(channels):
+            state[channel] = legacy_iir_filter(60, state[channel][0], state[channel][1], points[channel].tolist())
+
+    before = measure(legacy_packet, repeat=3)
+    after = measure(engine.process, points)
+    report("iir (5 channels)", before, after, "packets/s")
+
+
+def bench_spectrum():
+    rng = np.random.default_rng(0)
+    sampling_rate, window, hop = 2000, 2000 * 2, 400
+    block = rng.standard_normal((BATCH_PACKET_CHANNELS, BATCH_PACKET_SAMPLES)).astype(np.float32)
+    y_data = RingBuffer(window)
+    y_data.append(rng.standard_normal(window).astype(np.float32))
+
+    def legacy_update():
+        # Spectrum.update_data of one channel per plot refresh (every hop samples)
+        data = list((i for i in y_data.view()))
+        x = np.fft.rfftfreq(window, 1 / sampling_rate)
+        y = np.fft.rfft(data)[1:]
+        power = 1/window * np.abs(y)
+
+    engine = SpectrumEngine(sampling_rate, window, BATCH_PACKET_CHANNELS, hop)
+    tracker = SlidingDFT([10, 20, 50], sampling_rate, window, BATCH_PACKET_CHANNELS)
+
+    def update():
+        # All channels, fed every packet, a frame every hop samples
+        for _ in range(hop // BATCH_PACKET_SAMPLES):
+            engine.update(block)
+
+    before = measure(legacy_update)
+    after = measure(update) * BATCH_PACKET_CHANNELS
+    report("spectrum refresh (x channels)", before, after, "frames/s")
+    after = measure(engine.band_powers)
+    report_value("welch band powers (5 ch)", after, "calls/s")
+    after = measure(tracker.update, block)
+    report_value("sliding dft 3 bins (5 ch)", after, "packets/s")
+
+
+def bench_display():
+    rng = np.random.default_rng(0)
+    sampling_rate, channels, pixels = 2000, BATCH_PACKET_CHANNELS, 1000
+    trace = RingBuffer(sampling_rate * 60, channels)
+    trace.append(rng.standard_normal((channels, trace.capacity)).astype(np.float32))
+    decimator = MinMaxDecimator(sampling_rate)
+
+    # Every column is the min/max of its samples, spikes of one sample survive
+    trace.append(np.zeros((channels, 37), dtype=np.float32) + np.float32(10))
+    x = decimator.plan(len(trace), pixels, trace.written - len(trace))
+    y = decimator.apply(trace.view())
+    assert len(x) == y.shape[-1] <= 2 * pixels + 2 and np.all(np.diff(x) >= 0)
+    view = trace.view()
+    for column, first in enumerate(np.round(x[::2] * sampling_rate).astype(int)):
+        last = len(trace) if 2 * column + 2 >= len(x) else int(round(x[2 * column + 2] * sampling_rate))
+        assert np.array_equal(y[:, 2 * column], view[:, first:last].min(axis=-1))
+        assert np.array_equal(y[:, 2 * column + 1], view[:, first:last].max(axis=-1))
+    assert y.max() == 10 and np.array_equal(y.min(axis=-1), view.min(axis=-1))
+
+    # Columns keep their samples while the trace scrolls (no peak flicker)
+    before = dict(zip(np.round(x * sampling_rate).astype(int)[::2] + trace.written - len(trace), y[:, ::2].T.tolist()))
+    trace.append(rng.standard_normal((channels, 5 * BATCH_PACKET_SAMPLES)).astype(np.float32))
+    x = decimator.plan(len(trace), pixels, trace.written - len(trace))
+    y = decimator.apply(trace.view())
+    after = dict(zip(np.round(x * sampling_rate).astype(int)[::2] + trace.written - len(trace), y[:, ::2].T.tolist()))
+    common = sorted(set(before) & set(after))[:-2]
+    assert len(common) > pixels * 0.9 and all(before[index] == after[index] for index in common)
+
+    # Short traces are drawn as is
+    x = decimator.plan(1000, pixels)
+    assert decimator.raw and np.array_equal(decimator.apply(view[:, :1000]), view[:, :1000])
+
+    # 60 s x 5 channels to 1000 px: points per frame and the cost of a frame
+    out = None
+    def frame():
+        nonlocal out
+        x = decimator.plan(len(trace), pixels, trace.written - len(trace))
+        out = decimator.apply(trace.view(), out)
+
+    frame()
+    report("display points (60 s, 5 ch)", trace.capacity * channels, out.size, "points", lower=True)
+    report_value("display decimate 60 s x 5 ch", measure(frame), "frames/s")
+
+    # Frame budget: a 50 ms frame at 30 fps takes every third tick, the rest of the thread is left to the batches
+    budget = FrameBudget(30, share=0.5)
+    now = 0.0
+    for tick in range(300):
+        now = tick / 30
+        if budget.due(now):
+            budget.done(now, now + 0.05)
+    stats = budget.stats(now)
+    assert 9.5 <= stats['fps'] <= 10.5 and budget.skipped == 2 * budget.frames
+    print("{:<32s} {}".format("frame budget, 50 ms frames", stats))
+
+    # History: 20 min of 2 x 5 channels (raw, filtered) in random blocks, views checked against the samples
+    history = MipmapHistory(sampling_rate, 4000, (2, channels))
+    memory = sum(ring.data.nbytes for ring in history.lows + history.highs[1:])
+    samples = rng.standard_normal((2, channels, sampling_rate * 60 * 20)).astype(np.float32)
+    position = 0
+    while position < samples.shape[-1]:
+        size = int(rng.integers(1, 2000))
+        history.append(samples[..., position:position + size])
+        position += size
+    assert sum(ring.data.nbytes for ring in history.lows + history.highs[1:]) == memory
+    end = samples.shape[-1]
+    for start, pixels in ((end - 4000, 435), (end - 60 * sampling_rate, 800), (end // 3, 1000), (0, 600)):
+        x, y = history.view(start, end, pixels)
+        index = np.round(x * sampling_rate).astype(int)
+        assert len(x) <= 2 * pixels + 4 and index[0] >= start and index[-1] <= end
+        for column in range(0, len(x) - 2, 2):
+            first, last = index[column], index[column + 2]
+            assert np.array_equal(y[..., column], samples[..., first:last].min(axis=-1))
+            assert np.array_equal(y[..., column + 1], samples[..., first:last].max(axis=-1))
+
+    block = samples[..., :BATCH_PACKET_SAMPLES]
+    report_value("history append (2 x 5 ch)", measure(history.append, block), "packets/s")
+    for seconds in (2, 60, 1200):
+        report_value("history view {:d} s to 1000 px".format(seconds), measure(history.view, end - seconds * sampling_rate, end, 1000), "frames/s")
+    print("{:<32s} {:>12.1f} MB, {:.1f} h at level {:d}".format("history memory", memory / 2 ** 20,
+          len(history.lows[0]) * history.factor ** (len(history.lows) - 1) / sampling_rate / 3600, len(history.lows) - 1))
+
+
+def bench_recorder():
+    # Event windows of sampling_time (2 s, 5 channels) in volts, unipolar 0..5 V
+    config = {
+        'adc'       : { 'sampling_rate' : 2000, 'resolution' : 16, 'channels' : 5, 'range' : 5 },
+        'dataset'   : { 'dest_path' : tempfile.mkdtemp() }
+    }
+    rng = np.random.default_rng(0)
+    windows = [rng.uniform(0, 5, (BATCH_PACKET_CHANNELS, 4000)) for _ in range(32)]
+
+    def legacy_session(count: int):
+        with wave.open(os.path.join(config['dataset']['dest_path'], 'legacy.wav'), 'w') as wave_file:
+            wave_file.setnchannels(5)
+            wave_file.setsampwidth(2)
+            wave_file.setframerate(2000)
+            for adc_values in windows[:count]:
+                legacy_record(wave_file, adc_values)
+
+    def session(recorder_format: str, count: int = len(windows)):
+        # Backlog of `count` windows at stop, returns (recorder, drain time)
+        config['dataset']['recorder_format'] = recorder_format
+        recorder = Recorder(config, queue = queue.Queue())
+        for idx, adc_values in enumerate(windows[:count]):
+            recorder.queue.put((ExchangeProtocol.GAME_EVENT_UP, idx % 32, adc_values))
+        start = time.perf_counter()
+        recorder.start_session()
+        recorder.stop()
+        recorder.join()
+        return recorder, time.perf_counter() - start
+
+    # Same file content as the legacy per-sample writer
+    recorder, _ = session('wav', 2)
+    legacy_session(2)
+    with wave.open(recorder.path + '.wav') as new, wave.open(os.path.join(config['dataset']['dest_path'], 'legacy.wav')) as old:
+        assert new.readframes(8000) == old.readframes(8000)
+    recorder, _ = session('chunks')
+    frames, index = load_chunks(recorder.path)
+    assert index['samples'] == 32 * 4000 and len(index['events']) == 32
+    assert np.array_equal(frames[index['events'][5]['offset']:][:4000], recorder.convert(windows[5]))
+
+    start = time.perf_counter()
+    legacy_session(2)
+    before = 2 / (time.perf_counter() - start)
+    for recorder_format in ('wav', 'chunks'):
+        _, drain = session(recorder_format)
+        report("recorder " + recorder_format, before, len(windows) / drain, "windows/s")
+        print("{:<32s} before: {:>12.3f} s  after: {:>12.3f} s".format("drain 32 windows " + recorder_format, len(windows) / before, drain))
+    shutil.rmtree(config['dataset']['dest_path'])
+
+
+def bench_exchange():
+    rng = np.random.default_rng(0)
+    codec = ExchangeCodec()
+
+    # Round trip and bit-exactness are checked by tests/test_exchange.py
+
+    # Net abonent result: 64 x 16 bit values
+    data = rng.integers(0, 2 ** 16, 64).tolist()
+    packet = legacy_pack_packet(data, event_code = 1, event_bits = 16, data_size = 128)
+    before = measure(legacy_pack_packet, data, 1, 0, 16, 128)
+    after = measure(codec.pack_packet, data, 1, 0, 16, 128)
+    report("exchange pack (64 x 16 bit)", before, after, "frames/s")
+    before = measure(lambda: legacy_exchange_recv(bytearray(packet)))
+    after = measure(codec.recv, packet)
+    report("exchange recv (64 x 16 bit)", before, after, "frames/s")
+    before = measure(legacy_pack_packet, [], ExchangeProtocol.DISPATCHER_EVENT_PING)
+    after = measure(codec.pack_packet, [], ExchangeProtocol.DISPATCHER_EVENT_PING)
+    report("exchange pack (ping)", before, after, "frames/s")
+
+
+def bench_exchange_reader():
+    rng = np.random.default_rng(0)
+    stream = exchange_stream(rng, 200)
+    chunks = [stream[idx:idx + 4096] for idx in range(0, len(stream), 4096)]
+
+    def legacy_reassembly():
+        buffer, packets = bytearray(), []
+        for chunk in chunks:
+            buffer = legacy_exchange_on_recv(buffer, chunk, packets)
+        return packets
+
+    def reassembly():
+        reader, packets = ExchangeFrameReader(), []
+        for chunk in chunks:
+            reader.feed(chunk)
+            packets.extend(reader.frames())
+        return reader, packets
+
+    expected = legacy_reassembly()
+    reader, packets = reassembly()
+    assert len(packets) == len(expected) == 180
+    for packet, legacy in zip(packets, expected):
+        assert packet[:3] == legacy[:3] and packet[3].tolist() == legacy[3]
+    # One byte at a time
+    single, packets = ExchangeFrameReader(), []
+    for idx in range(len(stream)):
+        single.feed(stream[idx:idx + 1])
+        packets.extend(single.frames())
+    assert [packet[:3] for packet in packets] == [legacy[:3] for legacy in expected]
+    print("{:<32s} {}".format("exchange reader counters", reader.stats()))
+
+    before = measure(legacy_reassembly, repeat=1) * len(expected)
+    after = measure(reassembly) * len(expected)
+    report("exchange reassembly (4 KiB)", before, after, "frames/s")
+
+
+def exchange_latency(post, received: queue.Queue, count: int = 100):
+    # Microseconds from posting a game event to its receipt by the peer: (p50, p99)
+    latency = []
+    for idx in range(count):
+        start = time.perf_counter()
+        post((ExchangeProtocol.GAME_EVENT_UP, 0, 32, 4, [idx]))
+        latency.append(received.get(timeout=5) - start)
+        time.sleep(0.003)
+    return np.percentile(latency, 50) * 1e6, np.percentile(latency, 99) * 1e6
+
+
+def idle_cpu(period: float = 1.0):
+    # Process CPU time per second while the main thread sleeps, %
+    start = time.process_time()
+    time.sleep(period)
+    return (time.process_time() - start) / period * 100
+
+
+def bench_tcp_dispatcher():
+    received = queue.Queue()
+
+    def on_packet(data, event_code: int = 0, event_iter: int = 0, event_bits: int = 8):
+        if event_code == ExchangeProtocol.GAME_EVENT_UP:
+            received.put(time.perf_counter())
+
+    # Legacy loops on both ends of a loopback connection
+    listener = socket.create_server(('127.0.0.1', 0))
+    client = socket.create_connection(listener.getsockname())
+    server, _ = listener.accept()
+    stop, outbound = threading.Event(), queue.Queue()
+    threads = [threading.Thread(target=legacy_tcp_loop, args=(server, outbound, stop))]
+
+    def legacy_peer():
+        reader = ExchangeFrameReader()
+        codec = ExchangeCodec()
+        while not stop.is_set():
+            client.sendall(codec.pack_packet([], ExchangeProtocol.DISPATCHER_EVENT_PING))
+            r_list, w_list, e_list = select.select([client], [client], [client], 0.01)
+            if r_list:
+                reader.feed(client.recv(65536))
+                for event_code, event_iter, event_bits, data in reader.frames():
+                    on_packet(data, event_code, event_iter, event_bits)
+            time.sleep(0.01)
+
+    threads.append(threading.Thread(target=legacy_peer))
+    for thread in threads:
+        thread.start()
+    time.sleep(0.2)
+    legacy_cpu = idle_cpu()
+    legacy_p50, legacy_p99 = exchange_latency(outbound.put, received)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    for sock in (client, server, listener):
+        sock.close()
+
+    # Dispatchers: server (dashboard) and client (game)
+    with socket.create_server(('127.0.0.1', 0)) as probe:
+        port = probe.getsockname()[1]
+    config = { 'network' : { 'tcp_dispatcher' : {
+        'server_ip' : '127.0.0.1', 'server_port' : port, 'heartbeat' : 1.0, 'peer_timeout' : 5.0,
+        'abonents' : [{ 'name' : 'Game', 'ip' : '127.0.0.1', 'port' : 0 }] } } }
+    server = TCPDispatcher(config, abonents = ['127.0.0.1'], on_packet = lambda **packet: None, type = ExchangeProtocol.TCP_SERVER)
+    client = TCPDispatcher(config, abonents = ['127.0.0.1'], on_packet = on_packet, bind_ip = '127.0.0.1', bind_port = 0)
+    server.start()
+    time.sleep(0.1)
+    client.start()
+    time.sleep(0.2)
+    cpu = idle_cpu()
+    p50, p99 = exchange_latency(lambda payload: server.post('127.0.0.1', payload), received)
+    client.stop()
+    server.stop()
+    client.join()
+    server.join()
+
+    report("tcp event latency p50", legacy_p50, p50, "us", lower=True)
+    report("tcp event latency p99", legacy_p99, p99, "us", lower=True)
+    report("tcp idle cpu (2 peers)", legacy_cpu, cpu, "%", lower=True)
+
+
+def tcp_pair(sndbuf: int = 0):
+    # Connected loopback sockets (sender non-blocking, receiver), optionally a small send buffer
+    with socket.create_server(('127.0.0.1', 0)) as listener:
+        sender = socket.create_connection(listener.getsockname())
+        receiver, _ = listener.accept()
+    if sndbuf:
+        sender.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, sndbuf)
+        receiver.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, sndbuf)
+    sender.setblocking(False)
+    return sender, receiver
+
+
+def event_frame(idx: int, values: int = 1):
+    frame = bytearray(ExchangeProtocol.PACKET_HEADER_SIZE + 4 * values)
+    exchange_pack_into(frame, [idx] * values, ExchangeProtocol.GAME_EVENT_UP, 0, 32, 4 * values)
+    return bytes(frame)
+
+
+def bench_outbound():
+    rng = np.random.default_rng(0)
+
+    # Slow consumer, drop_oldest: frames arrive whole and in order, memory stays bounded
+    sender, receiver = tcp_pair(sndbuf=4096)
+    receiver.setblocking(False)
+    outbound = OutboundQueue(high_water=64 * 1024, policy='drop_oldest')
+    reader, received, max_pending = ExchangeFrameReader(), [], 0
+    for idx in range(3000):
+        outbound.push(event_frame(idx, int(rng.integers(1, 200))))
+        max_pending = max(max_pending, outbound.pending_bytes)
+        if idx % 4 == 0:
+            outbound.flush(sender)
+        if idx % 16 == 0:
+            try:
+                reader.feed(receiver.recv(2048))
+            except BlockingIOError:
+                pass
+    while not outbound.flush(sender) or reader.bytes < outbound.bytes_sent:
+        try:
+            reader.feed(receiver.recv(65536))
+        except BlockingIOError:
+            time.sleep(0.001)
+    received = [int(data[0]) for event_code, event_iter, event_bits, data in reader.frames()]
+    stats = outbound.stats()
+    assert reader.bad_crc16 == reader.resyncs == 0 and received == sorted(received)
+    assert len(received) + stats['dropped_frames'] == 3000 and stats['partial_writes'] > 0
+    assert max_pending <= outbound.high_water
+    print("{:<32s} {}".format("outbound drop_oldest counters", stats))
+    sender.close()
+    receiver.close()
+
+    # Block policy: a producer thread faster than the socket, nothing is dropped
+    sender, receiver = tcp_pair(sndbuf=4096)
+    outbound = OutboundQueue(high_water=16 * 1024, policy='block', block_timeout=5.0)
+    producer = threading.Thread(target=lambda: [outbound.push(event_frame(idx, 100)) for idx in range(1000)])
+    producer.start()
+    reader = ExchangeFrameReader()
+    receiver.settimeout(0.01)
+    while producer.is_alive() or outbound.pending() or reader.bytes < outbound.bytes_sent:
+        outbound.flush(sender)
+        try:
+            reader.feed(receiver.recv(65536))
+        except socket.timeout:
+            pass
+    producer.join()
+    assert [int(data[0]) for event_code, event_iter, event_bits, data in reader.frames()] == list(range(1000))
+    assert outbound.dropped_frames == 0 and outbound.blocked > 0
+    sender.close()
+    receiver.close()
+
+    # Burst of classifier outputs: one send() per frame vs one sendmsg() per burst
+    sender, receiver = tcp_pair()
+    burst = [event_frame(idx, 8) for idx in range(64)]
+    outbound = OutboundQueue()
+    drain = threading.Thread(target=lambda: [None for _ in iter(lambda: receiver.recv(1 << 20), b'')])
+    drain.start()
+
+    def legacy_send():
+        for frame in burst:
+            while True:
+                try:
+                    sender.send(frame)
+                    break
+                except BlockingIOError:
+                    time.sleep(0)
+
+    def send():
+        for frame in burst:
+            outbound.push(frame)
+        while not outbound.flush(sender):
+            time.sleep(0)
+
+    before = measure(legacy_send) * len(burst)
+    syscalls = outbound.syscalls
+    after = measure(send) * len(burst)
+    report("outbound burst (64 frames)", before, after, "frames/s")
+    print("{:<32s} before: {:>12.2f} /frame  after: {:>12.2f} /frame".format("outbound syscalls", 1.0, (outbound.syscalls - syscalls) / outbound.frames_sent))
+    sender.close()
+    drain.join()
+    receiver.close()
+
+
+def free_udp_ports(count: int):
+    sockets = [socket.socket(socket.AF_INET, socket.SOCK_DGRAM) for _ in range(count)]
+    for sock in sockets:
+        sock.bind(('127.0.0.1', 0))
+    ports = [sock.getsockname()[1] for sock in sockets]
+    for sock in sockets:
+        sock.close()
+    return ports
+
+
+def devices_config(devices: list):
+    return {
+        'adc'       : { 'range' : 5, 'vref' : 2.5, 'channels' : BATCH_PACKET_CHANNELS },
+        'dataset'   : { 'batch_samples' : BATCH_PACKET_SAMPLES },
+        'network'   : { 'udp_dispatcher' : { 'ip' : '127.0.0.1', 'port' : 0, 'devices' : devices } }
+    }
+
+
+def bench_devices():
+    rng = np.random.default_rng(0)
+    packets = [random_batch_packet(rng, counter) for counter in range(256)]
+
+    # Two headsets sharing a port (told apart by the sender ip) and one on its own port:
+    # per-device loss accounting and duplicate suppression
+    shared, own = free_udp_ports(2)
+    config = devices_config([
+        { 'name' : 'A', 'port' : shared, 'source' : '127.0.0.2' },
+        { 'name' : 'B', 'port' : shared, 'source' : '127.0.0.3' },
+        { 'name' : 'C', 'port' : own }])
+    ingest = UDPIngest(config, udp_devices(config))
+    senders = {}
+    for ip in ('127.0.0.2', '127.0.0.3', '127.0.0.4'):
+        senders[ip] = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        senders[ip].bind((ip, 0))
+    streams = {
+        ('127.0.0.2', shared)   : [5, 6, 7, 9, 10],           # 1 lost
+        ('127.0.0.3', shared)   : [250, 251, 251, 255, 0, 1],  # 1 duplicate, 3 lost, wraps
+        ('127.0.0.4', own)      : [0, 1, 2, 3],
+    }
+    for step in range(6):
+        for (ip, port), counters in streams.items():
+            if step < len(counters):
+                senders[ip].sendto(packets[counters[step]], ('127.0.0.1', port))
+    senders['127.0.0.4'].sendto(packets[0], ('127.0.0.1', shared))           # unknown sender
+    batches = []
+    while len(batches) < 14:
+        batches += ingest.poll()
+    for sock in senders.values():
+        sock.close()
+    stats = ingest.stats()
+    assert [device for device, adc_values, lost, stamps in batches].count(0) == 5 and stats['devices'][0]['lost_packets'] == 1
+    assert [device for device, adc_values, lost, stamps in batches].count(1) == 5 and stats['devices'][1]['lost_packets'] == 3
+    assert stats['devices'][1]['duplicates'] == 1 and stats['devices'][2]['lost_packets'] == 0
+    decoded = [adc_values for device, adc_values, lost, stamps in batches if device == 2]
+    expected = [ad7606_decode(packets[counter], ingest.adc_scale, BATCH_PACKET_CHANNELS, BATCH_PACKET_SAMPLES) for counter in streams[('127.0.0.4', own)]]
+    assert len(decoded) == 4 and all(np.array_equal(a, b) for a, b in zip(decoded, expected))
+    ingest.poll()
+    assert ingest.unknown == 1
+    ingest.close()
+
+    # 8 headsets on their own ports, as fast as the loopback sender goes
+    ports = free_udp_ports(8)
+    devices = [{ 'name' : 'Headset ' + str(idx), 'port' : port } for idx, port in enumerate(ports)]
+    needed = len(ports) * 2000 / BATCH_PACKET_SAMPLES
+
+    def load(period: float = 1.0):
+        received = [0] * len(ports)
+        dispatcher = UDPDispatcher(devices_config(devices), on_batch = lambda adc_values, lost_packets, device: received.__setitem__(device, received[device] + 1))
+        dispatcher.start()
+        time.sleep(0.1)
+        sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sent, since = 0, time.perf_counter()
+        while time.perf_counter() - since < period:
+            for port in ports:
+                sender.sendto(packets[sent % 256], ('127.0.0.1', port))
+            sent += 1
+            if sent % 16 == 0:
+                time.sleep(0)
+        time.sleep(0.2)
+        elapsed, delivered = time.perf_counter() - since, sum(received)
+        dispatcher.stop()
+        dispatcher.join()
+        sender.close()
+        assert min(received) > 0
+        return delivered / elapsed, sent * len(ports) / elapsed
+
+    print("{:<32s} {:>12.1f} packets/s".format("needed for 8 headsets", needed))
+    rate, offered = load()
+    record("devices x8", rate, "packets/s")
+    print("{:<32s} {:>12.1f} packets/s  offered: {:>10.1f}  headsets: {:>6.0f}".format(
+        "devices x8", rate, offered, rate / (needed / len(ports))))
+
+
+def bench_generator():
+    config = {
+        'adc'       : { 'sampling_rate' : 2000, 'range' : 5, 'vref' : 2.5, 'channels' : BATCH_PACKET_CHANNELS },
+        'dataset'   : { 'batch_samples' : BATCH_PACKET_SAMPLES },
+        'network'   : { 'udp_dispatcher' : { 'ip' : '127.0.0.1', 'port' : 0 } }
+    }
+    scale = ad7606_scale(5, 2.5)
+
+    # Bit-exact with the firmware: bitwise CRC16 over the packet with a zeroed CRC field
+    generator = BatchGenerator(config, marker=BATCH_PACKET_CHANNELS - 1)
+    for sequence in range(300):
+        packet = generator.packet()
+        frames = np.frombuffer(packet, dtype='<i2', count=BATCH_PACKET_CHANNELS * BATCH_PACKET_SAMPLES, offset=BATCH_PACKET_VALUES).reshape(BATCH_PACKET_SAMPLES, BATCH_PACKET_CHANNELS)
+        zeroed = bytearray(packet)
+        zeroed[BATCH_PACKET_CRC16:] = b'\x00\x00'
+        assert len(packet) == BATCH_PACKET_SIZE and packet[:2] == BATCH_PACKET_SYNC and packet[2] == sequence & 0xFF
+        assert int.from_bytes(packet[BATCH_PACKET_CRC16:], 'little') == legacy_crc16_update(zeroed, BATCH_PACKET_SIZE)
+        assert bytes(packet) == make_batch_packet(sequence, frames)
+        assert batch_marker(ad7606_decode(packet, scale), scale, BATCH_PACKET_CHANNELS - 1) == sequence
+    report_value("generator", measure(generator.packet), "packets/s")
+
+    # Loss accounting is exact: late (reordered) packets are dropped as already counted lost
+    result = load_test(config, 3000, 0, Impairments(loss=0.02, duplicate=0.02, corrupt=0.02, seed=1))
+    assert result['lost_actual'] == result['lost_reported'] and result['impairments']['dropped'] > 0
+    print("{:<32s} actual: {:>6d}  reported: {:>6d}  {}".format("loss accounting", result['lost_actual'], result['lost_reported'], result['impairments']))
+    result = load_test(config, 3000, 0, Impairments(reorder=0.01, seed=1))
+    assert result['lost_actual'] == result['lost_reported'] and result['impairments']['reordered'] > 0
+    print("{:<32s} actual: {:>6d}  reported: {:>6d}  {}".format("loss accounting, reorder", result['lost_actual'], result['lost_reported'], result['impairments']))
+
+    for speed in (1, 40, 0):
+        result = load_test(config, 5000 if not speed else 100 * speed, speed)
+        assert result['delivered'] == result['packets']
+        record("dispatcher x" + str(speed) if speed else "dispatcher, unpaced", result['packets_per_second'], "packets/s")
+        print("{:<32s} {:>12.1f} packets/s  latency p50: {:>8.1f} us  p99: {:>8.1f} us".format(
+            "dispatcher x" + str(speed) if speed else "dispatcher, unpaced", result['packets_per_second'], result['latency_p50_us'], result['latency_p99_us']))
+
+
+def bench_replay():
+    config = {
+        'adc'       : { 'sampling_rate' : 2000, 'resolution' : 16, 'channels' : BATCH_PACKET_CHANNELS, 'range' : 5 },
+        'dataset'   : { 'batch_samples' : BATCH_PACKET_SAMPLES, 'dest_path' : tempfile.mkdtemp() }
+    }
+    rng = np.random.default_rng(0)
+    windows = [rng.uniform(0, 5, (BATCH_PACKET_CHANNELS, 4000)) for _ in range(32)]
+    events = [ExchangeProtocol.GAME_EVENT_UP, ExchangeProtocol.GAME_EVENT_DOWN, ExchangeProtocol.GAME_EVENT_LEFT, ExchangeProtocol.GAME_EVENT_RIGHT]
+    lsb = config['adc']['range'] / 2 ** config['adc']['resolution']
+
+    def record(recorder_format: str):
+        config['dataset']['recorder_format'] = recorder_format
+        recorder = Recorder(config, queue = queue.Queue())
+        for idx, adc_values in enumerate(windows):
+            recorder.queue.put((events[idx % 4], idx, adc_values))
+        recorder.start_session()
+        recorder.stop()
+        recorder.join()
+        return recorder.path
+
+    def replay(session, speed: float = 0, events: tuple = None, on_batch = None, seek: int = None):
+        blocks = []
+        replay = SessionReplay(config, session, on_batch = on_batch or (lambda adc_values, lost_packets, device: blocks.append(adc_values)), speed = speed, events = events)
+        if seek is not None:
+            replay.seek(seek)
+        replay.start()
+        replay.join()
+        return replay, blocks
+
+    for recorder_format in ('wav', 'chunks'):
+        session = Session(record(recorder_format))
+        assert len(session) == 32 * 4000 and session.channels == BATCH_PACKET_CHANNELS and isinstance(session.frames, np.memmap)
+        assert [event['event'] for event in session.events] == list('UDLR' * 8)
+        assert [session.event_offset(idx) for idx in range(32)] == [idx * 4000 for idx in range(32)]
+
+        # Values as recorded, in volts: Recorder.convert() truncates to 1 LSB
+        _, blocks = replay(session)
+        assert len(blocks) == 32 * 4000 // BATCH_PACKET_SAMPLES
+        error = np.abs(np.concatenate(blocks, axis=1) - np.concatenate(windows, axis=1)).max()
+        assert error <= lsb * 1.001
+        _, blocks = replay(session, events = (10, 12))
+        assert len(blocks) == 2 * 4000 // BATCH_PACKET_SAMPLES and np.abs(blocks[0] - windows[10][:, :BATCH_PACKET_SAMPLES]).max() <= lsb * 1.001
+        _, blocks = replay(session, seek = 30)
+        assert len(blocks) == 2 * 4000 // BATCH_PACKET_SAMPLES
+
+        replayer, blocks = replay(session, speed = 20, events = (0, 1))
+        print("{:<32s} {:>12.1f} x real time (speed 20)".format("replay paced " + recorder_format, replayer.stats()['realtime_factor']))
+        replayer, blocks = replay(session)
+        report_value("replay " + recorder_format, replayer.stats()['realtime_factor'], "x real time")
+
+    # Filter + spectrum behind the replay, as in the dashboard
+    iir = ButterworthFilter(10, 60, 2000, BATCH_PACKET_CHANNELS)
+    spectrum = SpectrumEngine(2000, 4000, BATCH_PACKET_CHANNELS, 200)
+
+    def pipeline(adc_values, lost_packets, device):
+        spectrum.update(iir.process(adc_values))
+
+    replayer, _ = replay(session, on_batch = pipeline)
+    report_value("replay + iir + spectrum", replayer.stats()['realtime_factor'], "x real time")
+    shutil.rmtree(config['dataset']['dest_path'])
+
+
+def bench_dataset():
+    # 16 sessions of 32 event windows (2 s, 5 channels), WAV and chunks
+    rng = np.random.default_rng(0)
+    sessions_path, dataset_path = tempfile.mkdtemp(), tempfile.mkdtemp()
+    letters = 'UDLRX'
+    sessions = []
+    for idx in range(16):
+        path = os.path.join(sessions_path, str(1700000000 + idx))
+        writer = WaveWriter(path, 5, 2000, 2) if idx % 2 else ChunkWriter(path, 5, 2000, 2, 5)
+        windows = [rng.integers(-32768, 32768, size=(4000, 5)).astype('<i2') for _ in range(32)]
+        for iter, window in enumerate(windows):
+            writer.write(letters[(idx + iter) % len(letters)], iter, window)
+        writer.close()
+        sessions.append((path, windows))
+
+    def legacy_build(paths: list):
+        # Re-read and re-slice every WAV session in memory
+        epochs, labels = [], []
+        for path in paths:
+            with wave.open(path + '.wav') as wave_file:
+                frames = np.frombuffer(wave_file.readframes(wave_file.getnframes()), dtype='<i2').reshape(-1, wave_file.getnchannels())
+            with open(path + '.txt') as event_file:
+                events = event_file.read()
+            window = len(frames) // len(events)
+            for idx, event in enumerate(events):
+                epochs.append(frames[idx * window:(idx + 1) * window].T)
+                labels.append(DATASET_LABELS.find(event))
+        return np.stack(epochs), np.array(labels)
+
+    # Content and labels, incremental append (the sessions were just written: no settle time)
+    builder = DatasetBuilder(dataset_path, settle=0)
+    assert builder.append_dir(sessions_path) == 16 * 32
+    dataset = EpochDataset(dataset_path)
+    assert dataset.epochs.shape == (16 * 32, 5, 4000) and len(dataset.sessions) == 16
+    for idx, (path, windows) in enumerate(sessions):
+        epochs, labels = dataset.session(os.path.basename(path))
+        assert np.array_equal(epochs[7], windows[7].T)
+        assert list(labels[:5]) == [DATASET_LABELS.find(letters[(idx + iter) % 5]) % 256 for iter in range(5)]
+    assert DatasetBuilder(dataset_path, settle=0).append_dir(sessions_path) == 0
+    volts = DatasetBuilder(tempfile.mkdtemp(), 'float32', settle=0)
+    volts.append(sessions[1][0])
+    assert np.allclose(EpochDataset(volts.path).epochs[3], dataset.volts(dataset.session(os.path.basename(sessions[1][0]))[0][3]))
+    shutil.rmtree(volts.path)
+
+    # An interrupted append is cut off
+    with open(os.path.join(dataset_path, 'epochs.bin'), 'ab') as epochs_file:
+        epochs_file.write(b'\x00' * 1000)
+    path = os.path.join(sessions_path, '1800000000')
+    writer = ChunkWriter(path, 5, 2000, 2, 5)
+    writer.write('U', 0, sessions[0][1][0])
+    writer.close()
+    builder = DatasetBuilder(dataset_path, settle=0)
+    since = time.perf_counter()
+    assert builder.append(path) == 1
+    append = time.perf_counter() - since
+    dataset = EpochDataset(dataset_path)
+    assert np.array_equal(dataset.epochs[-1], sessions[0][1][0].T) and dataset.labels[-1] == 0
+
+    wav_paths = [path for path, windows in sessions if os.path.exists(path + '.wav')]
+    since = time.perf_counter()
+    legacy_epochs, legacy_labels = legacy_build(wav_paths)
+    before = time.perf_counter() - since
+    shutil.rmtree(dataset_path)
+    builder = DatasetBuilder(dataset_path, settle=0)
+    since = time.perf_counter()
+    for path in wav_paths:
+        builder.append(path)
+    after = time.perf_counter() - since
+    dataset = EpochDataset(dataset_path)
+    assert np.array_equal(dataset.epochs[:], legacy_epochs) and np.array_equal(dataset.labels.astype(int) % 256, legacy_labels % 256)
+    print("{:<32s} before: {:>12.3f} s  after: {:>12.3f} s".format("build 8 sessions", before, after))
+    print("{:<32s} before: {:>12.3f} s  after: {:>12.3f} s".format("add 1 session (rebuild/append)", before * 9 / 8, append))
+    record("add 1 session", append * 1e3, "ms", lower=True)
+
+    since = time.perf_counter()
+    dataset = EpochDataset(dataset_path)
+    opened = time.perf_counter() - since
+    epochs = 0
+    since = time.perf_counter()
+    for batch, labels in dataset.batches(32, shuffle=True, seed=0):
+        assert np.shares_memory(batch, dataset.epochs)
+        epochs += len(batch)
+    iterate = time.perf_counter() - since
+    assert epochs == len(dataset)
+    print("{:<32s} {:>12.3f} ms  batches: {:>12.1f} epochs/s".format("open dataset", opened * 1e3, epochs / iterate))
+    record("dataset batches", epochs / iterate, "epochs/s")
+    shutil.rmtree(sessions_path)
+    shutil.rmtree(dataset_path)
+
+
+def reference_features(x: np.ndarray, sampling_rate: int, segment: int, hop: int):
+    # Full recompute over the window x (channels, window): Welch segments every hop, moments of x
+    window = np.hanning(segment)
+    freqs = np.fft.rfftfreq(segment, 1 / sampling_rate)
+    scale = np.full(len(freqs), 2 / (sampling_rate * (window ** 2).sum()))
+    scale[0] /= 2
+    scale[-1] /= 2
+    starts = range(0, x.shape[-1] - segment + 1, hop)
+    psd = np.mean([np.abs(np.fft.rfft(x[:, start:start + segment] * window, axis=-1)) ** 2 * scale for start in starts], axis=0)
+    band_powers = np.column_stack([psd[:, (freqs >= low) & (freqs < high)].sum(axis=-1) * (freqs[1] - freqs[0]) for low, high in BANDS.values()])
+    return band_powers, psd, freqs
+
+
+def bench_features():
+    sampling_rate, channels, window, hop, segment = 2000, BATCH_PACKET_CHANNELS, 4000, 200, 2000
+    rng = np.random.default_rng(0)
+    t = np.arange(12 * sampling_rate) / sampling_rate
+    x = rng.normal(0, 0.05, (channels, len(t))) + np.array([[0.5], [0.2], [0.1], [0.3], [0.05]]) * np.sin(2 * np.pi * np.array([[2], [6], [10], [20], [45]]) * t)
+    blocks = [x[:, start:start + BATCH_PACKET_SAMPLES] for start in range(0, x.shape[-1], BATCH_PACKET_SAMPLES)]
+
+    # Incremental frames equal a full recompute of the window
+    extractor = FeatureExtractor(sampling_rate, channels, window, hop, segment)
+    frames = sum(extractor.update(block) for block in blocks)
+    assert frames == x.shape[-1] // hop
+    tail = x[:, -window:]
+    band_powers, psd, freqs = reference_features(tail, sampling_rate, segment, hop)
+    assert np.allclose(extractor.features[:, :len(BANDS)], band_powers, rtol=1e-3)
+    assert np.argmax(extractor.features[:, :len(BANDS)], axis=1).tolist() == [0, 1, 2, 3, 4]
+    assert np.allclose(extractor.feature('variance'), tail.var(axis=-1), rtol=1e-3)
+    d1 = np.diff(x, axis=-1)[:, -window:]
+    d2 = np.diff(x, n=2, axis=-1)[:, -window:]
+    mobility = np.sqrt(d1.var(axis=-1) / tail.var(axis=-1))
+    assert np.allclose(extractor.feature('mobility'), mobility, rtol=1e-3)
+    assert np.allclose(extractor.feature('complexity'), np.sqrt(d2.var(axis=-1) / d1.var(axis=-1)) / mobility, rtol=1e-3)
+    bins = (freqs >= 0.5) & (freqs < 100)
+    p = psd[:, bins] / psd[:, bins].sum(axis=-1, keepdims=True)
+    assert np.allclose(extractor.feature('entropy'), -(p * np.log2(p)).sum(axis=-1) / np.log2(bins.sum()), rtol=1e-3)
+
+    # Per 80-sample batch, 5 channels at 2 kHz: 25 batches/s needed
+    def full():
+        # Everything recomputed from the last window on every hop
+        for block in blocks[:50]:
+            history.append(block)
+            full.pending += block.shape[-1]
+            if full.pending >= hop:
+                full.pending -= hop
+                window_values = history.view()
+                reference_features(window_values, sampling_rate, segment, hop)
+                d1 = np.diff(window_values, axis=-1)
+                np.diff(d1, axis=-1).var(axis=-1), d1.var(axis=-1), window_values.var(axis=-1)
+    history = RingBuffer(window, channels, dtype=np.float64)
+    full.pending = 0
+
+    def incremental():
+        for block in blocks[:50]:
+            extractor.update(block)
+
+    before = measure(full) * 50
+    after = measure(incremental) * 50
+    report("features", before, after, "batches/s")
+    print("{:<32s} {:>12.1f} x real time, {:.2f} % of a core".format("features 5 ch @ 2 kHz", after / 25, 2500 / after))
+
+
+def bench_inference():
+    sampling_rate, channels = 2000, BATCH_PACKET_CHANNELS
+    rng = np.random.default_rng(0)
+    t = np.arange(2 * sampling_rate) / sampling_rate
+
+    # LDA on features: class c has a 10 Hz rhythm on channel c
+    def epoch(label: int):
+        x = rng.normal(0, 0.05, (channels, len(t)))
+        x[label] += 0.2 * np.sin(2 * np.pi * 10 * t + rng.uniform(0, 2 * np.pi))
+        return x
+    labels = rng.integers(0, 4, 200)
+    X = epoch_features(np.array([epoch(label) for label in labels]), sampling_rate, 4000, 200, 2000)
+    model = LinearModel.fit_lda(X[:150], labels[:150])
+    accuracy = np.mean([np.argmax(model.predict(x)) == label for x, label in zip(X[150:], labels[150:])])
+    assert accuracy > 0.9
+    print("{:<32s} {:>12.3f}".format("lda held-out accuracy", accuracy))
+
+    # CNN forward pass against a direct convolution
+    cnn = CNNModel(rng.normal(0, 1, (8, channels, 25)), rng.normal(0, 0.1, 8), rng.normal(0, 1, (4, 8)), rng.normal(0, 0.1, 4), decimate=4)
+    x = rng.normal(0, 1, (channels, 4000)).astype(np.float32)
+    decimated = x[:, ::4]
+    activations = np.array([[max(float((decimated[:, step:step + 25] * cnn.kernels[f]).sum()) + cnn.conv_bias[f], 0) for step in range(decimated.shape[1] - 24)] for f in range(8)])
+    assert np.allclose(cnn.predict(x), softmax(cnn.weights @ activations.mean(axis=-1) + cnn.bias), rtol=1e-3, atol=1e-6)
+    report_value("model predict, lda", 1e6 / measure(model.predict, X[0]), "us", lower=True)
+    report_value("model predict, cnn", 1e6 / measure(cnn.predict, x), "us", lower=True)
+
+    # Live loopback: generator -> UDP -> Acquisition -> features/window -> model -> TCP -> game client
+    path = tempfile.mkdtemp()
+    model.save(os.path.join(path, 'lda.npz'))
+    cnn.save(os.path.join(path, 'cnn.npz'))
+    udp_port, tcp_port = free_udp_ports(2)
+    config = {
+        'adc'       : { 'sampling_rate' : sampling_rate, 'resolution' : 16, 'channels' : channels, 'range' : 5, 'vref' : 2.5 },
+        'dataset'   : { 'sampling_time' : 2, 'batch_samples' : BATCH_PACKET_SAMPLES, 'dest_path' : path, 'iir_order' : 10,
+                        'features' : { 'window' : 2000, 'hop' : 100, 'segment' : 1000 } },
+        'network'   : { 'udp_dispatcher' : { 'ip' : '127.0.0.1', 'port' : udp_port },
+                        'tcp_dispatcher' : { 'server_ip' : '127.0.0.1', 'server_port' : tcp_port, 'abonents' : [{ 'name' : 'Game', 'ip' : '127.0.0.1', 'port' : 0 }] } }
+    }
+    for kind in ('lda', 'cnn'):
+        config['inference'] = { 'model' : os.path.join(path, kind + '.npz'), 'threshold' : 0, 'cooldown' : 0, 'budget' : 20 }
+        acquisition = Acquisition(config)
+        acquisition.start()
+        received = []
+        game = TCPDispatcher(config, abonents = ['127.0.0.1'], on_packet = lambda **packet: received.append(packet['event_code']), bind_ip = '127.0.0.1', bind_port = 0)
+        game.start()
+        time.sleep(0.3)
+        sender = PacketSender(BatchGenerator(config), ('127.0.0.1', udp_port), 150, speed = 4)
+        sender.start()
+        sender.join()
+        time.sleep(0.3)
+        stats = acquisition.inference.stats()
+        game.stop()
+        game.join()
+        acquisition.stop()
+        events = sum(code in INFERENCE_EVENTS for code in received)
+        assert stats['inferences'] > 0 and events == stats['events'] > 0
+        record("inference " + kind + " latency p50", stats['latency_p50_ms'] * 1e3, "us", lower=True)
+        print("{:<32s} p50: {:>8.2f} ms  p99: {:>8.2f} ms  inferences: {:>5d}  events: {:>5d}  dropped: {:>3d}  over budget: {:>3d}".format(
+            "inference " + kind + " x4 real time", stats['latency_p50_ms'], stats['latency_p99_ms'], stats['inferences'], events, stats['dropped'], stats['budget_misses']))
+    shutil.rmtree(path)
+
+
+def bench_metrics():
+    # Histogram percentiles within a bucket (12.5 %) of the exact ones
+    rng = np.random.default_rng(0)
+    values = rng.lognormal(11, 1.5, 100000).astype(np.int64)
+    histogram = Histogram()
+    for value in values.tolist():
+        histogram.observe(value)
+    for percent in (50, 99):
+        exact = np.percentile(values, percent)
+        assert abs(histogram.percentile(percent) - exact) <= exact * 0.125
+    assert histogram.max == values.max() and histogram.count == len(values)
+    report_value("histogram observe", 1e9 / measure(histogram.observe, 123456), "ns", lower=True)
+    stamps = METRICS.begin()
+    report_value("stamp (2 histograms)", 1e9 / measure(METRICS.stamp, stamps, 'bench'), "ns", lower=True)
+
+    # Decode throughput with the registry disabled and enabled
+    config = {
+        'adc'       : { 'sampling_rate' : 2000, 'resolution' : 16, 'channels' : BATCH_PACKET_CHANNELS, 'range' : 5, 'vref' : 2.5 },
+        'dataset'   : { 'sampling_time' : 2, 'batch_samples' : BATCH_PACKET_SAMPLES, 'dest_path' : tempfile.mkdtemp(), 'iir_order' : 10,
+                        'features' : { 'window' : 2000, 'hop' : 100, 'segment' : 1000 } },
+        'network'   : { 'udp_dispatcher' : { 'ip' : '127.0.0.1', 'port' : 0 } }
+    }
+    rates = {}
+    for enabled in (False, True, False, True):
+        METRICS.enabled = enabled
+        rates.setdefault(enabled, []).append(load_test(config, 4000, 0)['packets_per_second'])
+    report("dispatcher metrics on/off", max(rates[False]), max(rates[True]), "packets/s")
+    METRICS.enabled = False
+    METRICS.reset()
+
+    # Every stage of a live loopback: generator -> UDP -> Acquisition (filter, features, inference) -> TCP -> game client
+    udp_port, tcp_port, metrics_port = free_udp_ports(3)
+    path = config['dataset']['dest_path']
+    LinearModel(rng.normal(0, 1, (4, BATCH_PACKET_CHANNELS * len(FEATURES))), np.zeros(4), 0, 1).save(os.path.join(path, 'model.npz'))
+    config['network'] = {
+        'udp_dispatcher' : { 'ip' : '127.0.0.1', 'port' : udp_port },
+        'tcp_dispatcher' : { 'server_ip' : '127.0.0.1', 'server_port' : tcp_port, 'abonents' : [{ 'name' : 'Game', 'ip' : '127.0.0.1', 'port' : 0 }] }
+    }
+    config['inference'] = { 'model' : os.path.join(path, 'model.npz'), 'threshold' : 0, 'cooldown' : 0 }
+    config['metrics'] = { 'enabled' : True, 'ip' : '127.0.0.1', 'port' : metrics_port, 'dump' : os.path.join(path, 'metrics.json'), 'interval' : 0.5 }
+    acquisition = Acquisition(config)
+    acquisition.start()
+    game = TCPDispatcher(config, abonents = ['127.0.0.1'], on_packet = lambda **packet: None, bind_ip = '127.0.0.1', bind_port = 0)
+    game.start()
+    time.sleep(0.3)
+    acquisition.start_recorder()
+    sender = PacketSender(BatchGenerator(config), ('127.0.0.1', udp_port), 100, speed = 4)
+    sender.start()
+    sender.join()
+    acquisition.on_packet(data = [0], event_code = ExchangeProtocol.GAME_EVENT_UP)
+    time.sleep(0.3)
+    snapshot = metrics_scrape('127.0.0.1', metrics_port)
+    game.stop()
+    game.join()
+    acquisition.stop()
+    METRICS.enabled = False
+    with open(os.path.join(path, 'metrics.json')) as dump_file:
+        assert json.load(dump_file)['stages']['decode']['count'] >= snapshot['stages']['decode']['count']
+    for stage in ('crc', 'frame', 'decode', 'filter', 'features', 'inference', 'event', 'send', 'record'):
+        assert snapshot['stages'][stage]['count'] > 0, stage
+    assert 'recorder_queue' in snapshot['gauges'] and 'abonent_queues.127.0.0.1' in snapshot['gauges']
+    for name, stage in snapshot['stages'].items():
+        print("{:<32s} p50: {:>9.1f} us  p99: {:>9.1f} us  max: {:>9.1f} us  count: {:>6d}".format(
+            "stage " + name, stage['p50_us'], stage['p99_us'], stage['max_us'], stage['count']))
+    print("{:<32s} {}".format("gauges", snapshot['gauges']))
+    METRICS.reset()
+    shutil.rmtree(path)
+
+
+#
+# Baseline
+#
+# --save writes the results of the run with the machine they were taken on,
+# --compare prints them against a saved baseline and flags results worse by
+# more than --tolerance (exit code 1). Benchmarks run on one thread: rates
+# are per core, except the loopback ones (devices, dispatcher, tcp), which
+# include the kernel and the sender. packets/s are also shown as samples/s.
+# ----------------------------------------------------------------------------------
+def machine():
+    return {
+        'python'    : platform.python_version(),
+        'numpy'     : np.__version__,
+        'machine'   : platform.machine(),
+        'processor' : platform.processor(),
+        'cores'     : os.cpu_count()
+    }
+
+
+def save_baseline(path: str, results: dict):
+    with open(path + '.tmp', 'w') as baseline_file:
+        json.dump({ 'machine' : machine(), 'results' : results }, baseline_file, indent=2)
+    os.replace(path + '.tmp', path)
+
+
+def compare(results: dict, baseline: dict = None, tolerance: float = 0.2):
+    # Returns the names of the regressed results
+    regressions = []
+    if baseline and baseline['machine'] != machine():
+        print("baseline taken on", baseline['machine'])
+    for name, current in results.items():
+        samples = "{:>12.0f} samples/s".format(current['value'] * BATCH_PACKET_SAMPLES) if current['unit'] == 'packets/s' else ""
+        previous = (baseline or {}).get('results', {}).get(name)
+        if not previous or previous['unit'] != current['unit'] or not previous['value'] or not current['value']:
+            print("{:<32s} {:>12.1f} {:<12s} {:s}".format(name, current['value'], current['unit'], samples).rstrip())
+            continue
+        ratio = previous['value'] / current['value'] if current['lower'] else current['value'] / previous['value']
+        flag = ""
+        if ratio < 1 - tolerance:
+            flag = "REGRESSION"
+            regressions.append(name)
+        print("{:<32s} {:>12.1f} {:<12s} {:s}  baseline: {:>12.1f}  x{:.2f}  {:s}".format(
+            name, current['value'], current['unit'], samples, previous['value'], ratio, flag).rstrip())
+    return regressions
+
+
+BENCHMARKS = {
+    'bits'            : bench_bits,
+    'ad7606_decode'   : bench_ad7606_decode,
+    'crc'             : bench_crc,
+    'resync'          : bench_resync,
+    'ingest'          : bench_ingest,
+    'coalesce'        : bench_coalesce,
+    'ringbuffer'      : bench_ringbuffer,
+    'iir'             : bench_iir,
+    'spectrum'        : bench_spectrum,
+    'display'         : bench_display,
+    'recorder'        : bench_recorder,
+    'exchange'        : bench_exchange,
+    'exchange_reader' : bench_exchange_reader,
+    'tcp_dispatcher'  : bench_tcp_dispatcher,
+    'outbound'        : bench_outbound,
+    'devices'         : bench_devices,
+    'generator'       : bench_generator,
+    'replay'          : bench_replay,
+    'dataset'         : bench_dataset,
+    'features'        : bench_features,
+    'inference'       : bench_inference,
+    'metrics'         : bench_metrics,
+}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarks of the dashboard hot paths, synthetic data, no GUI')
+    parser.add_argument('names', nargs='*', help='benchmarks to run, all by default: ' + ', '.join(BENCHMARKS))
+    parser.add_argument('--save', help='write the results as a baseline JSON')
+    parser.add_argument('--compare', help='baseline JSON to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='flag results worse than the baseline by more than this fraction')
+    args = parser.parse_args()
+    unknown = [name for name in args.names if name not in BENCHMARKS]
+    if unknown:
+        parser.error('unknown benchmarks: ' + ', '.join(unknown))
+
+    for name in args.names or list(BENCHMARKS):
+        BENCHMARKS[name]()
+
+    print()
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'r') as baseline_file:
+            baseline = json.load(baseline_file)
+    regressions = compare(RESULTS, baseline, args.tolerance)
+    if args.save:
+        save_baseline(args.save, RESULTS)
+    if regressions:
+        print(len(regressions), "regressions:", ", ".join(regressions))
+        sys.exit(1)
@@ -1,42 +1,85 @@
+import numpy as np
+from crc import *
+
+
+#
+# Bit fields of a packet buffer
+#
+# Bit `offset` is bit offset % 8 of byte offset // 8, a field of `size` bits
+# is little-endian (its bit 0 at `offset`). Fields are read and written as
+# the integer of the bytes they cover, shifted and masked, so no bit loops
+# even for unaligned widths; byte aligned fields skip the shift.
+# The buffer is copied once, on construction: writes go to it in place.
+# ----------------------------------------------------------------------------------
 class Bits():
+    __slots__ = ('barray', 'view')
+
     def __init__(self, data):
-        self.data = data
-        self.barray = bytearray(self.data)
+        self.barray = bytearray(data)
+        self.view = memoryview(self.barray)
+
+    @property
+    def data(self):
+        return bytes(self.barray)
+
+    def span(self, offset: int, size: int):
+        # (first byte, end byte, shift) of a field
+        start, end = offset >> 3, (offset + size + 7) >> 3
+        if offset < 0 or size <= 0 or end > len(self.barray):
+            raise IndexError("Bit field out of range: offset {}, size {}".format(offset, size))
+        return start, end, offset & 7
 
     def get_ubits(self, offset, size):
-        result = 0
-        for i in range(size):
-            result |= self.get_bit(offset + i) << i
-        return result
+        start, end, shift = self.span(offset, size)
+        value = int.from_bytes(self.view[start:end], 'little')
+        if not shift and not size & 7:
+            return value
+        return (value >> shift) & ((1 << size) - 1)
 
     def get_sbits(self, offset, size):
-        result = 0
-        for i in range(size):
-            result |= self.get_bit(offset + i) << i
-        if result & ( 1 << (size - 1)) != 0:
+        result = self.get_ubits(offset, size)
+        if result & (1 << (size - 1)) != 0:
             result = result - (1 << size)
         return result
 
     def get_bit(self, offset: int):
-        byte_offset: int = offset // 8
-        bit_offset: int = offset % 8
-        result: int = self.barray[byte_offset] & (1 << bit_offset)
-        return 1 if result > 0 else 0
+        return (self.barray[offset >> 3] >> (offset & 7)) & 1
 
     def set_bits(self, offset, value, size):
-        for i in range(size):
-            new_value = value & (1 << i)
-            new_value = 1 if new_value > 0 else 0
-            self.set_bit(offset + i, new_value)
+        start, end, shift = self.span(offset, size)
+        mask = ((1 << size) - 1) << shift
+        if not shift and not size & 7:
+            current = 0
+        else:
+            current = int.from_bytes(self.view[start:end], 'little') & ~mask
+        self.view[start:end] = (current | ((value << shift) & mask)).to_bytes(end - start, 'little')
 
     def set_bit(self, offset: int, value):
-        byte_offset: int = offset // 8
-        bit_offset: int = offset % 8
         if value == 0:
-            self.barray[byte_offset] &= ~(1 << bit_offset)
+            self.barray[offset >> 3] &= ~(1 << (offset & 7))
         else:
-            self.barray[byte_offset] |= (1 << bit_offset)
-        self.data = bytes(self.barray)
+            self.barray[offset >> 3] |= (1 << (offset & 7))
+
+    def get_array(self, offset: int, count: int, width: int, signed: bool = False):
+        # `count` consecutive `width` bit fields (width <= 64) as a new array:
+        # byte aligned 8/16/32/64 bit fields - int8..int64 / uint8..uint64, others - int64 / uint64
+        if not count:
+            aligned = not offset & 7 and width in (8, 16, 32, 64)
+            return np.zeros(0, dtype=('i' if signed else 'u') + str(width // 8 if aligned else 8))
+        start, end, shift = self.span(offset, count * width)
+        if not shift and width in (8, 16, 32, 64):
+            dtype = np.dtype(('<i' if signed else '<u') + str(width // 8))
+            return np.frombuffer(self.view, dtype=dtype, count=count, offset=start).astype(dtype.newbyteorder('='))
+        assert 0 < width <= 64
+        bits = np.unpackbits(np.frombuffer(self.view[start:end], dtype=np.uint8), bitorder='little')
+        bits = bits[shift:shift + count * width].reshape(count, width).astype(np.uint64)
+        values = (bits << np.arange(width, dtype=np.uint64)).sum(axis=-1, dtype=np.uint64)
+        if not signed:
+            return values
+        values = values.astype(np.int64)
+        if width < 64:
+            values[values >= 1 << (width - 1)] -= 1 << width
+        return values
 
     def get_bytes(self):
         return self.data
@@ -46,24 +89,8 @@ class Bits():
 
     @staticmethod
     def crc16_update(data: bytearray, length):
-        crc = 0xFFFF
-        for i in range(0, length):
-            crc ^= data[i]
-            for j in range(0,8):
-                if (crc & 1) > 0:
-                    crc = (crc >> 1) ^ 0xA001
-                else:
-                    crc = (crc >> 1)
-        return crc & 0xFFFF
+        return crc16(memoryview(data)[:length])
 
     @staticmethod
     def crc8_update(data: bytearray, length):
-        crc = 0xFF
-        for i in range(0, length):
-            crc ^= data[i]
-            for j in range(0,8):
-                if(crc & 0x80) > 0:
-                    crc = (crc << 1) ^ 0x31
-                else:
-                    crc = (crc << 1)
-        return crc & 0xFF
\ No newline at end of file
+        return crc8(memoryview(data)[:length])
@@ -0,0 +1,98 @@
+import numpy as np
+
+
+#
+# CRC16 (poly 0xA001 reflected, init 0xFFFF) - same as crc16() of firmwares/sources/main.c
+# CRC8  (poly 0x31, init 0xFF)
+# ----------------------------------------------------------------------------------
+CRC16_INIT = 0xFFFF
+CRC8_INIT  = 0xFF
+
+
+def _crc16_table():
+    table = []
+    for byte in range(256):
+        crc = byte
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0xA001 if crc & 1 else crc >> 1
+        table.append(crc)
+    return table
+
+
+def _crc8_table():
+    table = []
+    for byte in range(256):
+        crc = byte
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x31) & 0xFF if crc & 0x80 else (crc << 1) & 0xFF
+        table.append(crc)
+    return table
+
+
+CRC16_TABLE     = _crc16_table()
+CRC8_TABLE      = _crc8_table()
+CRC16_TABLE_NP  = np.array(CRC16_TABLE, dtype=np.uint16)
+
+
+def crc16(data, value: int = CRC16_INIT):
+    # data: bytes, bytearray or memoryview; value: CRC of the preceding bytes
+    table = CRC16_TABLE
+    crc = value
+    for byte in data:
+        crc = (crc >> 8) ^ table[(crc ^ byte) & 0xFF]
+    return crc
+
+
+def crc16_zeros(count: int, value: int = CRC16_INIT):
+    # CRC16 continued over `count` zero bytes (zeroed CRC field)
+    table = CRC16_TABLE
+    crc = value
+    for _ in range(count):
+        crc = (crc >> 8) ^ table[crc & 0xFF]
+    return crc
+
+
+def crc8(data, value: int = CRC8_INIT):
+    table = CRC8_TABLE
+    crc = value
+    for byte in data:
+        crc = table[crc ^ byte]
+    return crc
+
+
+def _crc16_positions(length: int):
+    # CRC16 is affine: crc(message) = crc(zeros) ^ xor(contribution of every byte).
+    # tables[idx][byte] - contribution of `byte` at position idx of a `length`-byte message.
+    positions = _crc16_positions_cache.get(length)
+    if positions is None:
+        tables = np.empty((length, 256), dtype=np.uint16)
+        row = CRC16_TABLE_NP.copy()
+        for idx in range(length - 1, -1, -1):
+            tables[idx] = row
+            row = (row >> 8) ^ CRC16_TABLE_NP[row & 0xFF]
+        positions = _crc16_positions_cache[length] = (tables, crc16_zeros(length))
+    return positions
+
+
+_crc16_positions_cache = {}
+
+
+def crc16_many(buffer, offsets, length: int, zeros: int = 0):
+    # Bulk CRC16 of the windows buffer[offset:offset + length] for every offset,
+    # the last `zeros` bytes of each window are taken as zero (CRC field).
+    # Returns uint16 array, one CRC per offset.
+    tables, initial = _crc16_positions(length)
+    raw = np.frombuffer(buffer, dtype=np.uint8)
+    offsets = np.asarray(offsets, dtype=np.intp)
+    positions = np.arange(length - zeros, dtype=np.intp)
+    contributions = tables[positions, raw[offsets[:, None] + positions]]
+    return np.bitwise_xor.reduce(contributions, axis=1, initial=initial).astype(np.uint16)
+
+
+def crc16_check_many(buffer, offsets, length: int):
+    # Validates packets whose CRC16 (little-endian) is stored in the last 2 bytes
+    # and was calculated with that field zeroed. Returns bool array, one per offset.
+    raw = np.frombuffer(buffer, dtype=np.uint8)
+    offsets = np.asarray(offsets, dtype=np.intp)
+    stored = raw[offsets + length - 2].astype(np.uint16) | (raw[offsets + length - 1].astype(np.uint16) << 8)
+    return crc16_many(buffer, offsets, length, zeros=2) == stored
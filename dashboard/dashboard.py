@@ -1,13 +1,15 @@
 import os
 import sys
-import queue
-import json
+import math
 import time
+import collections
 import numpy as np
 import dashboard_window
 from events import *
-from dispatchers import *
-from recorder import *
+from batches import *
+from acquisition import *
+from spectrum import *
+from display import *
 from PyQt5 import QtCore, QtWidgets
 
 
@@ -37,61 +39,91 @@ class DashboardWindow(QtWidgets.QMainWindow, dashboard_window.Ui_DashboardWindow
             widget_ch.set_id(idx_ch)
             widget_ch.set_title(self.adc_channel.itemText(idx_ch))
             widget_ch.updatedData.connect(self.on_adc_channel_data_updated)
-            widget_ch.updatedEvent.connect(self.on_adc_channel_event_updated)
             self.present_signal.currentIndexChanged.connect(widget_ch.on_change_present_signal)
+        self.present_signal.currentIndexChanged.connect(self.on_present_signal_changed)
 
         self.widget_spectrum.set_title(self.adc_channel.currentText())
+        channel_names = [self.adc_channel.itemText(idx) for idx in range(self.adc_channel.count())]
+        self.widget_spectrogram.set_channels(channel_names)
+        self.widget_band_powers.set_channels(channel_names)
         self.game_start_btn.clicked.connect(self.on_start_pressed)
         self.game_disable_btn.clicked.connect(self.on_disable_pressed)
         self.adc_channel.currentTextChanged.connect(self.on_adc_channel_changed)
+        self.iir_cutoff.currentTextChanged.connect(self.on_iir_cutoff_changed)
+
+        # Spectrum of all channels, a new frame every update_delay
+        self.spectrum = SpectrumEngine(
+            sampling_rate   = int(self.config['adc']['sampling_rate']),
+            nfft            = int(self.config['adc']['sampling_rate']) * int(self.config['dataset']['sampling_time']),
+            channels        = int(self.config['adc']['channels']),
+            hop             = int(int(self.config['adc']['sampling_rate']) * int(self.config['dataset']['update_delay']) / 1000))
+        self.spectrum_frames = 0        # new spectrum frames since the last display frame
 
         self.lost_packet_time = int((int(self.config['adc']['sampling_rate']) * int(self.config['dataset']['sampling_time'])) / int(self.config['dataset']['batch_samples']))
         self.lost_packet_iter = 0
+        self.batch_samples = int(self.config['dataset']['batch_samples'])
         self.sample_iter = 0
-        self.recorder = None
-        self.recorder_queue = None
-        self.abonent_queues = {}
-        for abonent in self.config['network']['tcp_dispatcher']['abonents']:
-            abonent_ip = str(abonent['ip'])
-            self.abonent_queues[abonent_ip] = queue.Queue()
-
-        self.udp_dispatcher = UDPDispatcher(self)
-        self.tcp_dispatcher = TCPDispatcher(self, queues = self.abonent_queues, type = ExchangeProtocol.TCP_SERVER)
-        self.tcp_dispatcher.setObjectName('TCPDispatcherThread')
-        self.udp_dispatcher.setObjectName('UDPDispatcherThread')
-        self.tcp_dispatcher.start()
-        self.udp_dispatcher.start()
 
+        # History of raw and filtered values of all channels since start, see MipmapHistory;
+        # the view follows the newest samples unless zoomed or panned back (x axes are linked)
+        history = self.config['dataset'].get('history', {})
+        self.sampling_rate = int(self.config['adc']['sampling_rate'])
+        self.live_samples = self.sampling_rate * int(self.config['dataset']['sampling_time'])
+        self.history = MipmapHistory(self.sampling_rate, self.live_samples, (2, int(self.config['adc']['channels'])),
+                                     int(history.get('levels', 6)), int(history.get('factor', 8)))
+        self.view_span = self.live_samples / self.sampling_rate
+        self.view_follow = True
+        self.view_changed = False
+        self.display_dirty = False      # new samples since the last frame
+        # Game events: (sample index in the history, event code), drawn while the history holds them
+        self.markers = collections.deque()
+        first_ch = next(iter(self.adc_channels.values()))
+        for idx_ch, widget_ch in self.adc_channels.items():
+            if widget_ch is not first_ch:
+                widget_ch.setXLink(first_ch)
+            widget_ch.getViewBox().sigRangeChangedManually.connect(self.on_view_changed)
+
+        # Display clock: all channels are redrawn together at display_fps, whatever the packet rate
+        self.frame_budget = FrameBudget(float(self.config['dataset'].get('display_fps', 30)))
+        self.display_stamps = None
+        self.display_timer = QtCore.QTimer(self)
+        self.display_timer.timeout.connect(self.on_display_frame)
+        self.display_timer.start(int(1000 * self.frame_budget.interval))
+
+        # Acquisition runs on its own threads, the dashboard is a subscriber
+        self.coalescer = BatchCoalescer(
+            post            = lambda batch: QtWidgets.QApplication.postEvent(self, UDPDispatcherEvent(batch)),
+            max_in_flight   = int(self.config['network']['udp_dispatcher'].get('events_in_flight', 1)),
+            max_samples     = int(self.config['adc']['sampling_rate']) * int(self.config['dataset']['sampling_time']))
+        self.acquisition = Acquisition(self.config)
+        self.acquisition.set_cutoff(int(self.iir_cutoff.currentText()))
+        self.acquisition.subscribe(
+            on_batch        = self.on_acquisition_batch,
+            on_packet       = lambda **packet: QtWidgets.QApplication.postEvent(self, TCPDispatcherEvent(**packet)))
+        self.acquisition.start()
+
+
+    def on_acquisition_batch(self, adc_values: np.ndarray, filtered: np.ndarray, lost_packets: int, device: int):
+        # Acquisition thread; the dashboard presents the first device
+        if device == 0:
+            self.coalescer.push(np.stack([adc_values, filtered]), lost_packets, METRICS.current() if METRICS.enabled else None)
 
     #
     # Recorder methods
     # --------------------------------------------------------------
     def start_recorder(self):
-        self.recorder_queue = queue.Queue()
-        self.recorder = Recorder(self, queue=self.recorder_queue)
-        self.recorder.setObjectName('RecorderThread')
-        self.recorder.start_session()
+        self.acquisition.start_recorder(on_progress = lambda queue_size: QtWidgets.QApplication.postEvent(self, RecorderEvent(queue_size)))
 
     def stop_recorder(self):
-        if self.recorder:
-            self.recorder_queue = None
-            self.recorder.stop()
-            self.recorder.wait()
-
-    def record(self, channel_id: int, event_id: int, iter: int, data: list):
-        if self.recorder_queue:
-            self.recorder_queue.put((channel_id, event_id, iter, data))
+        self.acquisition.stop_recorder()
 
 
     #
     # Thread sending
     # --------------------------------------------------------------
     def send_event(self, abonent_name: str, event_code: int, event_iter: int, event_bits: int, data_size: int, data: list ):
-        for abonent in self.config['network']['tcp_dispatcher']['abonents']:
-            if str(abonent['name']).lower() == abonent_name:
-                abonent_ip = str(abonent['ip'])
-                self.abonent_queues[abonent_ip].put((event_code, event_iter, event_bits, data_size, data))
-                return
+        # GUI thread: never waits for a full abonent queue
+        self.acquisition.send_event(abonent_name, event_code, event_iter, event_bits, data_size, data, timeout=0)
 
 
     #
@@ -99,21 +131,32 @@ class DashboardWindow(QtWidgets.QMainWindow, dashboard_window.Ui_DashboardWindow
     # --------------------------------------------------------------
     def customEvent(self, event):
         if event.EVENT_TYPE == UDPDispatcherEvent.EVENT_TYPE:
+            # Coalesced packets since the previous event
+            values, event_lost_packets = event.batch.take()
+            adc_values, filtered = values
+            packets = int(adc_values.shape[-1] / self.batch_samples)
             # Update lost packets
             lost_packets = int(self.lost_packets.text())
             if lost_packets == 0:
                 self.lost_packet_iter = 0
-            lost_packets += event.lost_packets
+            lost_packets += event_lost_packets
             self.lost_packets.setText(str(lost_packets))
-            for idx_ch, widget_ch in self.adc_channels.items():
-                widget_ch.update_lost_packets(event.lost_packets)
+            if event_lost_packets:
+                lost_samples = min(event_lost_packets * self.batch_samples, self.spectrum.nfft)
+                self.spectrum.update(np.full((adc_values.shape[0], lost_samples), float(self.config['adc']['vref']), dtype=np.float32))
+                self.history.fill(float(self.config['adc']['vref']), event_lost_packets * self.batch_samples)
+            self.history.append(values)
             # Update ADC values
-            fcut = int(self.iir_cutoff.currentText())
-            for idx_ch, widget_ch in self.adc_channels.items():
-                widget_ch.update_data(fcut, event.adc_values[idx_ch])
+            self.spectrum_frames += self.spectrum.update(adc_values if self.present_signal.currentIndex() == 0 else filtered)
+            if event.batch.stamps:
+                METRICS.stamp(event.batch.stamps, 'spectrum')
+            self.display_dirty = True
+            if event.batch.stamps:
+                self.display_stamps = event.batch.stamps
             # Reset lost_packets counter
-            self.lost_packet_iter = (self.lost_packet_iter + 1) % self.lost_packet_time
-            if self.lost_packet_iter == 0:
+            self.lost_packet_iter += packets
+            if self.lost_packet_iter >= self.lost_packet_time:
+                self.lost_packet_iter = 0
                 self.lost_packets.setText('0')
 
 
@@ -141,8 +184,8 @@ class DashboardWindow(QtWidgets.QMainWindow, dashboard_window.Ui_DashboardWindow
                event.code == ExchangeProtocol.GAME_EVENT_RIGHT:
                 if event.data[0]:
                     self.game_score.setText(str(event.data[0]))
-                for idx_ch, widget_ch in self.adc_channels.items():
-                    widget_ch.update_event(event.code, self.sample_iter)
+                self.markers.append((self.history.written - 1, event.code))
+                self.display_dirty = True
                 self.sample_iter = (self.sample_iter + 1) % 32
 
         if event.EVENT_TYPE == RecorderEvent.EVENT_TYPE:
@@ -154,15 +197,49 @@ class DashboardWindow(QtWidgets.QMainWindow, dashboard_window.Ui_DashboardWindow
                 self.game_start_btn.setEnabled(True)
                 self.game_start_btn.setText("Stop")
 
+    #
+    # Display
+    # --------------------------------------------------------------
+    def on_display_frame(self):
+        # Display timer: the visible range of all channels from the history, min/max decimated to the plot width
+        now = time.perf_counter()
+        widgets = list(self.adc_channels.values())
+        if not (self.view_changed or self.display_dirty) or not self.frame_budget.due(now):
+            return
+        end = self.history.written
+        if self.view_follow:
+            start = end - int(self.view_span * self.sampling_rate)
+        else:
+            x_min, x_max = widgets[0].viewRange()[0]
+            start, end = int(x_min * self.sampling_rate), int(math.ceil(x_max * self.sampling_rate))
+        x, y = self.history.view(start, end, widgets[0].pixels())
+        first = self.history.first()
+        while self.markers and self.markers[0][0] < first:
+            self.markers.popleft()
+        markers = [(sample / self.sampling_rate, event_code) for sample, event_code in self.markers if start <= sample < end]
+        signal = self.present_signal.currentIndex()
+        for idx_ch, widget_ch in self.adc_channels.items():
+            widget_ch.refresh(x, y[signal, idx_ch], markers)
+        if self.spectrum_frames:
+            # Spectrogram and band powers of all channels, once per new spectrum frame at most
+            self.widget_spectrogram.update_data(self.spectrum.freqs, self.spectrum.spectrogram.view())
+            self.widget_band_powers.update_data(self.spectrum.band_powers())
+            self.spectrum_frames = 0
+        if self.view_follow:
+            widgets[0].setXRange(start / self.sampling_rate, end / self.sampling_rate, padding=0)
+        self.view_changed = self.display_dirty = False
+        if self.display_stamps:
+            METRICS.stamp(self.display_stamps, 'plot')
+            self.display_stamps = None
+        self.frame_budget.done(now, time.perf_counter())
+
+
     #
     # UI Events
     # --------------------------------------------------------------
     def closeEvent(self, event):
-        self.udp_dispatcher.stop()
-        self.tcp_dispatcher.stop()
-        self.udp_dispatcher.wait()
-        self.tcp_dispatcher.wait()
-        self.stop_recorder()
+        self.display_timer.stop()
+        self.acquisition.stop()
         return super().closeEvent(event)
 
     def on_start_pressed(self):
@@ -187,50 +264,34 @@ class DashboardWindow(QtWidgets.QMainWindow, dashboard_window.Ui_DashboardWindow
     def on_disable_pressed(self):
         pass
 
+    def on_view_changed(self, *args):
+        # Zoom or pan by the user: keep the span, follow the newest samples while they are in view
+        x_min, x_max = next(iter(self.adc_channels.values())).viewRange()[0]
+        newest = self.history.written / self.sampling_rate
+        self.view_span = x_max - x_min
+        self.view_follow = x_max >= newest - 0.01 * self.view_span
+        self.view_changed = True
+
+    def on_present_signal_changed(self, value):
+        self.view_changed = True
+
     def on_adc_channel_data_updated(self, channel_id: int, data: object):
         if channel_id == self.adc_channel.currentIndex():
             ch = self.adc_channels.get(channel_id, None)
             if ch:
-                self.widget_spectrum.update_data(list(data))
-
-    def on_adc_channel_event_updated(self, channel_id: int, event_id: int, iter: int, data: object):
-        if self.record_wav.isChecked():
-            self.record(channel_id=channel_id, event_id=event_id, iter=iter, data=list(data))
+                self.widget_spectrum.update_data(self.spectrum.freqs, self.spectrum.spectrum[channel_id])
 
     def on_adc_channel_changed(self, value):
         self.widget_spectrum.set_title(str(value))
 
+    def on_iir_cutoff_changed(self, value):
+        self.acquisition.set_cutoff(int(value))
 
-if __name__ == '__main__':
-    with open('config.json', 'r') as config:
-        config = json.loads(config.read())
-
-
-    assert config['adc']['sampling_rate']
-    assert config['adc']['resolution']
-    assert config['adc']['channels']
-    assert config['adc']['range']
-    assert config['adc']['vref']
-
-    assert config['dataset']['sampling_time']
-    assert config['dataset']['update_delay']
-    assert config['dataset']['batch_delay']
-    assert config['dataset']['batch_samples']
-    assert config['dataset']['dest_path']
-
-    assert config['network']['tcp_dispatcher']['server_ip']
-    assert config['network']['tcp_dispatcher']['server_port']
-    assert config['network']['tcp_dispatcher']['abonents']
-    assert type(config['network']['tcp_dispatcher']['abonents']) is list
-    for abonent in config['network']['tcp_dispatcher']['abonents']:
-        assert 'name' in abonent
-        assert 'ip' in abonent
-        assert 'port' in abonent
 
+if __name__ == '__main__':
+    config = load_config('config.json')
 
     app = QtWidgets.QApplication(sys.argv)
     dashboard = DashboardWindow(config = config)
     dashboard.show()
     sys.exit(app.exec_())
-
-
@@ -0,0 +1,201 @@
+import os
+import json
+import time
+import argparse
+import numpy as np
+from replay import *
+
+
+#
+# Epoch dataset
+#
+# A directory with one contiguous array of event windows (epochs) compiled
+# from Recorder sessions:
+#   epochs.bin  - (epochs, channels, samples) int16 ADC values or float32 volts, C order
+#   labels.bin  - uint8 class per epoch: index in DATASET_LABELS, 255 - unknown event
+#   index.json  - shape, dtype, scaling and sessions: [{ name, first, count }]
+# Sessions are appended to the end of the files; index.json is replaced
+# last, so an interrupted append is cut off on the next open.
+# ----------------------------------------------------------------------------------
+DATASET_LABELS  = 'UDLR'
+DATASET_UNKNOWN = 255
+DATASET_DTYPES  = { 'int16' : '<i2', 'float32' : '<f4' }
+
+
+def dataset_sessions(path: str):
+    # Recorder sessions of a dest_path directory: <tm> of <tm>.wav or <tm>.json + <tm>.i16, oldest first
+    names = set()
+    for name in os.listdir(path):
+        base, ext = os.path.splitext(name)
+        if ext == '.wav' or (ext == '.json' and os.path.exists(os.path.join(path, base + '.i16'))):
+            names.add(base)
+    return [os.path.join(path, name) for name in sorted(names)]
+
+
+class EpochDataset():
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, 'index.json'), 'r') as index_file:
+            self.index = json.load(index_file)
+        # No epochs appended yet: channels/samples are not known
+        self.channels   = int(self.index['channels'] or 0)
+        self.samples    = int(self.index['samples'] or 0)
+        self.dtype      = np.dtype(DATASET_DTYPES[self.index['dtype']])
+        self.sessions   = self.index['sessions']
+        count = int(self.index['epochs'])
+        if count:
+            self.epochs = np.memmap(os.path.join(path, 'epochs.bin'), dtype=self.dtype, mode='r', shape=(count, self.channels, self.samples))
+            self.labels = np.memmap(os.path.join(path, 'labels.bin'), dtype=np.uint8, mode='r', shape=(count,))
+        else:
+            self.epochs = np.zeros((0, self.channels, self.samples), dtype=self.dtype)
+            self.labels = np.zeros((0,), dtype=np.uint8)
+
+    def __len__(self):
+        return len(self.epochs)
+
+    def __getitem__(self, idx):
+        return self.epochs[idx], self.labels[idx]
+
+    def session(self, name: str):
+        # (epochs, labels) views of one session
+        for session in self.sessions:
+            if session['name'] == name:
+                return self[session['first']:session['first'] + session['count']]
+        raise KeyError(name)
+
+    def volts(self, epochs: np.ndarray):
+        # float32 volts of int16 epochs, as SessionReplay.volts()
+        if self.dtype == np.float32:
+            return epochs
+        return epochs.astype(np.float32) * np.float32(self.index['adc_range'] / self.index['adc_power']) + np.float32(self.index['adc_range'] / 2)
+
+    def batches(self, batch_size: int, shuffle: bool = False, seed: int = None, drop_last: bool = False):
+        # Yields (epochs, labels) views of consecutive epochs, no copies; shuffle - batch order only
+        starts = np.arange(0, len(self) - batch_size + 1 if drop_last else len(self), batch_size)
+        if shuffle:
+            np.random.default_rng(seed).shuffle(starts)
+        for start in starts:
+            yield self.epochs[start:start + batch_size], self.labels[start:start + batch_size]
+
+
+#
+# Epoch dataset builder
+#
+# append(session) slices the event windows of a Recorder session (see
+# replay.Session) straight from its memory map into the dataset files.
+# Every epoch must have the dataset's channels x samples; the first
+# appended session defines them, windows of another size are skipped.
+# Sessions without event windows or with files modified in the last
+# `settle` seconds (still being recorded) are left for a later append.
+# ----------------------------------------------------------------------------------
+class DatasetBuilder():
+    def __init__(self, path: str, dtype: str = 'int16', adc_range: float = 5, adc_resolution: int = 16, settle: float = 5.0):
+        self.path = path
+        self.settle = settle
+        os.makedirs(path, exist_ok=True)
+        index_path = os.path.join(path, 'index.json')
+        if os.path.exists(index_path):
+            with open(index_path, 'r') as index_file:
+                self.index = json.load(index_file)
+        else:
+            assert dtype in DATASET_DTYPES
+            self.index = {
+                'dtype'         : dtype,
+                'channels'      : None,
+                'samples'       : None,
+                'sampling_rate' : None,
+                'adc_range'     : adc_range,
+                'adc_power'     : 2 ** adc_resolution,
+                'labels'        : DATASET_LABELS,
+                'epochs'        : 0,
+                'sessions'      : []
+            }
+            self.save()
+        self.dtype = np.dtype(DATASET_DTYPES[self.index['dtype']])
+        self.names = set(session['name'] for session in self.index['sessions'])
+
+        # Counters
+        self.skipped = 0
+        self.pending = 0        # sessions left for a later append
+
+    def files(self):
+        # Data and label files, cut to the epochs of the index (after an interrupted append)
+        epochs_path = os.path.join(self.path, 'epochs.bin')
+        labels_path = os.path.join(self.path, 'labels.bin')
+        epoch_size = self.dtype.itemsize * (self.index['channels'] or 0) * (self.index['samples'] or 0)
+        for path, size in ((epochs_path, epoch_size * self.index['epochs']), (labels_path, self.index['epochs'])):
+            with open(path, 'ab') as file:
+                file.truncate(size)
+        return open(epochs_path, 'ab'), open(labels_path, 'ab')
+
+    def convert(self, window: np.ndarray):
+        # (samples, channels) int16 -> (channels, samples) of the dataset dtype
+        if self.dtype == np.int16:
+            return window.T
+        return window.T.astype(np.float32) * np.float32(self.index['adc_range'] / self.index['adc_power']) + np.float32(self.index['adc_range'] / 2)
+
+    def recording(self, path: str):
+        # Some file of the session <path> was modified in the last `settle` seconds
+        now = time.time()
+        for ext in ('.wav', '.txt', '.i16', '.json', '.jsonl'):
+            if os.path.exists(path + ext) and now - os.path.getmtime(path + ext) < self.settle:
+                return True
+        return False
+
+    def append(self, session):
+        # Returns the number of appended epochs; a session already in the dataset is ignored
+        session = session if isinstance(session, Session) else Session(session)
+        name = os.path.basename(session.path)
+        if name in self.names:
+            return 0
+        if not session.events or self.recording(session.path):
+            self.pending += 1
+            return 0
+        if self.index['channels'] is None and session.events:
+            self.index['channels'] = session.channels
+            self.index['samples'] = session.events[0]['samples']
+            self.index['sampling_rate'] = session.sampling_rate
+        first = self.index['epochs']
+        count = 0
+        epochs_file, labels_file = self.files()
+        with epochs_file, labels_file:
+            for event in session.events:
+                if session.channels != self.index['channels'] or event['samples'] != self.index['samples']:
+                    self.skipped += 1
+                    continue
+                window = session.frames[event['offset']:event['offset'] + event['samples']]
+                if len(window) < event['samples']:
+                    self.skipped += 1
+                    continue
+                epochs_file.write(np.ascontiguousarray(self.convert(window), dtype=self.dtype).tobytes())
+                label = DATASET_LABELS.find(event['event'])
+                labels_file.write(bytes([label if label >= 0 else DATASET_UNKNOWN]))
+                count += 1
+        self.index['epochs'] += count
+        self.index['sessions'].append({ 'name' : name, 'first' : first, 'count' : count })
+        self.names.add(name)
+        self.save()
+        return count
+
+    def append_dir(self, path: str):
+        return sum(self.append(session) for session in dataset_sessions(path))
+
+    def save(self):
+        index_path = os.path.join(self.path, 'index.json')
+        with open(index_path + '.tmp', 'w') as index_file:
+            json.dump(self.index, index_file, indent=2)
+        os.replace(index_path + '.tmp', index_path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compile Recorder sessions into a memory-mapped epoch dataset')
+    parser.add_argument('sessions', help='directory with Recorder sessions (dataset.dest_path)')
+    parser.add_argument('dataset', help='dataset directory, new sessions are appended')
+    parser.add_argument('--dtype', choices=list(DATASET_DTYPES), default='int16', help='int16 ADC values or float32 volts (new datasets)')
+    args = parser.parse_args()
+
+    builder = DatasetBuilder(args.dataset, args.dtype)
+    appended = builder.append_dir(args.sessions)
+    dataset = EpochDataset(args.dataset)
+    print("appended", appended, "epochs, skipped", builder.skipped, "pending sessions", builder.pending, "- dataset:", dataset.epochs.shape, dataset.index['dtype'],
+          "labels:", { letter : int((dataset.labels == idx).sum()) for idx, letter in enumerate(DATASET_LABELS) })
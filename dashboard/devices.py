@@ -0,0 +1,151 @@
+import time
+import socket
+import selectors
+from ad7606 import *
+from framing import *
+from ingest import *
+from metrics import *
+
+
+#
+# AD7606 boards (headsets)
+#
+# network.udp_dispatcher.devices: [{ "name", "ip", "port", "source" }], the
+# device id is the index in the list. ip/port - local bind address (defaults
+# to udp_dispatcher ip/port), source - sender ip; several devices may share a
+# port if they have distinct sources. Without `devices`, udp_dispatcher ip/port
+# is the only device.
+# ----------------------------------------------------------------------------------
+def udp_devices(config):
+    udp_config = config['network']['udp_dispatcher']
+    devices = []
+    for idx, device in enumerate(udp_config.get('devices', [{}])):
+        devices.append({
+            'id'        : idx,
+            'name'      : str(device.get('name', 'Device ' + str(idx))),
+            'ip'        : str(device.get('ip', udp_config['ip'])),
+            'port'      : int(device.get('port', udp_config['port'])),
+            'source'    : str(device['source']) if device.get('source') else None
+        })
+    return devices
+
+
+class BatchDevice():
+    def __init__(self, device: dict):
+        self.id             = device['id']
+        self.name           = device['name']
+        self.scanner        = BatchScanner()
+        self.packet_counter = None
+
+        # Counters
+        self.packets        = 0
+        self.lost_packets   = 0
+        self.late_packets   = 0
+
+    def calc_lost_packets(self, packet_counter: int):
+        # The accumulate counter is byte: 0..0xff; nothing is lost before the first packet.
+        # A packet behind the last one (delta 0 or > 128) came late: its place was already
+        # filled as lost, returns None - the packet is dropped, the counter stays.
+        if self.packet_counter is None:
+            lost_packets = 0
+        else:
+            delta = (packet_counter - self.packet_counter) & 0xFF
+            if delta == 0 or delta > 128:
+                self.late_packets += 1
+                return None
+            lost_packets = delta - 1
+        self.packet_counter = packet_counter
+        self.packets += 1
+        self.lost_packets += lost_packets
+        return lost_packets
+
+    def stats(self):
+        return dict(self.scanner.stats(), name = self.name, lost_packets = self.lost_packets, late_packets = self.late_packets)
+
+
+#
+# Multi-device UDP ingest, no threads
+#
+# One socket per bind address, datagrams are demultiplexed to devices by the
+# socket and the sender ip; every device has its own framing, duplicate
+# suppression and loss accounting. poll() returns decoded batches tagged with
+# the device id: [(device_id, adc_values, lost_packets, stamps), ...], stamps -
+# perf_counter_ns() of recv, frame and decode with METRICS enabled, else None.
+# ----------------------------------------------------------------------------------
+class UDPIngest():
+    RCVBUF = 1024 * 1024
+
+    def __init__(self, config, devices: list, timeout: float = 0.1):
+        self.adc_channels   = int(config['adc']['channels'])
+        self.batch_samples  = int(config['dataset']['batch_samples'])
+        self.adc_scale      = ad7606_scale(int(config['adc']['range']), float(config['adc']['vref']))
+        self.timeout        = timeout
+        self.devices        = {}        # device id -> BatchDevice
+        self.routes         = {}        # (bind address, source ip or None) -> BatchDevice
+        self.receivers      = {}        # bind address -> DatagramReceiver
+        self.selector       = selectors.DefaultSelector()
+        self.unknown        = 0         # datagrams of unknown senders
+
+        for device in devices:
+            address = (device['ip'], device['port'])
+            self.devices[device['id']] = self.routes[(address, device['source'])] = BatchDevice(device)
+            if address not in self.receivers:
+                sock = socket.socket(family=socket.AF_INET, type=socket.SOCK_DGRAM)
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.RCVBUF)
+                sock.bind(address)
+                # Sender addresses are only needed to tell devices of a shared port apart
+                sources = any(other['source'] for other in devices if (other['ip'], other['port']) == address)
+                self.receivers[address] = DatagramReceiver(sock, timeout=timeout, sources=sources)
+                self.selector.register(sock, selectors.EVENT_READ, address)
+
+    def route(self, address, source):
+        device = self.routes.get((address, source))
+        if device is None:
+            device = self.routes.get((address, None))
+        return device
+
+    def receive(self, address, receiver, block: bool, batches: list):
+        datagrams = receiver.drain(block)
+        recv = time.perf_counter_ns() if METRICS.enabled else None
+        for datagram in datagrams:
+            buffer, start, end = datagram[:3]
+            device = self.route(address, datagram[3][0] if receiver.sources else None)
+            if device is None:
+                self.unknown += 1
+                continue
+            for packet in device.scanner.frames_from(buffer, start, end):
+                stamps = None
+                if recv:
+                    stamps = METRICS.begin(recv)
+                    METRICS.stamp(stamps, 'frame')
+                lost_packets = device.calc_lost_packets(packet[2])
+                if lost_packets is None:
+                    continue
+                adc_values = ad7606_decode(packet, self.adc_scale, self.adc_channels, self.batch_samples)
+                if recv:
+                    METRICS.stamp(stamps, 'decode')
+                batches.append((device.id, adc_values, lost_packets, stamps))
+
+    def poll(self):
+        batches = []
+        if len(self.receivers) == 1:
+            # A single socket waits in its receiver, only when nothing is pending
+            for address, receiver in self.receivers.items():
+                self.receive(address, receiver, True, batches)
+            return batches
+        for key, events in self.selector.select(self.timeout):
+            self.receive(key.data, self.receivers[key.data], False, batches)
+        return batches
+
+    def close(self):
+        self.selector.close()
+        for receiver in self.receivers.values():
+            receiver.close()
+            receiver.socket.close()
+
+    def stats(self):
+        return {
+            'devices'   : { device.id : device.stats() for device in self.devices.values() },
+            'unknown'   : self.unknown
+        }
+
@@ -3,79 +3,63 @@ import time
 import socket
 import errno
 import queue
-import select
+import selectors
 import os
 import threading
 import numpy as np
 from bits import *
-from events import *
-from PyQt5 import QtCore, QtWidgets
+from crc import *
+from ad7606 import *
+from framing import *
+from ingest import *
+from devices import *
+from exchange import *
+from outbound import *
 
 
 #
 # UDP Dispatcher
+#
+# on_batch(adc_values: (channels, samples) float32 array, lost_packets: int, device: int)
+# is called from the dispatcher thread for every decoded batch packet of every
+# device (see udp_devices()).
 # ----------------------------------------------------------------------------------
-class UDPDispatcher(QtCore.QThread):
-    def __init__(self, parent=None):
-        super(UDPDispatcher, self).__init__(parent=parent)
-        self.parent = parent
-        self.config = self.parent.config
-
-        self.adc_range      = int(self.config['adc']['range'])
-        self.adc_vref       = float(self.config['adc']['vref'])
-        self.adc_channels   = int(self.config['adc']['channels'])
-        self.batch_samples  = int(self.config['dataset']['batch_samples'])
-
-        self.prev_crc16 = 0
-        self.packet_counter = 0
-        self.lost_packets = 0
+class UDPDispatcher(threading.Thread):
+    def __init__(self, config, on_batch, name = 'UDPDispatcherThread'):
+        super(UDPDispatcher, self).__init__(name=name)
+        self.config = config
+        self.on_batch = on_batch
+
+        self.devices        = udp_devices(self.config)
+        self.packets        = [0] * len(self.devices)
+        self.lost_packets   = [0] * len(self.devices)
         self.since = time.perf_counter()
         self.thread_stop = False
-        self.buffer = bytearray()
 
-        self.socket = socket.socket(family=socket.AF_INET, type=socket.SOCK_DGRAM)
-        self.socket.bind((
-            str(self.config['network']['udp_dispatcher']['ip']),
-            int(self.config['network']['udp_dispatcher']['port'])))
-        self.socket.setblocking(False)
+        self.ingest = UDPIngest(self.config, self.devices)
 
     def stop(self):
         self.thread_stop = True
 
-    def calc_lost_packets(self, packet_counter: int):
-        # The accumulate counter is byte: 0..0xff
-        if self.packet_counter >= packet_counter:
-            lost_packets = 255 - self.packet_counter + packet_counter
-        else:
-            lost_packets = packet_counter - self.packet_counter - 1
-        self.packet_counter = packet_counter
-        return lost_packets
-
-    def ad7606_parse(self, offset, packet_size):
-        found_packet = False
-        if self.buffer[ offset ] == 0xAA and self.buffer[ offset + 1 ] == 0xBB:
-            packet = Bits(bytes(self.buffer[offset:offset + packet_size]))
-            # Check CRC16
-            crc16 = packet.get_ubits(803 * 8, 16)
-            raw_packet = self.buffer[offset:offset + packet_size]
-            raw_packet[803] = raw_packet[804] = 0
-            rem_crc16 = Bits.crc16_update(raw_packet, packet_size)
-            # Fix ESP8266 bug!!!
-            # Skip dublicate neighboring packets
-            if crc16 == rem_crc16 and self.prev_crc16 != crc16:
-                self.prev_crc16 = crc16
-                found_packet = True
-                lost_packets = self.calc_lost_packets(packet.get_ubits(2 * 8, 8))
-                adc_values = [[0] * self.batch_samples ] * self.adc_channels
-                for idx_channel, channel in enumerate(adc_values):
-                    samples = []
-                    for idx_sample, sample in enumerate(channel):
-                        value = int(packet.get_sbits((3 + idx_sample * 10) * 8 + idx_channel * 16, 16))
-                        value = (self.adc_range * value) / ((32768 * self.adc_vref) / 2.5)
-                        samples.append(value)
-                    adc_values[idx_channel] = samples
-                QtWidgets.QApplication.postEvent(self.parent, UDPDispatcherEvent(adc_values, lost_packets))
-        return found_packet
+    def deliver(self, batches: list):
+        # Stamps of a batch are METRICS.current() for on_batch
+        for device, adc_values, lost_packets, stamps in batches:
+            self.packets[device] += 1
+            self.lost_packets[device] += lost_packets
+            METRICS.set_current(stamps)
+            self.on_batch(adc_values, lost_packets, device)
+        METRICS.set_current(None)
+
+    def stats(self):
+        elapsed = time.perf_counter() - self.since
+        return {
+            device['id'] : {
+                'name'          : device['name'],
+                'packets'       : self.packets[device['id']],
+                'packets_per_second': self.packets[device['id']] / elapsed if elapsed else 0.0,
+                'lost_packets'  : self.lost_packets[device['id']]
+            } for device in self.devices
+        }
 
     # def ad7739_parse(self, offset):
     #     RANGE = 5               # +-2.5V
@@ -100,24 +84,9 @@ class UDPDispatcher(QtCore.QThread):
     #     return result, adc_values, lost_packets
 
     def run(self):
-        BATCH_PACKET_SIZE = 805
-        threading.current_thread().name = QtCore.QThread.currentThread().objectName()
-
         while not self.thread_stop:
-            ready = select.select([self.socket], [], [], 0.1)
-            if ready[0]:
-                data = self.socket.recv(2048)
-                self.buffer += bytearray(data)
-                while len(self.buffer) >= BATCH_PACKET_SIZE:
-                    for offset in range(0, len(self.buffer)):
-                        # Parse batch packet
-                        if self.ad7606_parse(offset, BATCH_PACKET_SIZE):
-                            del self.buffer[offset:offset + BATCH_PACKET_SIZE]
-                            break
-                        # Move buffer
-                        self.buffer = self.buffer[1:]
-                        break
-        self.socket.close()
+            self.deliver(self.ingest.poll())
+        self.ingest.close()
 
 
 #
@@ -136,6 +105,7 @@ class ExchangeProtocol():
     TCP_SERVER                      = 1
     TCP_CLIENT                      = 2
     PACKET_HEADER_SIZE              = 9
+    RECV_SIZE                       = 64 * 1024
 
     GAME_EVENT_UP                   = 1
     GAME_EVENT_DOWN                 = 2
@@ -159,11 +129,23 @@ class ExchangeProtocol():
         self.bind_ip            = bind_ip
         self.bind_port          = bind_port
         self.abonents           = len(self.config['network']['tcp_dispatcher']['abonents'])
-        self.read_sockets       = []
-        self.write_sockets      = []
-        self.socket_addresses   = []
+        # Ping period and dead peer timeout (nothing received), seconds; 0 - disabled
+        self.heartbeat          = float(self.config['network']['tcp_dispatcher'].get('heartbeat', 1.0))
+        self.peer_timeout       = float(self.config['network']['tcp_dispatcher'].get('peer_timeout', 5.0))
+        self.next_heartbeat     = 0
+        self.connections        = {}        # socket -> ip address
+        self.last_recv          = {}        # socket -> time.monotonic() of the last received bytes
+        self.watched            = {}        # socket -> selector events
+        self.send_buffer        = bytearray(self.PACKET_HEADER_SIZE + 256)
         self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
 
+        # Wakes the loop up from other threads: new output, stop
+        self.selector = selectors.DefaultSelector()
+        self.wakeup_recv, self.wakeup_send = socket.socketpair()
+        self.wakeup_recv.setblocking(False)
+        self.wakeup_send.setblocking(False)
+        self.selector.register(self.wakeup_recv, selectors.EVENT_READ)
+
     def setup(self):
         # Client
         if self.type == ExchangeProtocol.TCP_CLIENT:
@@ -177,52 +159,105 @@ class ExchangeProtocol():
                 print("Error: socket.connect = {:d}, {:s}".format(error.errno, os.strerror(error.errno)))
                 return False
             else:
-                self.socket.setblocking(False)
-                self.write_sockets.append(self.socket)
-                self.socket_addresses.append(self.server_ip)
-                self.on_new_client(self.server_ip)
+                self.add_connection(self.socket, self.server_ip)
         # Server
         else:
             self.socket.setblocking(False)
             self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
             self.socket.bind((self.server_ip, self.server_port))
             self.socket.listen(self.abonents)
-
-        self.read_sockets.append(self.socket)
+            self.selector.register(self.socket, selectors.EVENT_READ)
         return True
 
+    def wakeup(self):
+        try:
+            self.wakeup_send.send(b'\x00')
+        except OSError:
+            # Already pending or closed
+            pass
+
+    def add_connection(self, sock, ip: str):
+        sock.setblocking(False)
+        self.connections[sock] = ip
+        self.last_recv[sock] = time.monotonic()
+        self.watched[sock] = selectors.EVENT_READ
+        self.selector.register(sock, selectors.EVENT_READ)
+        self.on_new_client(ip)
+
+    def del_connection(self, sock):
+        if sock not in self.connections:
+            return
+        ip = self.connections.pop(sock)
+        del self.last_recv[sock]
+        del self.watched[sock]
+        self.selector.unregister(sock)
+        sock.close()
+        self.on_del_client(ip)
+
+    def watch(self, sock):
+        # Writability is only watched while there is output pending
+        events = selectors.EVENT_READ | (selectors.EVENT_WRITE if self.has_output(self.connections[sock]) else 0)
+        if events != self.watched[sock]:
+            self.watched[sock] = events
+            self.selector.modify(sock, events)
+
     def loop(self):
-        # Check client sockets
-        if len(self.write_sockets): #and self.type == ExchangeProtocol.TCP_SERVER:
-            for sock in self.write_sockets[:]:
-                self.ping(sock)
-
-        # Recv/Send packets
-        r_list, w_list, e_list = select.select(self.read_sockets, self.write_sockets, self.read_sockets, 0.01)
-        for sock in r_list:
-            if sock is self.socket and self.type == ExchangeProtocol.TCP_SERVER:
+        now = time.monotonic()
+        if self.heartbeat and now >= self.next_heartbeat:
+            self.next_heartbeat = now + self.heartbeat
+            for sock in list(self.connections):
+                if self.peer_timeout and now - self.last_recv[sock] > self.peer_timeout:
+                    print("Error: peer {:s}: nothing received for {:.1f} s".format(self.connections[sock], now - self.last_recv[sock]))
+                    self.del_connection(sock)
+                else:
+                    self.ping(sock)
+        for sock in list(self.connections):
+            self.watch(sock)
+
+        timeout = max(0.0, self.next_heartbeat - time.monotonic()) if self.heartbeat else None
+        for key, events in self.selector.select(timeout):
+            sock = key.fileobj
+            if sock is self.wakeup_recv:
+                try:
+                    while sock.recv(4096):
+                        pass
+                except BlockingIOError:
+                    pass
+            elif sock is self.socket and self.type == ExchangeProtocol.TCP_SERVER:
                 # Accept new connection
                 client_socket, client_address = self.socket.accept()
                 client_ip, client_port = client_address
-                client_socket.setblocking(False)
-                self.read_sockets.append(client_socket)
-                self.write_sockets.append(client_socket)
-                self.socket_addresses.append(client_ip)
-                self.on_new_client(client_ip)
-            else:
-                data = sock.recv(4096)
-                if data:
-                    idx = self.write_sockets.index(sock)
-                    self.on_recv(data, self.socket_addresses[idx])
-        for sock in w_list:
-            idx = self.write_sockets.index(sock)
-            self.on_send(sock, self.socket_addresses[idx])
+                self.add_connection(client_socket, client_ip)
+            elif sock in self.connections:
+                if events & selectors.EVENT_READ:
+                    try:
+                        data = sock.recv(self.RECV_SIZE)
+                    except BlockingIOError:
+                        data = None
+                    except socket.error as error:
+                        print("Error: socket.recv = {:d}, {:s}".format(error.errno, os.strerror(error.errno)))
+                        data = b''
+                    if data == b'':
+                        # Closed by the peer
+                        self.del_connection(sock)
+                        continue
+                    if data:
+                        self.last_recv[sock] = time.monotonic()
+                        self.on_recv(data, self.connections[sock])
+                if events & selectors.EVENT_WRITE and sock in self.connections:
+                    self.on_send(sock, self.connections[sock])
 
     def shutdown(self):
-        for sock in self.write_sockets:
-            sock.close()
-        for sock in self.read_sockets:
+        for sock in list(self.connections):
             sock.close()
+        self.connections.clear()
+        self.socket.close()
+        self.selector.close()
+        self.wakeup_recv.close()
+        self.wakeup_send.close()
+
+    def has_output(self, ip_address):
+        return False
 
     def on_new_client(self, ip: str):
         raise NotImplementedError()
@@ -239,109 +274,97 @@ class ExchangeProtocol():
     def on_packet(self, data: list, event_code: int = 0, event_iter: int = 0, event_bits: int = 8):
         raise NotImplementedError()
 
-    def pack_packet(self, data: list, event_code: int = 0, event_iter: int = 0, event_bits: int = 8, data_size: int  = 0) -> Bits:
+    def pack_packet(self, data: list, event_code: int = 0, event_iter: int = 0, event_bits: int = 8, data_size: int  = 0) -> memoryview:
+        # Packed into the reusable send buffer, valid until the next pack_packet
         packet_size = self.PACKET_HEADER_SIZE + data_size
-        packet = Bits(bytes(bytearray(packet_size)))
-
-        packet.set_bits(0 * 8, 0xAA, 8)
-        packet.set_bits(1 * 8, 0xCC, 8)
-        packet.set_bits(2 * 8, event_code, 8)
-        packet.set_bits(3 * 8, event_iter, 8)
-        packet.set_bits(4 * 8, event_bits, 8)
-        packet.set_bits(5 * 8, data_size, 16)
-        packet.set_bits(7 * 8, 0, 16)
-
-        if data_size:
-            for idx, sample in enumerate(data):
-                packet.set_bits(int((9 + idx * 2) * 8), sample, event_bits)
-
-        crc16 = Bits.crc16_update(packet.get_barray(), packet_size)
-        packet.set_bits(7 * 8, crc16, 16)
-        return packet
+        if len(self.send_buffer) < packet_size:
+            self.send_buffer = bytearray(packet_size)
+        exchange_pack_into(self.send_buffer, data, event_code = event_code, event_iter = event_iter, event_bits = event_bits, data_size = data_size)
+        return memoryview(self.send_buffer)[:packet_size]
 
     def ping(self, sock):
         packet = self.pack_packet(data = [], event_code = self.DISPATCHER_EVENT_PING, event_iter = 0, event_bits = 8, data_size = 0)
         try:
-            sock.sendall(packet.get_barray())
+            sock.sendall(packet)
         except socket.error as error:
-            sock.close()
-            idx = self.write_sockets.index(sock)
-            self.on_del_client(self.socket_addresses[idx])
-            self.write_sockets.remove(sock)
-            self.read_sockets.remove(sock)
-            del self.socket_addresses[idx]
+            self.del_connection(sock)
             print("Error: ping: socket.sendall = {:d}, {:s}".format(error.errno, os.strerror(error.errno)))
 
-    def send(self, sock, data: list, event_code: int = 0, event_iter: int = 0, event_bits: int = 8, data_size: int  = 0):
-        packet = self.pack_packet(data = data, event_code = event_code, event_iter = event_iter, event_bits = event_bits, data_size = data_size)
-        try:
-            sock.send(packet.get_barray())
-        except socket.error as error:
-            print("Error: socket.send = {:d}, {:s}".format(error.errno, os.strerror(error.errno)))
-
     RECV_RESULT_NOT_FOUND       = 0
     RECV_RESULT_AWAITING_DATA   = 1
     RECV_RESULT_BAD_CRC16       = 2
     RECV_RESULT_FOUND           = 3
 
     def recv(self, data: bytearray):
-        result = (self.RECV_RESULT_NOT_FOUND, 0)
-        while 1:
-            if data[0] != 0xAA:
-                break
-            if data[1] != 0xCC:
-                break
-
-            packet      = Bits(bytes(data))
-            data_size   = packet.get_ubits(5 * 8, 16)
-            if (len(data) - self.PACKET_HEADER_SIZE) < data_size:
-                result = (self.RECV_RESULT_AWAITING_DATA, data_size)
-                break
-
-            packet_size = self.PACKET_HEADER_SIZE + data_size
-            crc16       = packet.get_ubits(7 * 8, 16)
-
-            data[7] = data[8] = 0
-            if crc16 != Bits.crc16_update(data, packet_size):
-                result = (self.RECV_RESULT_BAD_CRC16, data_size)
-            else:
-                event_code = packet.get_ubits(2 * 8, 8)
-                event_iter = packet.get_ubits(3 * 8, 8)
-                event_bits = packet.get_ubits(4 * 8, 8)
-                data = []
-                for idx in range(0, data_size, int(event_bits / 8)):
-                    value = int(packet.get_ubits((self.PACKET_HEADER_SIZE + idx) * 8, event_bits))
-                    data.append(value)
-                self.on_packet( data = data, event_code = event_code, event_iter = event_iter, event_bits = event_bits)
-                result = (self.RECV_RESULT_FOUND, data_size)
-            break
-        return result
+        # data starts with a packet candidate, it isn't modified
+        if len(data) < self.PACKET_HEADER_SIZE:
+            found = data[:len(EXCHANGE_PACKET_SYNC)] == EXCHANGE_PACKET_SYNC[:len(data)]
+            return (self.RECV_RESULT_AWAITING_DATA if found else self.RECV_RESULT_NOT_FOUND, 0)
+        sync, event_code, event_iter, event_bits, data_size, crc16 = exchange_header(data)
+        if sync != EXCHANGE_PACKET_SYNC:
+            return (self.RECV_RESULT_NOT_FOUND, 0)
+        if (len(data) - self.PACKET_HEADER_SIZE) < data_size:
+            return (self.RECV_RESULT_AWAITING_DATA, data_size)
+        if crc16 != exchange_crc16(data, 0, data_size):
+            return (self.RECV_RESULT_BAD_CRC16, data_size)
+
+        data = exchange_payload(data, 0, event_bits, data_size)
+        self.on_packet( data = data, event_code = event_code, event_iter = event_iter, event_bits = event_bits)
+        return (self.RECV_RESULT_FOUND, data_size)
 
-class TCPDispatcher(QtCore.QThread, ExchangeProtocol):
-    def __init__(self, parent, queues, bind_ip = "127.0.0.1", bind_port = 45000, type = ExchangeProtocol.TCP_CLIENT):
-        super(TCPDispatcher, self).__init__(parent, config = parent.config, bind_ip = bind_ip, bind_port = bind_port, type = type)
-        self.parent = parent
+#
+# on_packet(data: list, event_code: int, event_iter: int, event_bits: int)
+# is called from the dispatcher thread for every received packet and for
+# DISPATCHER_EVENT_NEW_CLIENT/DEL_CLIENT.
+# ----------------------------------------------------------------------------------
+class TCPDispatcher(threading.Thread, ExchangeProtocol):
+    def __init__(self, config, abonents, on_packet, bind_ip = "127.0.0.1", bind_port = 45000, type = ExchangeProtocol.TCP_CLIENT, name = 'TCPDispatcherThread'):
+        threading.Thread.__init__(self, name=name)
+        ExchangeProtocol.__init__(self, config = config, bind_ip = bind_ip, bind_port = bind_port, type = type)
+        self.callback = on_packet
         self.thread_stop = False
-        self.queues  = queues
-        self.buffers = {}
-        for ip_abonent in self.queues.keys():
-            self.buffers[ip_abonent] = bytearray()
+        # Outbound frames per abonent ip, bounded by send_high_water bytes
+        self.send_high_water = int(self.config['network']['tcp_dispatcher'].get('send_high_water', OutboundQueue.HIGH_WATER))
+        self.send_policy = str(self.config['network']['tcp_dispatcher'].get('send_policy', 'drop_oldest'))
+        self.ping_frame = bytes(self.pack_packet(data = [], event_code = self.DISPATCHER_EVENT_PING, event_iter = 0, event_bits = 8, data_size = 0))
+        self.queues  = {}
+        self.readers = {}
+        for ip_abonent in abonents:
+            self.add_queue(ip_abonent)
+            self.readers[ip_abonent] = ExchangeFrameReader()
+
+    def add_queue(self, ip: str):
+        queue = self.queues[ip] = OutboundQueue(self.send_high_water, self.send_policy)
+        METRICS.gauge('abonent_queues.' + ip, lambda: { 'depth' : len(queue), 'bytes' : queue.pending_bytes, 'dropped_frames' : queue.dropped_frames })
 
     def stop(self):
         self.thread_stop = True
+        self.wakeup()
+
+    def post(self, ip_address: str, payload: tuple, timeout: float = None):
+        # payload: (event_code, event_iter, event_bits, data_size, data), any thread; GUI threads pass
+        # timeout 0 (send_policy "block" must not stall them). Returns False if the frame was dropped.
+        event_code, event_iter, event_bits, data_size, data = payload
+        frame = bytearray(self.PACKET_HEADER_SIZE + data_size)
+        exchange_pack_into(frame, data, event_code = event_code, event_iter = event_iter, event_bits = event_bits, data_size = data_size)
+        result = self.queues[ip_address].push(frame, timeout)
+        self.wakeup()
+        return result
 
     def run(self):
-        threading.current_thread().name = QtCore.QThread.currentThread().objectName()
         # Waiting for conenction
         while self.setup() == False and self.thread_stop == False:
             time.sleep(1)
         while self.thread_stop == False:
             self.loop()
-            time.sleep(0.01)
         # Close all sockets
         self.shutdown()
 
     def on_new_client(self, ip: str):
+        # A new connection starts a new stream
+        self.readers[ip] = ExchangeFrameReader()
+        if ip not in self.queues:
+            self.add_queue(ip)
         self.on_packet(
             data        = [ ip ],
             event_code  = ExchangeProtocol.DISPATCHER_EVENT_NEW_CLIENT,
@@ -349,6 +372,7 @@ class TCPDispatcher(QtCore.QThread, ExchangeProtocol):
             event_bits  = 8)
 
     def on_del_client(self, ip: str):
+        self.queues[ip].discard_partial()
         self.on_packet(
             data        = [ ip ],
             event_code  = ExchangeProtocol.DISPATCHER_EVENT_DEL_CLIENT,
@@ -356,43 +380,40 @@ class TCPDispatcher(QtCore.QThread, ExchangeProtocol):
             event_bits  = 8)
 
     def on_recv(self, data, ip_address):
-        self.buffers[ip_address] += bytearray(data)
-        while len(self.buffers[ip_address]) >= ExchangeProtocol.PACKET_HEADER_SIZE:
-            awaiting_data = False
-            for offset in range(0, len(self.buffers[ip_address])):
-
-                result, data_size = self.recv(self.buffers[ip_address][offset:])
-                if result == self.RECV_RESULT_FOUND:
-                    del self.buffers[ip_address][offset:offset + ExchangeProtocol.PACKET_HEADER_SIZE + data_size]
-                    break
-                if result == self.RECV_RESULT_BAD_CRC16:
-                    del self.buffers[ip_address][offset:offset + ExchangeProtocol.PACKET_HEADER_SIZE + data_size]
-                    break
-                if result == self.RECV_RESULT_AWAITING_DATA:
-                    awaiting_data = True
-                    break
-                if result == self.RECV_RESULT_NOT_FOUND:
-                    self.buffers[ip_address] = self.buffers[ip_address][1:]
-                    break
-            if awaiting_data:
-                break
+        reader = self.readers.get(ip_address)
+        if reader is None:
+            reader = self.readers[ip_address] = ExchangeFrameReader()
+        reader.feed(data)
+        for event_code, event_iter, event_bits, data in reader.frames():
+            self.on_packet(data = data, event_code = event_code, event_iter = event_iter, event_bits = event_bits)
+
+    def stats(self):
+        return {
+            'recv'  : { ip_address : reader.stats() for ip_address, reader in self.readers.items() },
+            'send'  : { ip_address : outbound.stats() for ip_address, outbound in self.queues.items() }
+        }
+
+    def has_output(self, ip_address):
+        return ip_address in self.queues and self.queues[ip_address].pending()
+
+    def ping(self, sock):
+        # Through the abonent queue, a ping must not split a partially sent frame.
+        # A connection with pending output doesn't need it.
+        ip_address = self.connections[sock]
+        if not self.queues[ip_address].pending():
+            self.queues[ip_address].push(self.ping_frame)
+            self.on_send(sock, ip_address)
 
     def on_send(self, sock, ip_address):
         try:
-            payload = None
-            if ip_address in self.queues:
-                payload = self.queues[ip_address].get_nowait()
-        except queue.Empty:
-            # print("Error: queue = nothing to send")
-            pass
-        else:
-            if payload:
-                event_code, event_iter, event_bits, data_size, data = payload
-                self.send(sock, data=data, event_code=event_code, event_iter=event_iter, event_bits=event_bits, data_size=data_size)
+            self.queues[ip_address].flush(sock)
+        except socket.error as error:
+            self.del_connection(sock)
+            print("Error: socket.sendmsg = {:d}, {:s}".format(error.errno, os.strerror(error.errno)))
 
     def on_packet(self, data: list, event_code: int = 0, event_iter: int = 0, event_bits: int = 8):
-        QtWidgets.QApplication.postEvent(self.parent, TCPDispatcherEvent(
+        self.callback(
             data        = data[:],
             event_code  = event_code,
             event_iter  = event_iter,
-            event_bits  = event_bits))
\ No newline at end of file
+            event_bits  = event_bits)
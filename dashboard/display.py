@@ -0,0 +1,225 @@
+import math
+import numpy as np
+from ringbuffer import *
+
+
+#
+# Min/max (peak preserving) decimation for display
+#
+# A trace is drawn with two points per pixel column, the min and the max of
+# the `bucket` samples of the column, at the same x: spikes shorter than a
+# pixel stay visible. Columns are aligned to the absolute sample index
+# (`start` - index of the first sample of the trace), so a scrolling trace
+# keeps its column boundaries and peaks don't flicker. A leading partial
+# column is dropped, a trailing one is kept.
+# plan() is done once per frame for all traces of the same length and
+# position: they share its x array. Traces with <= `raw` samples per column
+# are drawn as is.
+# ----------------------------------------------------------------------------------
+class MinMaxDecimator():
+    def __init__(self, sampling_rate: int):
+        self.sampling_rate  = sampling_rate
+        self.samples        = 0
+        self.bucket         = 0
+        self.raw            = True      # drawn as is
+        self.skip           = 0         # samples of the leading partial column
+        self.columns        = 0         # full columns
+        self.tail           = 0         # samples of the trailing partial column
+        self.x              = np.zeros(0)
+
+    def plan(self, samples: int, pixels: int, start: int = 0, raw: int = 2):
+        # x of the points, seconds since the first sample (shared by the traces of the frame)
+        bucket = max(1, math.ceil(samples / max(1, pixels)))
+        if bucket <= raw:
+            skip, columns, tail, bucket = 0, samples, 0, 0
+        else:
+            skip = -start % bucket
+            columns = (samples - skip) // bucket
+            tail = samples - skip - columns * bucket
+        if (samples, bucket, skip, columns, tail) != (self.samples, self.bucket, self.skip, self.columns, self.tail):
+            self.samples, self.bucket, self.skip, self.columns, self.tail = samples, bucket, skip, columns, tail
+            self.raw = not bucket
+            if self.raw:
+                self.x = np.arange(samples) / self.sampling_rate
+            else:
+                index = skip + bucket * np.arange(columns + (1 if tail else 0))
+                self.x = np.repeat(index, 2) / self.sampling_rate
+        return self.x
+
+    def points(self):
+        return len(self.x)
+
+    def apply(self, y: np.ndarray, out: np.ndarray = None):
+        # y: (..., samples) -> (..., points()) written to `out` (allocated if None or too small)
+        points = self.points()
+        if out is None or out.shape[-1] < points or out.shape[:-1] != y.shape[:-1]:
+            out = np.empty(y.shape[:-1] + (points + 4, ), dtype=y.dtype)
+        out = out[..., :points]
+        if self.raw:
+            out[...] = y
+            return out
+        end = self.skip + self.columns * self.bucket
+        blocks = y[..., self.skip:end].reshape(y.shape[:-1] + (self.columns, self.bucket))
+        np.min(blocks, axis=-1, out=out[..., 0:2 * self.columns:2])
+        np.max(blocks, axis=-1, out=out[..., 1:2 * self.columns:2])
+        if self.tail:
+            out[..., -2] = y[..., end:].min(axis=-1)
+            out[..., -1] = y[..., end:].max(axis=-1)
+        return out
+
+
+#
+# Frame budget
+#
+# Display refresh at a fixed rate, decoupled from packet arrival: a timer
+# ticks every 1 / fps s and a frame is drawn on a tick if due(). Drawing
+# may take at most `share` of the GUI thread: after a frame of `elapsed` s
+# the ticks until since + elapsed / share are skipped, so a slow frame lowers
+# the frame rate instead of delaying the incoming batches.
+# ----------------------------------------------------------------------------------
+class FrameBudget():
+    def __init__(self, fps: float = 30, share: float = 0.5):
+        self.interval   = 1 / fps
+        self.share      = share
+        self.next       = 0.0
+        self.since      = None
+
+        # Counters
+        self.frames     = 0
+        self.skipped    = 0
+        self.draw_time  = 0.0
+        self.max_draw   = 0.0
+
+    def due(self, now: float):
+        if self.since is None:
+            self.since = now
+        if now < self.next:
+            self.skipped += 1
+            return False
+        return True
+
+    def done(self, since: float, now: float):
+        # A frame started at `since` is drawn at `now`
+        elapsed = now - since
+        self.frames += 1
+        self.draw_time = elapsed
+        self.max_draw = max(self.max_draw, elapsed)
+        self.next = since + elapsed / self.share - self.interval / 2
+
+    def stats(self, now: float):
+        return {
+            'frames'        : self.frames,
+            'skipped'       : self.skipped,
+            'fps'           : self.frames / (now - self.since) if self.since is not None and now > self.since else 0.0,
+            'draw_ms'       : self.draw_time * 1e3,
+            'max_draw_ms'   : self.max_draw * 1e3
+        }
+
+
+#
+# Multi-resolution (mip-map) history
+#
+# Level 0 keeps the last `capacity` samples, level k the min and the max of
+# every factor^k samples (aligned to the absolute sample index) for the
+# last `capacity` of them: memory is constant per level, level k covers
+# capacity * factor^k samples (defaults: 2 s, 16 s, 2 min, 17 min, 2.3 h,
+# 18 h at 2 kHz). append() is O(block): every level reduces only the entries
+# completed by the block, the rest waits in `pending`; fill() of lost samples
+# is O(capacity) per level whatever their count.
+# view(start, end, pixels) draws [start, end) (absolute samples) from the
+# finest level with at most factor entries per pixel that still holds
+# `start`, min/max decimated to pixels: O(pixels * factor) for any span.
+# The newest samples not yet complete in the chosen level are not drawn.
+# ----------------------------------------------------------------------------------
+class MipmapHistory():
+    def __init__(self, sampling_rate: int, capacity: int, channels = None, levels: int = 6, factor: int = 8, dtype = np.float32):
+        self.sampling_rate  = sampling_rate
+        self.factor         = factor
+        raw                 = RingBuffer(capacity, channels, dtype)
+        self.lows           = [raw] + [RingBuffer(capacity, channels, dtype) for _ in range(1, levels)]
+        self.highs          = [raw] + [RingBuffer(capacity, channels, dtype) for _ in range(1, levels)]
+        self.pending        = [None] * levels       # (lows, highs) of level - 1, not a full entry yet
+        self.decimators     = [MinMaxDecimator(sampling_rate / factor ** level) for level in range(levels)]
+
+    @property
+    def written(self):
+        return self.lows[0].written
+
+    def append(self, block: np.ndarray):
+        # block: (..., samples)
+        self.lows[0].append(block)
+        self.reduce(block, block)
+
+    def fill(self, value, count: int):
+        # Lost samples: a run of `value` reduces to runs of `value`, O(capacity) per level for any count
+        self.lows[0].fill(value, count)
+        empty = self.lows[0].data[..., :0]
+        self.reduce(empty, empty, count, value)
+
+    def reduce(self, lows: np.ndarray, highs: np.ndarray, count: int = 0, value = 0):
+        # New entries of level - 1 (lows, highs, then `count` entries of `value`) into levels 1..
+        factor = self.factor
+        for level in range(1, len(self.lows)):
+            if self.pending[level] is not None:
+                lows = np.concatenate([self.pending[level][0], lows], axis=-1)
+                highs = np.concatenate([self.pending[level][1], highs], axis=-1)
+            held = lows.shape[-1]
+            full = (held + count) // factor
+            mixed = min(full, -(-held // factor))     # entries not of the run alone
+            if full * factor < held:
+                rest = (lows[..., full * factor:], highs[..., full * factor:])
+                if count:
+                    run = np.full(lows.shape[:-1] + (count, ), value, dtype=lows.dtype)
+                    rest = (np.concatenate([rest[0], run], axis=-1), np.concatenate([rest[1], run], axis=-1))
+                self.pending[level] = (rest[0].copy(), rest[1].copy())
+            elif (held + count) % factor:
+                run = np.full(lows.shape[:-1] + ((held + count) % factor, ), value, dtype=lows.dtype)
+                self.pending[level] = (run, run.copy())
+            else:
+                self.pending[level] = None
+            if not full:
+                break
+            if mixed:
+                if mixed * factor > held:
+                    run = np.full(lows.shape[:-1] + (mixed * factor - held, ), value, dtype=lows.dtype)
+                    lows, highs = np.concatenate([lows, run], axis=-1), np.concatenate([highs, run], axis=-1)
+                shape = lows.shape[:-1] + (mixed, factor)
+                lows = lows[..., :mixed * factor].reshape(shape).min(axis=-1)
+                highs = highs[..., :mixed * factor].reshape(shape).max(axis=-1)
+                self.lows[level].append(lows)
+                self.highs[level].append(highs)
+            else:
+                lows, highs = lows[..., :0], highs[..., :0]
+            count = full - mixed
+            if count:
+                self.lows[level].fill(value, count)
+                self.highs[level].fill(value, count)
+
+    def first(self, level: int = None):
+        # Oldest sample held by a level (by the coarsest one by default)
+        level = len(self.lows) - 1 if level is None else level
+        return max(0, self.lows[level].written - self.lows[level].capacity) * self.factor ** level
+
+    def level(self, start: int, end: int, pixels: int):
+        level = 0
+        while level + 1 < len(self.lows) and self.factor ** (level + 1) * pixels <= end - start:
+            level += 1
+        while level + 1 < len(self.lows) and start < self.first(level):
+            level += 1
+        return level
+
+    def view(self, start: int, end: int, pixels: int):
+        # (x - seconds since the first sample, (..., points) min/max pairs) of [start, end) samples
+        end = min(end, self.written)
+        start = min(max(start, self.first()), end)
+        level = self.level(start, end, pixels)
+        scale = self.factor ** level
+        written = self.lows[level].written
+        first = max(start // scale, written - self.lows[level].capacity)
+        count = max(0, min(-(-end // scale), written) - first)
+        decimator = self.decimators[level]
+        x = decimator.plan(count, pixels, first, raw=2 if not level else 0) + first * scale / self.sampling_rate
+        lows = decimator.apply(self.lows[level].tail(written - first)[..., :count])
+        if level:
+            lows[..., 1::2] = decimator.apply(self.highs[level].tail(written - first)[..., :count])[..., 1::2]
+        return x, lows
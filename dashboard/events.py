@@ -5,11 +5,11 @@ from PyQt5 import QtCore
 
 class UDPDispatcherEvent(QtCore.QEvent):
     EVENT_TYPE = QtCore.QEvent.Type(QtCore.QEvent.registerEventType())
-    def __init__(self, adc_values: list, lost_packets: int):
+    def __init__(self, batch: object):
+        # batch.take() -> (adc_values: (channels, samples) float32 array, lost_packets)
         QtCore.QEvent.__init__(self, UDPDispatcherEvent.EVENT_TYPE)
-        self.time          = round(time.time() * 1000)
-        self.adc_values     = adc_values
-        self.lost_packets   = lost_packets
+        self.time           = round(time.time() * 1000)
+        self.batch          = batch
 
 
 class TCPDispatcherEvent(QtCore.QEvent):
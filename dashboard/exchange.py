@@ -0,0 +1,69 @@
+import struct
+import numpy as np
+from crc import *
+
+
+#
+# Exchange packet (9 bytes header + data), see ExchangeProtocol
+#
+# uint8_t   sync[2]             - offset 0; 0xAA,0xCC
+# uint8_t   event_code          - offset 2;
+# uint8_t   event_iter          - offset 3;
+# uint8_t   event_bits          - offset 4; resolution: 8, 16, 32
+# uint16_t  data_size           - offset 5; total data bytes
+# uint16_t  crc16               - offset 7; computed with this field = 0
+# uint8_t   * data...           - offset 9; little-endian values of event_bits
+# ----------------------------------------------------------------------------------
+EXCHANGE_PACKET_SYNC         = b'\xAA\xCC'
+EXCHANGE_PACKET_HEADER       = struct.Struct('<2sBBBHH')
+EXCHANGE_PACKET_CRC16        = struct.Struct('<H')
+EXCHANGE_PACKET_HEADER_SIZE  = EXCHANGE_PACKET_HEADER.size
+EXCHANGE_PACKET_CRC16_OFFSET = 7
+EXCHANGE_PAYLOAD_TYPES       = {
+    8   : np.dtype('<u1'),
+    16  : np.dtype('<u2'),
+    32  : np.dtype('<u4')
+}
+
+
+def exchange_payload_type(event_bits: int):
+    # Unknown resolutions are delivered as bytes
+    return EXCHANGE_PAYLOAD_TYPES.get(event_bits, EXCHANGE_PAYLOAD_TYPES[8])
+
+
+def exchange_pack_into(buffer: bytearray, data, event_code: int = 0, event_iter: int = 0, event_bits: int = 8, data_size: int = 0):
+    # Packs a packet at the start of buffer (len(buffer) >= 9 + data_size), returns the packet size.
+    # Values are truncated to event_bits as by a C cast, the rest of data_size is zero filled.
+    packet_size = EXCHANGE_PACKET_HEADER_SIZE + data_size
+    values = np.asarray(data, dtype=np.int64).astype(exchange_payload_type(event_bits))
+    if values.nbytes > data_size:
+        raise ValueError("exchange packet: {:d} values of {:d} bits exceed data_size {:d}".format(values.size, event_bits, data_size))
+
+    EXCHANGE_PACKET_HEADER.pack_into(buffer, 0, EXCHANGE_PACKET_SYNC, event_code, event_iter, event_bits, data_size, 0)
+    if values.size:
+        payload = np.frombuffer(buffer, dtype=values.dtype, count=values.size, offset=EXCHANGE_PACKET_HEADER_SIZE)
+        payload[:] = values
+        del payload
+    if values.nbytes < data_size:
+        buffer[EXCHANGE_PACKET_HEADER_SIZE + values.nbytes:packet_size] = bytes(data_size - values.nbytes)
+    EXCHANGE_PACKET_CRC16.pack_into(buffer, EXCHANGE_PACKET_CRC16_OFFSET, crc16(memoryview(buffer)[:packet_size]))
+    return packet_size
+
+
+def exchange_header(buffer, offset: int = 0):
+    # Returns (sync, event_code, event_iter, event_bits, data_size, crc16)
+    return EXCHANGE_PACKET_HEADER.unpack_from(buffer, offset)
+
+
+def exchange_crc16(buffer, offset: int, data_size: int):
+    # CRC of the packet at offset with its crc16 field taken as zero, the buffer is not modified
+    with memoryview(buffer) as view:
+        value = crc16(view[offset:offset + EXCHANGE_PACKET_CRC16_OFFSET])
+        value = crc16(b'\x00\x00', value)
+        return crc16(view[offset + EXCHANGE_PACKET_HEADER_SIZE:offset + EXCHANGE_PACKET_HEADER_SIZE + data_size], value)
+
+
+def exchange_payload(buffer, offset: int, event_bits: int, data_size: int):
+    # Returns the values of the packet at offset as a typed array (a copy, the buffer may be reused)
+    dtype = exchange_payload_type(event_bits)
+    return np.frombuffer(buffer, dtype=dtype, count=data_size // dtype.itemsize, offset=offset + EXCHANGE_PACKET_HEADER_SIZE).copy()
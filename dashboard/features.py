@@ -0,0 +1,99 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from ringbuffer import *
+from spectrum import *
+
+
+#
+# Feature extraction, all channels at once
+#
+# Every `hop` samples a feature frame of the last `window` samples is emitted:
+# band powers (V^2) of BANDS, variance (Hjorth activity), Hjorth mobility and
+# complexity, and normalized spectral entropy (0..1) of the band range.
+# Nothing is recomputed over the whole window: for every hop block the sums
+# of x, x^2, x', x'^2, x'', x''^2 are kept, and one periodogram of the last
+# `segment` samples is taken per hop (Welch over the window, segments overlap
+# by segment - hop). A frame sums window / hop block entries.
+# ----------------------------------------------------------------------------------
+FEATURES = list(BANDS) + ['variance', 'mobility', 'complexity', 'entropy']
+
+
+class FeatureExtractor():
+    def __init__(self, sampling_rate: int, channels: int, window: int, hop: int, segment: int = None, bands: dict = BANDS, window_name: str = 'hann', frames: int = 64):
+        self.sampling_rate  = sampling_rate
+        self.channels       = channels
+        self.hop            = hop
+        self.segment        = min(segment or sampling_rate, window)
+        self.bands          = bands
+        self.names          = list(bands) + FEATURES[len(BANDS):]
+        self.blocks         = max(1, window // hop)                         # moments of the window
+        self.periodograms   = max(1, (window - self.segment) // hop + 1)    # Welch segments of the window
+        self.window         = self.blocks * hop
+        self.pending        = 0
+        self.filled         = 0                                             # hops so far
+
+        # Cached window, bins and band masks
+        self.taper          = WINDOWS[window_name](self.segment)
+        self.freqs          = np.fft.rfftfreq(self.segment, 1 / sampling_rate)
+        self.scale          = np.full(len(self.freqs), 2 / (sampling_rate * (self.taper ** 2).sum()))
+        self.scale[0] /= 2
+        if self.segment % 2 == 0:
+            self.scale[-1] /= 2
+        self.masks          = np.array([(self.freqs >= low) & (self.freqs < high) for low, high in bands.values()], dtype=np.float64).T
+        low, high           = min(band[0] for band in bands.values()), max(band[1] for band in bands.values())
+        self.entropy_bins   = (self.freqs >= low) & (self.freqs < high)
+
+        self.history        = RingBuffer(max(self.segment, hop + 2), channels, dtype=np.float64)
+        self.moments        = np.zeros((self.blocks, 6, channels))
+        self.psd            = np.zeros((self.periodograms, channels, len(self.freqs)))
+        self.features       = np.zeros((channels, len(self.names)), dtype=np.float32)
+        self.frames         = RingBuffer(frames, (channels, len(self.names)))
+
+    def update(self, block: np.ndarray):
+        # block: (channels, samples); returns the number of new feature frames
+        count = 0
+        position = 0
+        while position < block.shape[-1]:
+            size = min(self.hop - self.pending, block.shape[-1] - position)
+            self.history.append(block[:, position:position + size])
+            self.pending += size
+            position += size
+            if self.pending == self.hop:
+                self.pending = 0
+                self.step()
+                count += 1
+        return count
+
+    def step(self):
+        # A hop block is complete: its moments and one periodogram, then the frame
+        x = self.history.tail(self.hop + 2)
+        d1 = np.diff(x, axis=-1)
+        d2 = np.diff(d1, axis=-1)
+        x, d1 = x[:, 2:], d1[:, 1:]
+        moments = self.moments[self.filled % self.blocks]
+        moments[0], moments[1] = x.sum(axis=-1), (x * x).sum(axis=-1)
+        moments[2], moments[3] = d1.sum(axis=-1), (d1 * d1).sum(axis=-1)
+        moments[4], moments[5] = d2.sum(axis=-1), (d2 * d2).sum(axis=-1)
+        self.psd[self.filled % self.periodograms] = np.abs(np.fft.rfft(self.history.tail(self.segment) * self.taper, axis=-1)) ** 2 * self.scale
+        self.filled += 1
+
+        # Frame of the window (or of what was received so far)
+        sums = self.moments.sum(axis=0) / (min(self.filled, self.blocks) * self.hop)
+        variance = np.maximum(sums[1] - sums[0] ** 2, 0)
+        variance_d1 = np.maximum(sums[3] - sums[2] ** 2, 0)
+        variance_d2 = np.maximum(sums[5] - sums[4] ** 2, 0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mobility = np.sqrt(variance_d1 / variance)
+            complexity = np.sqrt(variance_d2 / variance_d1) / mobility
+            psd = self.psd.sum(axis=0) / min(self.filled, self.periodograms)
+            band_powers = psd @ self.masks * (self.freqs[1] - self.freqs[0])
+            p = psd[:, self.entropy_bins]
+            p = p / p.sum(axis=-1, keepdims=True)
+            entropy = -np.where(p > 0, p * np.log2(p), 0).sum(axis=-1) / np.log2(p.shape[-1])
+        features = np.column_stack([band_powers, variance, mobility, complexity, entropy])
+        self.features = np.nan_to_num(features, nan=0.0, posinf=0.0).astype(np.float32)
+        self.frames.append(self.features[..., None])
+
+    def feature(self, name: str):
+        # (channels,) values of one feature of the last frame
+        return self.features[:, self.names.index(name)]
@@ -0,0 +1,141 @@
+import numpy as np
+
+
+#
+# Butterworth lowpass as cascaded second-order sections
+#
+# sections: (n, 6) array of [b0, b1, b2, 1, a1, a2] rows, DC gain = 1
+# ----------------------------------------------------------------------------------
+def butter_lowpass_sos(order: int, fcut: float, sampling_rate: float):
+    fs2 = 2.0 * sampling_rate
+    # Prewarped analog prototype poles (left half-plane) -> bilinear transform
+    warped = fs2 * np.tan(np.pi * fcut / sampling_rate)
+    poles = warped * np.exp(1j * np.pi * (2 * np.arange(order) + order + 1) / (2 * order))
+    poles = (fs2 + poles) / (fs2 - poles)
+
+    sections = []
+    for pole in sorted(poles[poles.imag > 0], key=lambda pole: abs(pole)):
+        a1, a2 = -2.0 * pole.real, abs(pole) ** 2
+        gain = (1.0 + a1 + a2) / 4.0
+        sections.append([gain, 2.0 * gain, gain, 1.0, a1, a2])
+    if order % 2:
+        pole = poles[np.argmin(np.abs(poles.imag))].real
+        gain = (1.0 - pole) / 2.0
+        sections.append([gain, gain, 0.0, 1.0, -pole, 0.0])
+    return np.array(sections)
+
+
+def sos_to_tf(sections: np.ndarray):
+    # Returns direct-form (b, a) polynomials of the cascade
+    b, a = np.ones(1), np.ones(1)
+    for section in sections:
+        b = np.convolve(b, section[:3])
+        a = np.convolve(a, section[3:])
+    return b, a
+
+
+def sos_step(sections: np.ndarray, state: np.ndarray, x: float):
+    # One sample through the cascade (transposed direct form II), state: (sections * 2, )
+    for idx, (b0, b1, b2, _, a1, a2) in enumerate(sections):
+        z1, z2 = state[2 * idx], state[2 * idx + 1]
+        y = b0 * x + z1
+        state[2 * idx] = b1 * x - a1 * y + z2
+        state[2 * idx + 1] = b2 * x - a2 * y
+        x = y
+    return x
+
+
+#
+# Multichannel IIR filter engine
+#
+# The cascade is turned into its state-space form (A, B, C, D) once, then a
+# block of samples of all channels is filtered with a few matrix products:
+#   y       = x @ H.T + s @ O.T     H - impulse response (Toeplitz), O - C * A^n
+#   s_next  = s @ A^N.T + x @ K.T   K - A^(N-1-k) * B
+# The state is kept per channel between blocks, so the output is identical
+# to a continuous stream.
+# ----------------------------------------------------------------------------------
+class SOSFilter():
+    BLOCK_SIZE = 128
+
+    def __init__(self, sections: np.ndarray, channels: int, block_size: int = BLOCK_SIZE):
+        self.channels   = channels
+        self.block_size = block_size
+        self.state      = None
+        self.last_x     = np.zeros(channels)
+        self.set_sections(sections)
+
+    @staticmethod
+    def state_space(sections: np.ndarray):
+        # Columns are found by stepping the cascade once from basis states/inputs
+        size = 2 * len(sections)
+        a = np.zeros((size, size))
+        b = np.zeros(size)
+        c = np.zeros(size)
+        for idx in range(size):
+            state = np.zeros(size)
+            state[idx] = 1.0
+            c[idx] = sos_step(sections, state, 0.0)
+            a[:, idx] = state
+        state = np.zeros(size)
+        d = sos_step(sections, state, 1.0)
+        b[:] = state
+        return a, b, c, d
+
+    def set_sections(self, sections: np.ndarray):
+        self.sections = np.asarray(sections, dtype=np.float64)
+        self.a, self.b, self.c, self.d = self.state_space(self.sections)
+        self.blocks = {}
+        size = len(self.b)
+        if self.state is None or self.state.shape[1] != size:
+            self.state = np.zeros((self.channels, size))
+        else:
+            # No transient reset: steady state of the new filter for the last input
+            self.reset(self.last_x)
+
+    def reset(self, x: np.ndarray):
+        # Steady state for a constant input x (channels, ), as after a long run of it
+        self.last_x = np.array(x, dtype=np.float64)
+        self.state = np.outer(self.last_x, np.linalg.solve(np.eye(len(self.b)) - self.a, self.b))
+
+    def block(self, length: int):
+        matrices = self.blocks.get(length)
+        if matrices is None:
+            size = len(self.b)
+            powers = [np.eye(size)]
+            for _ in range(length):
+                powers.append(self.a @ powers[-1])
+            response = np.array([self.d] + [self.c @ powers[m - 1] @ self.b for m in range(1, length)])
+            h = np.zeros((length, length))
+            for m in range(length):
+                h[m:, m] = response[:length - m]
+            o = np.array([self.c @ powers[n] for n in range(length)])
+            k = np.array([powers[length - 1 - m] @ self.b for m in range(length)]).T
+            matrices = self.blocks[length] = (h.T.copy(), o.T.copy(), powers[length].T.copy(), k.T.copy())
+        return matrices
+
+    def process(self, x: np.ndarray):
+        # x: (channels, samples) -> filtered (channels, samples) float32
+        x = np.asarray(x, dtype=np.float64)
+        y = np.empty(x.shape, dtype=np.float32)
+        for start in range(0, x.shape[-1], self.block_size):
+            chunk = x[:, start:start + self.block_size]
+            h, o, an, k = self.block(chunk.shape[-1])
+            y[:, start:start + chunk.shape[-1]] = chunk @ h + self.state @ o
+            self.state = self.state @ an + chunk @ k
+        if x.shape[-1]:
+            self.last_x = x[:, -1].copy()
+        return y
+
+
+class ButterworthFilter(SOSFilter):
+    def __init__(self, order: int, fcut: float, sampling_rate: float, channels: int, block_size: int = SOSFilter.BLOCK_SIZE):
+        self.order          = order
+        self.fcut           = fcut
+        self.sampling_rate  = sampling_rate
+        super(ButterworthFilter, self).__init__(butter_lowpass_sos(order, fcut, sampling_rate), channels, block_size)
+
+    def set_cutoff(self, fcut: float):
+        if fcut != self.fcut:
+            self.fcut = fcut
+            self.set_sections(butter_lowpass_sos(self.order, fcut, self.sampling_rate))
@@ -0,0 +1,193 @@
+import time
+from crc import *
+from metrics import *
+from ad7606 import *
+from exchange import *
+
+
+#
+# Batch packet scanner
+#
+# Consumes the UDP byte stream with a moving read offset, jumps between sync
+# positions with bytearray.find() and validates all candidates of a pass with
+# one bulk CRC16. Consumed bytes are compacted only occasionally.
+# ----------------------------------------------------------------------------------
+class BatchScanner():
+    COMPACT_SIZE = 64 * 1024
+
+    def __init__(self, packet_size: int = BATCH_PACKET_SIZE, sync: bytes = BATCH_PACKET_SYNC, compact_size: int = COMPACT_SIZE):
+        self.packet_size    = packet_size
+        self.sync           = sync
+        self.compact_size   = compact_size
+        self.buffer         = bytearray()
+        self.offset         = 0
+        self.prev_crc16     = 0
+
+        # Counters
+        self.packets        = 0
+        self.resyncs        = 0
+        self.skipped_bytes  = 0
+        self.bad_crc16      = 0
+        self.duplicates     = 0
+
+    def pending(self):
+        return len(self.buffer) - self.offset
+
+    def feed(self, data):
+        if self.offset == len(self.buffer) or self.offset >= self.compact_size:
+            del self.buffer[:self.offset]
+            self.offset = 0
+        self.buffer += data
+
+    def frames(self):
+        # Yields memoryviews of valid packets; a view is only valid until the next iteration
+        self.offset = yield from self.scan(self.buffer, self.offset, len(self.buffer))
+
+    def frames_from(self, buffer: bytearray, start: int, end: int):
+        # Zero-copy variant of feed() + frames() for a region of an external buffer:
+        # packets are yielded straight from `buffer`, only an incomplete tail is copied.
+        if self.pending():
+            with memoryview(buffer)[start:end] as data:
+                self.feed(data)
+            yield from self.frames()
+            return
+        offset = yield from self.scan(buffer, start, end)
+        if offset < end:
+            with memoryview(buffer)[offset:end] as data:
+                self.feed(data)
+
+    def scan(self, buffer: bytearray, offset: int, end: int):
+        # Returns the new read offset
+        size  = self.packet_size
+        last  = end - size
+        if last < offset:
+            return offset
+
+        candidates = []
+        position = buffer.find(self.sync, offset, last + len(self.sync))
+        while position >= 0:
+            candidates.append(position)
+            position = buffer.find(self.sync, position + 1, last + len(self.sync))
+        if METRICS.enabled and candidates:
+            since = time.perf_counter_ns()
+            valid = crc16_check_many(buffer, candidates, size)
+            METRICS.observe('crc', time.perf_counter_ns() - since)
+        else:
+            valid = crc16_check_many(buffer, candidates, size) if candidates else []
+
+        for position, is_valid in zip(candidates, valid):
+            # Sync inside an already accepted packet
+            if position < offset:
+                continue
+            if not is_valid:
+                self.bad_crc16 += 1
+                continue
+            self.skip(offset, position)
+            offset = position + size
+            # Fix ESP8266 bug!!!
+            # Skip dublicate neighboring packets
+            crc16 = buffer[position + size - 2] | (buffer[position + size - 1] << 8)
+            if crc16 == self.prev_crc16:
+                self.duplicates += 1
+                continue
+            self.prev_crc16 = crc16
+            self.packets += 1
+            with memoryview(buffer)[position:position + size] as packet:
+                yield packet
+
+        # No packet starts before `last + 1` anymore
+        self.skip(offset, last + 1)
+        return max(offset, last + 1)
+
+    def skip(self, offset: int, position: int):
+        if position > offset:
+            self.resyncs += 1
+            self.skipped_bytes += position - offset
+
+    def stats(self):
+        return {
+            'packets'       : self.packets,
+            'resyncs'       : self.resyncs,
+            'skipped_bytes' : self.skipped_bytes,
+            'bad_crc16'     : self.bad_crc16,
+            'duplicates'    : self.duplicates
+        }
+
+
+#
+# Exchange packet reader, one per TCP connection
+#
+# Reassembles the stream with a read cursor: the header is parsed once and
+# then the reader waits until the whole data_size has arrived, the CRC16 is
+# checked on a memoryview. As ExchangeProtocol.recv, a frame with a bad
+# CRC16 is skipped as a whole.
+# ----------------------------------------------------------------------------------
+class ExchangeFrameReader():
+    COMPACT_SIZE = 64 * 1024
+
+    def __init__(self, compact_size: int = COMPACT_SIZE):
+        self.compact_size   = compact_size
+        self.buffer         = bytearray()
+        self.offset         = 0
+        self.awaiting       = EXCHANGE_PACKET_HEADER_SIZE
+        self.since          = time.perf_counter()
+
+        # Counters
+        self.packets        = 0
+        self.bytes          = 0
+        self.resyncs        = 0
+        self.skipped_bytes  = 0
+        self.bad_crc16      = 0
+
+    def pending(self):
+        return len(self.buffer) - self.offset
+
+    def feed(self, data):
+        if self.offset == len(self.buffer) or self.offset >= self.compact_size:
+            del self.buffer[:self.offset]
+            self.offset = 0
+        self.buffer += data
+        self.bytes += len(data)
+
+    def frames(self):
+        # Yields (event_code, event_iter, event_bits, data) of valid packets, data: typed array
+        buffer = self.buffer
+        end = len(buffer)
+        while end - self.offset >= self.awaiting:
+            position = buffer.find(EXCHANGE_PACKET_SYNC, self.offset, end)
+            if position < 0:
+                # Keep a possible first sync byte
+                position = end - 1 if buffer[end - 1] == EXCHANGE_PACKET_SYNC[0] else end
+            if position > self.offset:
+                self.resyncs += 1
+                self.skipped_bytes += position - self.offset
+                self.offset = position
+            if end - position < EXCHANGE_PACKET_HEADER_SIZE:
+                self.awaiting = EXCHANGE_PACKET_HEADER_SIZE
+                break
+
+            sync, event_code, event_iter, event_bits, data_size, crc16 = exchange_header(buffer, position)
+            self.awaiting = EXCHANGE_PACKET_HEADER_SIZE + data_size
+            if end - position < self.awaiting:
+                break
+
+            self.offset = position + self.awaiting
+            self.awaiting = EXCHANGE_PACKET_HEADER_SIZE
+            if crc16 != exchange_crc16(buffer, position, data_size):
+                self.bad_crc16 += 1
+                self.skipped_bytes += EXCHANGE_PACKET_HEADER_SIZE + data_size
+                continue
+            self.packets += 1
+            yield event_code, event_iter, event_bits, exchange_payload(buffer, position, event_bits, data_size)
+
+    def stats(self):
+        elapsed = time.perf_counter() - self.since
+        return {
+            'packets'           : self.packets,
+            'packets_per_second': self.packets / elapsed if elapsed else 0.0,
+            'bytes'             : self.bytes,
+            'pending'           : self.pending(),
+            'resyncs'           : self.resyncs,
+            'skipped_bytes'     : self.skipped_bytes,
+            'bad_crc16'         : self.bad_crc16
+        }
@@ -0,0 +1,285 @@
+import copy
+import time
+import wave
+import socket
+import argparse
+import threading
+import numpy as np
+from crc import *
+from ad7606 import *
+from recorder import *
+from dispatchers import UDPDispatcher
+from acquisition import load_config
+
+
+#
+# AD7606/ESP8266 batch packet generator
+#
+# Builds batch_packet_t frames exactly as firmwares/sources/main.c does: sync
+# 0xAA,0xBB, rolling 8-bit counter, interleaved int16 samples and CRC16 over
+# the packet with the CRC field zeroed. Samples come from a recording (WAV or
+# chunks, looped) or from a synthetic signal: per channel sines + noise.
+# With `marker`, sample 0 of that channel carries the 16-bit packet sequence
+# number, so a receiver can match decoded batches to sent packets.
+# ----------------------------------------------------------------------------------
+def batch_packet(counter: int, frames: np.ndarray, packet: bytearray = None):
+    # frames: (samples, channels) int16; returns the packet bytearray
+    packet = packet if packet is not None else bytearray(BATCH_PACKET_SIZE)
+    packet[0:2] = BATCH_PACKET_SYNC
+    packet[2] = counter & 0xFF
+    packet[BATCH_PACKET_VALUES:BATCH_PACKET_CRC16] = np.ascontiguousarray(frames, dtype='<i2').tobytes()
+    crc16 = int(crc16_many(packet, [0], BATCH_PACKET_SIZE, zeros=2)[0])
+    packet[BATCH_PACKET_CRC16:BATCH_PACKET_SIZE] = crc16.to_bytes(2, 'little')
+    return packet
+
+
+def load_frames(path: str, channels: int = BATCH_PACKET_CHANNELS):
+    # int16 (samples, channels) of a Recorder file: <path>.wav or <path> of a chunks recording
+    if path.endswith('.wav'):
+        with wave.open(path, 'r') as wave_file:
+            frames = np.frombuffer(wave_file.readframes(wave_file.getnframes()), dtype='<i2').reshape(-1, wave_file.getnchannels())
+    else:
+        frames, index = load_chunks(path)
+    assert len(frames) and frames.shape[1] >= channels
+    return np.ascontiguousarray(frames[:, :channels])
+
+
+class BatchGenerator():
+    # Synthetic signal, ADC units: (frequency Hz, amplitude) per channel + gaussian noise
+    SIGNAL = [(10.0, 2000), (20.0, 1000), (50.0, 500), (6.0, 3000), (40.0, 800)]
+    NOISE  = 200
+
+    def __init__(self, config, frames: np.ndarray = None, marker: int = None, seed: int = 0):
+        self.sampling_rate  = int(config['adc']['sampling_rate'])
+        self.channels       = int(config['adc']['channels'])
+        self.samples        = int(config['dataset']['batch_samples'])
+        assert self.channels * self.samples == BATCH_PACKET_CHANNELS * BATCH_PACKET_SAMPLES
+        self.frames         = frames
+        self.marker         = marker
+        self.rng            = np.random.default_rng(seed)
+        self.sample         = 0
+        self.sequence       = 0
+
+    def next_frames(self):
+        if self.frames is not None:
+            idx = np.arange(self.sample, self.sample + self.samples) % len(self.frames)
+            frames = self.frames[idx]
+        else:
+            t = np.arange(self.sample, self.sample + self.samples) / self.sampling_rate
+            frames = self.rng.normal(0, self.NOISE, size=(self.samples, self.channels))
+            for channel in range(self.channels):
+                frequency, amplitude = self.SIGNAL[channel % len(self.SIGNAL)]
+                frames[:, channel] += amplitude * np.sin(2 * np.pi * frequency * t + channel)
+            frames = np.clip(np.rint(frames), -32768, 32767).astype('<i2')
+        if self.marker is not None:
+            frames[0, self.marker] = np.int16(np.uint16(self.sequence & 0xFFFF).view(np.int16))
+        self.sample += self.samples
+        return frames
+
+    def packet(self):
+        # The next packet; the counter is the low byte of the sequence number, as in the firmware
+        packet = batch_packet(self.sequence, self.next_frames())
+        self.sequence += 1
+        return packet
+
+
+def batch_marker(adc_values: np.ndarray, scale, marker: int):
+    # Sequence number of a decoded (channels, samples) batch of a marked generator
+    return int(np.uint16(np.int16(np.rint(adc_values[marker, 0] / scale))))
+
+
+#
+# Link impairments
+#
+# apply(sequence, packet) returns the datagrams to send for one packet:
+#   loss      - the packet is not sent
+#   duplicate - the packet is sent twice in a row (ESP8266 bug)
+#   reorder   - the packet is held back and sent after the next one
+#   corrupt   - one random byte of the packet is flipped
+# Each datagram is a (sequence, bytes) pair.
+# ----------------------------------------------------------------------------------
+class Impairments():
+    def __init__(self, loss: float = 0.0, duplicate: float = 0.0, reorder: float = 0.0, corrupt: float = 0.0, seed: int = 0):
+        self.loss           = loss
+        self.duplicate      = duplicate
+        self.reorder        = reorder
+        self.corrupt        = corrupt
+        self.rng            = np.random.default_rng(seed)
+        self.held           = None
+
+        # Counters
+        self.packets        = 0
+        self.dropped        = 0
+        self.duplicated     = 0
+        self.reordered      = 0
+        self.corrupted      = 0
+
+    def apply(self, sequence: int, packet: bytes):
+        self.packets += 1
+        datagrams = []
+        if self.rng.random() < self.loss:
+            self.dropped += 1
+        else:
+            if self.rng.random() < self.corrupt:
+                packet = bytearray(packet)
+                packet[int(self.rng.integers(0, len(packet)))] ^= int(self.rng.integers(1, 256))
+                self.corrupted += 1
+            datagrams.append((sequence, bytes(packet)))
+            if self.rng.random() < self.duplicate:
+                datagrams.append((sequence, bytes(packet)))
+                self.duplicated += 1
+        if self.held is not None:
+            datagrams.extend(self.held)
+            self.held = None
+        elif datagrams and self.rng.random() < self.reorder:
+            self.held, datagrams = datagrams, []
+            self.reordered += 1
+        return datagrams
+
+    def flush(self):
+        held, self.held = self.held or [], None
+        return held
+
+    def stats(self):
+        return {
+            'packets'       : self.packets,
+            'dropped'       : self.dropped,
+            'duplicated'    : self.duplicated,
+            'reordered'     : self.reordered,
+            'corrupted'     : self.corrupted
+        }
+
+
+#
+# Packet sender
+#
+# Sends `count` generated packets to `address` at `speed` x real time
+# (sampling_rate / batch_samples packets/s); speed 0 - as fast as possible.
+# sent[sequence] is the perf_counter() of the first datagram of a packet.
+# ----------------------------------------------------------------------------------
+class PacketSender(threading.Thread):
+    def __init__(self, generator: BatchGenerator, address, count: int, speed: float = 1.0, impairments: Impairments = None, name = 'PacketSenderThread'):
+        super(PacketSender, self).__init__(name=name)
+        self.generator = generator
+        self.address = address
+        self.count = count
+        self.period = generator.samples / generator.sampling_rate / speed if speed else 0.0
+        self.impairments = impairments or Impairments()
+        self.socket = socket.socket(family=socket.AF_INET, type=socket.SOCK_DGRAM)
+        self.thread_stop = False
+        self.sent = {}
+
+        # Counters
+        self.datagrams = 0
+        self.elapsed = 0.0
+
+    def stop(self):
+        self.thread_stop = True
+
+    def send(self, datagrams: list):
+        for sequence, datagram in datagrams:
+            self.sent.setdefault(sequence, time.perf_counter())
+            self.socket.sendto(datagram, self.address)
+            self.datagrams += 1
+
+    def run(self):
+        since = time.perf_counter()
+        for idx in range(self.count):
+            if self.thread_stop:
+                break
+            if self.period:
+                delay = since + idx * self.period - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            sequence = self.generator.sequence
+            self.send(self.impairments.apply(sequence, self.generator.packet()))
+        self.send(self.impairments.flush())
+        self.elapsed = time.perf_counter() - since
+        self.socket.close()
+
+
+#
+# Loopback load test of UDPDispatcher
+#
+# Runs a marked generator against a UDPDispatcher on 127.0.0.1 and returns
+# decode throughput, delivery latency percentiles (sendto -> on_batch) and
+# the dispatcher's lost_packets against the packets that really never arrived.
+# ----------------------------------------------------------------------------------
+def load_test(config, count: int = 2000, speed: float = 0.0, impairments: Impairments = None, frames: np.ndarray = None, settle: float = 0.3):
+    config = copy.deepcopy(config)
+    probe = socket.socket(family=socket.AF_INET, type=socket.SOCK_DGRAM)
+    probe.bind(('127.0.0.1', 0))
+    port = probe.getsockname()[1]
+    probe.close()
+    config['network']['udp_dispatcher'].update({ 'ip' : '127.0.0.1', 'port' : port })
+    config['network']['udp_dispatcher'].pop('devices', None)
+
+    scale = ad7606_scale(int(config['adc']['range']), float(config['adc']['vref']))
+    marker = int(config['adc']['channels']) - 1
+    received = {}
+    reported = [0, 0]       # batches, lost_packets
+    last = [time.perf_counter()]
+
+    def on_batch(adc_values, lost_packets, device):
+        now = last[0] = time.perf_counter()
+        received.setdefault(batch_marker(adc_values, scale, marker), now)
+        reported[0] += 1
+        reported[1] += lost_packets
+
+    dispatcher = UDPDispatcher(config, on_batch=on_batch)
+    dispatcher.start()
+    sender = PacketSender(BatchGenerator(config, frames=frames, marker=marker), ('127.0.0.1', port), count, speed, impairments)
+    sender.start()
+    sender.join()
+    last[0] = max(last[0], time.perf_counter())
+    while time.perf_counter() - last[0] < settle:
+        time.sleep(settle / 10)
+    dispatcher.stop()
+    dispatcher.join()
+
+    latency = np.array([received[sequence] - sender.sent[sequence] for sequence in received if sequence in sender.sent])
+    delivered = len(received)
+    first, last_sequence = (min(received), max(received)) if received else (0, -1)
+    # Packets the dispatcher can account for: between the first and the last delivered ones
+    expected = last_sequence - first + 1
+    return {
+        'packets'           : count,
+        'datagrams'         : sender.datagrams,
+        'delivered'         : delivered,
+        'batches'           : reported[0],
+        'packets_per_second': reported[0] / sender.elapsed if sender.elapsed else 0.0,
+        'latency_p50_us'    : float(np.percentile(latency, 50) * 1e6) if len(latency) else 0.0,
+        'latency_p99_us'    : float(np.percentile(latency, 99) * 1e6) if len(latency) else 0.0,
+        'latency_max_us'    : float(latency.max() * 1e6) if len(latency) else 0.0,
+        'lost_actual'       : expected - delivered,
+        'lost_reported'     : reported[1],
+        'impairments'       : sender.impairments.stats()
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='AD7606/ESP8266 batch packet generator and UDPDispatcher loopback load test')
+    parser.add_argument('--config', default='config.json')
+    parser.add_argument('--source', help='recorded signal: <tm>.wav or <tm> of a chunks recording, synthetic by default')
+    parser.add_argument('--send', metavar='IP:PORT', help='send to a running dashboard instead of the loopback load test')
+    parser.add_argument('--count', type=int, default=2000)
+    parser.add_argument('--speed', type=float, default=1.0, help='x real time, 0 - as fast as possible')
+    parser.add_argument('--loss', type=float, default=0.0)
+    parser.add_argument('--duplicate', type=float, default=0.0)
+    parser.add_argument('--reorder', type=float, default=0.0)
+    parser.add_argument('--corrupt', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    config = load_config(args.config)
+    frames = load_frames(args.source, int(config['adc']['channels'])) if args.source else None
+    impairments = Impairments(args.loss, args.duplicate, args.reorder, args.corrupt, args.seed)
+    if args.send:
+        ip, port = args.send.rsplit(':', 1)
+        sender = PacketSender(BatchGenerator(config, frames=frames, seed=args.seed), (ip, int(port)), args.count, args.speed, impairments)
+        sender.start()
+        sender.join()
+        print("sent", sender.datagrams, "datagrams in", round(sender.elapsed, 2), "s", impairments.stats())
+    else:
+        for key, value in load_test(config, args.count, args.speed, impairments, frames).items():
+            print("{:<20s} {}".format(key, value))
@@ -0,0 +1,265 @@
+import time
+import argparse
+import threading
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from dispatchers import ExchangeProtocol
+from ringbuffer import *
+from features import *
+from filters import *
+from metrics import *
+
+
+# Model classes, same order as DATASET_LABELS ('UDLR')
+INFERENCE_EVENTS = [ExchangeProtocol.GAME_EVENT_UP, ExchangeProtocol.GAME_EVENT_DOWN, ExchangeProtocol.GAME_EVENT_LEFT, ExchangeProtocol.GAME_EVENT_RIGHT]
+
+
+def softmax(scores: np.ndarray):
+    scores = scores - scores.max()
+    exp = np.exp(scores)
+    return exp / exp.sum()
+
+
+#
+# Models
+#
+# predict(x) returns class probabilities (classes,). `input` is what the
+# model is fed with: 'features' - a FeatureExtractor frame (channels, FEATURES),
+# 'window' - the last `window` filtered samples (channels, window).
+# Models are stored as .npz with a `kind` entry, see load_model().
+# ----------------------------------------------------------------------------------
+class LinearModel():
+    # softmax(W @ standardized(log(features)) + b); fit_lda() trains it as shrinkage LDA
+    input = 'features'
+
+    def __init__(self, weights: np.ndarray, bias: np.ndarray, mean: np.ndarray, std: np.ndarray, log: bool = True):
+        self.weights    = np.asarray(weights, dtype=np.float64)
+        self.bias       = np.asarray(bias, dtype=np.float64)
+        self.mean       = np.asarray(mean, dtype=np.float64)
+        self.std        = np.asarray(std, dtype=np.float64)
+        self.log        = bool(log)
+
+    def transform(self, x: np.ndarray):
+        x = np.asarray(x, dtype=np.float64).reshape(-1)
+        return np.log(np.maximum(x, 1e-12)) if self.log else x
+
+    def predict(self, x: np.ndarray):
+        return softmax(self.weights @ ((self.transform(x) - self.mean) / self.std) + self.bias)
+
+    @classmethod
+    def fit_lda(cls, X: np.ndarray, y: np.ndarray, classes: int = len(INFERENCE_EVENTS), shrinkage: float = 0.1, log: bool = True):
+        # X: (epochs, ...) model inputs, y: class indices; shared covariance shrunk towards its mean variance
+        model = cls(np.zeros((classes, 1)), np.zeros(classes), 0, 1, log)
+        X = np.array([model.transform(x) for x in X])
+        model.mean, model.std = X.mean(axis=0), X.std(axis=0) + 1e-12
+        X = (X - model.mean) / model.std
+        means = np.array([X[y == label].mean(axis=0) if np.any(y == label) else np.zeros(X.shape[1]) for label in range(classes)])
+        covariance = np.cov((X - means[y]).T).reshape(X.shape[1], X.shape[1])
+        covariance = (1 - shrinkage) * covariance + shrinkage * np.eye(len(covariance)) * np.trace(covariance) / len(covariance)
+        priors = np.array([max(np.mean(y == label), 1e-3) for label in range(classes)])
+        model.weights = np.linalg.solve(covariance, means.T).T
+        model.bias = -0.5 * np.einsum('ij,ij->i', model.weights, means) + np.log(priors)
+        return model
+
+    def save(self, path: str):
+        np.savez(path, kind='linear', weights=self.weights, bias=self.bias, mean=self.mean, std=self.std, log=self.log)
+
+
+class CNNModel():
+    # Decimation, 1-D convolution (filters, channels, kernel), ReLU, global average pooling, dense
+    input = 'window'
+
+    def __init__(self, kernels: np.ndarray, conv_bias: np.ndarray, weights: np.ndarray, bias: np.ndarray, decimate: int = 1):
+        self.kernels    = np.asarray(kernels, dtype=np.float32)
+        self.conv_bias  = np.asarray(conv_bias, dtype=np.float32)
+        self.weights    = np.asarray(weights, dtype=np.float32)
+        self.bias       = np.asarray(bias, dtype=np.float32)
+        self.decimate   = int(decimate)
+
+    def predict(self, x: np.ndarray):
+        x = np.asarray(x, dtype=np.float32)[:, ::self.decimate]
+        windows = sliding_window_view(x, self.kernels.shape[-1], axis=-1)              # (channels, steps, kernel)
+        activations = np.maximum(np.einsum('csk,fck->fs', windows, self.kernels, optimize=True) + self.conv_bias[:, None], 0)
+        return softmax(self.weights @ activations.mean(axis=-1) + self.bias)
+
+    def save(self, path: str):
+        np.savez(path, kind='cnn', kernels=self.kernels, conv_bias=self.conv_bias, weights=self.weights, bias=self.bias, decimate=self.decimate)
+
+
+def load_model(path: str):
+    with np.load(path) as model:
+        kind = str(model['kind'])
+        if kind == 'linear':
+            return LinearModel(model['weights'], model['bias'], model['mean'], model['std'], bool(model['log']))
+        if kind == 'cnn':
+            return CNNModel(model['kernels'], model['conv_bias'], model['weights'], model['bias'], int(model['decimate']))
+    raise ValueError("Unknown model kind: " + kind)
+
+
+#
+# Inference service
+#
+# Subscribes to an Acquisition, feeds the model of one device with feature
+# frames or with a sliding window of filtered samples (every `hop` samples),
+# and sends the direction event of a prediction to the abonent: payload is
+# the confidence, %. An event is sent if its probability >= threshold and
+# `cooldown` s passed since the previous one.
+# The model runs in its own thread on the newest input only: an input not
+# taken before the next one arrives is dropped. Latency is measured from the
+# arrival of the batch with the last sample to the event queued for sending;
+# latencies over `budget` s are counted. With METRICS enabled the stages
+# 'inference' and 'event' are stamped on the batch stamps (since UDP recv).
+# ----------------------------------------------------------------------------------
+class InferenceService(threading.Thread):
+    LATENCIES = 4096
+
+    def __init__(self, acquisition, model, abonent: str = 'game', device: int = 0, threshold: float = 0.6, cooldown: float = 0.5,
+                 budget: float = 0.05, window: int = None, hop: int = None, name = 'InferenceThread'):
+        super(InferenceService, self).__init__(name=name)
+        self.acquisition = acquisition
+        self.model = model
+        self.abonent = abonent
+        self.device = device
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.budget = budget
+
+        self.lock = threading.Condition()
+        self.input = None
+        self.thread_stop = False
+        self.last_event = -cooldown
+        self.event_iter = 0
+
+        self.hop = hop or acquisition.batch_samples
+        self.pending = 0
+        self.window = RingBuffer(window or acquisition.sampling_rate * acquisition.sampling_time, acquisition.adc_channels) if model.input == 'window' else None
+
+        # Counters
+        self.inferences     = 0
+        self.events         = 0
+        self.dropped        = 0
+        self.budget_misses  = 0
+        self.latency        = RingBuffer(self.LATENCIES, dtype=np.float64)
+        self.model_time     = RingBuffer(self.LATENCIES, dtype=np.float64)
+
+        if model.input == 'features':
+            acquisition.subscribe(on_features = self.on_features)
+        else:
+            acquisition.subscribe(on_batch = self.on_batch)
+
+    def stop(self):
+        with self.lock:
+            self.thread_stop = True
+            self.lock.notify()
+
+    def submit(self, x: np.ndarray, stamp: float):
+        stamps = METRICS.current() if METRICS.enabled else None
+        with self.lock:
+            if self.input is not None:
+                self.dropped += 1
+            self.input = (x, stamp, dict(stamps) if stamps else None)
+            self.lock.notify()
+
+    def on_features(self, features: np.ndarray, device: int):
+        if device == self.device:
+            self.submit(features, time.perf_counter())
+
+    def on_batch(self, adc_values: np.ndarray, filtered: np.ndarray, lost_packets: int, device: int):
+        if device != self.device:
+            return
+        stamp = time.perf_counter()
+        self.window.append(filtered)
+        self.pending += filtered.shape[-1]
+        if self.pending >= self.hop:
+            self.pending %= self.hop
+            self.submit(self.window.view().copy(), stamp)
+
+    def stats(self):
+        count = min(self.inferences, self.LATENCIES)
+        latency = self.latency.tail(count) * 1e3
+        model_time = self.model_time.tail(count) * 1e3
+        return {
+            'inferences'        : self.inferences,
+            'events'            : self.events,
+            'dropped'           : self.dropped,
+            'budget_misses'     : self.budget_misses,
+            'latency_p50_ms'    : float(np.percentile(latency, 50)) if count else 0.0,
+            'latency_p99_ms'    : float(np.percentile(latency, 99)) if count else 0.0,
+            'model_p50_ms'      : float(np.percentile(model_time, 50)) if count else 0.0
+        }
+
+    def run(self):
+        while True:
+            with self.lock:
+                self.lock.wait_for(lambda: self.input is not None or self.thread_stop)
+                if self.thread_stop:
+                    break
+                (x, stamp, stamps), self.input = self.input, None
+
+            since = time.perf_counter()
+            probabilities = self.model.predict(x)
+            now = time.perf_counter()
+            if stamps:
+                METRICS.stamp(stamps, 'inference')
+            label = int(np.argmax(probabilities))
+            if probabilities[label] >= self.threshold and now - self.last_event >= self.cooldown:
+                self.last_event = now
+                if self.acquisition.send_event(self.abonent, INFERENCE_EVENTS[label], self.event_iter, 8, 1, [int(probabilities[label] * 100)]):
+                    self.event_iter = (self.event_iter + 1) % 256
+                    self.events += 1
+                now = time.perf_counter()
+                if stamps:
+                    METRICS.stamp(stamps, 'event')
+
+            latency = now - stamp
+            self.latency.append(np.array([latency]))
+            self.model_time.append(np.array([now - since]))
+            self.inferences += 1
+            if latency > self.budget:
+                self.budget_misses += 1
+
+
+def epoch_features(epochs: np.ndarray, sampling_rate: int, window: int, hop: int, segment: int, iir: SOSFilter = None):
+    # The last FeatureExtractor frame of every epoch (channels, samples), volts. The live service
+    # extracts features of the IIR filtered values: with `iir`, every epoch is filtered first,
+    # from the steady state of its first sample
+    frames = []
+    for epoch in epochs:
+        if iir is not None:
+            iir.reset(epoch[:, 0])
+            epoch = iir.process(epoch)
+        extractor = FeatureExtractor(sampling_rate, epoch.shape[0], window, hop, segment)
+        extractor.update(epoch)
+        frames.append(extractor.features.copy())
+    return np.array(frames)
+
+
+if __name__ == '__main__':
+    from dataset import *
+
+    parser = argparse.ArgumentParser(description='Train an LDA model on an epoch dataset for the inference service')
+    parser.add_argument('dataset', help='epoch dataset directory (dataset.py)')
+    parser.add_argument('model', help='output .npz')
+    parser.add_argument('--config', default='config.json')
+    parser.add_argument('--shrinkage', type=float, default=0.1)
+    args = parser.parse_args()
+
+    from acquisition import load_config
+    config = load_config(args.config)
+    features = config['dataset'].get('features', { 'window' : 2000, 'hop' : 100, 'segment' : 1000 })
+    sampling_rate = int(config['adc']['sampling_rate'])
+    dataset = EpochDataset(args.dataset)
+    known = dataset.labels[:] != DATASET_UNKNOWN
+    # The filter of Acquisition
+    iir = ButterworthFilter(
+        order           = int(config['dataset'].get('iir_order', 10)),
+        fcut            = int(config['dataset'].get('iir_cutoff', 60)),
+        sampling_rate   = sampling_rate,
+        channels        = dataset.channels)
+    X = epoch_features(dataset.volts(dataset.epochs[known]), sampling_rate, int(sampling_rate * features['window'] / 1000),
+                       int(sampling_rate * features['hop'] / 1000), int(sampling_rate * features.get('segment', 1000) / 1000), iir)
+    y = dataset.labels[known].astype(int)
+    model = LinearModel.fit_lda(X, y, shrinkage=args.shrinkage)
+    accuracy = np.mean([np.argmax(model.predict(x)) == label for x, label in zip(X, y)])
+    model.save(args.model)
+    print("trained on", len(y), "epochs, training accuracy", round(float(accuracy), 3))
@@ -0,0 +1,81 @@
+import socket
+import selectors
+
+
+#
+# Datagram receiver
+#
+# Receives datagrams with recv_into() into a preallocated ring of slots. The
+# socket is non-blocking: a drain takes every pending datagram of the backlog
+# until BlockingIOError, waiting up to `timeout` (select) only when nothing is
+# pending yet - no wait under load. Portable, no MSG_DONTWAIT / SO_RCVTIMEO.
+# Datagrams are returned as (buffer, start, end) regions of the ring storage,
+# valid until the ring wraps around: no more than `slots` datagrams per drain().
+# With `sources`, recvfrom_into() is used and the sender address is appended:
+# (buffer, start, end, (ip, port)).
+# ----------------------------------------------------------------------------------
+class DatagramReceiver():
+    def __init__(self, sock, slots: int = 64, slot_size: int = 2048, timeout: float = 0.1, sources: bool = False):
+        self.socket     = sock
+        self.sources    = sources
+        self.slot_size  = slot_size
+        self.storage    = bytearray(slots * slot_size)
+        self.slots      = [memoryview(self.storage)[idx * slot_size:(idx + 1) * slot_size] for idx in range(slots)]
+        self.slot       = 0
+        self.timeout    = timeout
+        self.selector   = selectors.DefaultSelector()
+
+        self.socket.setblocking(False)
+        self.selector.register(self.socket, selectors.EVENT_READ)
+
+        # Counters
+        self.datagrams  = 0
+        self.bytes      = 0
+        self.syscalls   = 0
+        self.wakeups    = 0
+
+    def recv(self):
+        self.syscalls += 1
+        try:
+            if self.sources:
+                size, address = self.socket.recvfrom_into(self.slots[self.slot])
+            else:
+                size = self.socket.recv_into(self.slots[self.slot])
+        except BlockingIOError:
+            return None
+        start = self.slot * self.slot_size
+        self.slot = (self.slot + 1) % len(self.slots)
+        self.datagrams += 1
+        self.bytes += size
+        if self.sources:
+            return (self.storage, start, start + size, address)
+        return (self.storage, start, start + size)
+
+    def drain(self, block: bool = True):
+        # Blocks up to `timeout` for the first datagram (block), then takes the whole backlog
+        datagram = self.recv()
+        if datagram is None and block:
+            self.syscalls += 1
+            if self.selector.select(self.timeout):
+                datagram = self.recv()
+        if datagram is None:
+            return []
+        self.wakeups += 1
+        datagrams = [datagram]
+        while len(datagrams) < len(self.slots):
+            datagram = self.recv()
+            if datagram is None:
+                break
+            datagrams.append(datagram)
+        return datagrams
+
+    def close(self):
+        self.selector.close()
+
+    def stats(self):
+        return {
+            'datagrams' : self.datagrams,
+            'bytes'     : self.bytes,
+            'syscalls'  : self.syscalls,
+            'wakeups'   : self.wakeups
+        }
@@ -0,0 +1,229 @@
+import os
+import json
+import time
+import socket
+import threading
+
+
+#
+# Latency histogram, nanoseconds
+#
+# Log-linear buckets: 8 sub-buckets per power of two (relative error <= 12.5%),
+# exact count, sum and max. observe() is a few integer operations; concurrent
+# observers of one histogram may rarely lose a count (no lock).
+# ----------------------------------------------------------------------------------
+class Histogram():
+    SUB_BITS = 3
+    BUCKETS  = 64 << SUB_BITS
+
+    def __init__(self):
+        self.counts = [0] * self.BUCKETS
+        self.count  = 0
+        self.sum    = 0
+        self.max    = 0
+
+    @classmethod
+    def bucket(cls, value: int):
+        exponent = value.bit_length() - 1
+        if exponent < cls.SUB_BITS:
+            return max(value, 0)
+        return ((exponent - cls.SUB_BITS + 1) << cls.SUB_BITS) + ((value >> (exponent - cls.SUB_BITS)) & ((1 << cls.SUB_BITS) - 1))
+
+    @classmethod
+    def lower(cls, bucket: int):
+        # Smallest value of a bucket
+        if bucket < (1 << cls.SUB_BITS):
+            return bucket
+        exponent = (bucket >> cls.SUB_BITS) + cls.SUB_BITS - 1
+        return (1 << exponent) + ((bucket & ((1 << cls.SUB_BITS) - 1)) << (exponent - cls.SUB_BITS))
+
+    def observe(self, value: int):
+        # bucket() inlined
+        if value < 0:
+            value = 0
+        shift = value.bit_length() - self.SUB_BITS - 1
+        self.counts[value if shift < 0 else ((shift + 1) << self.SUB_BITS) + ((value >> shift) & 7)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, percent: float):
+        # Lower bound of the bucket holding the percentile, the max for the last one
+        rank = self.count * percent / 100
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= rank:
+                return min(self.lower(bucket), self.max)
+        return self.max
+
+    def snapshot(self):
+        return {
+            'count'     : self.count,
+            'mean_us'   : self.sum / self.count / 1e3 if self.count else 0.0,
+            'p50_us'    : self.percentile(50) / 1e3,
+            'p99_us'    : self.percentile(99) / 1e3,
+            'max_us'    : self.max / 1e3
+        }
+
+
+#
+# Metrics registry
+#
+# Stage histograms and gauges (callables sampled at snapshot time, e.g. queue
+# depths). Call sites check `enabled` first, so a disabled registry costs one
+# attribute lookup per stage.
+# Stamps: a batch carries a dict of perf_counter_ns() stamps, first 'recv'.
+# stamp(stamps, stage) adds the stage stamp and observes the time since the
+# previous stamp as `stage` and the time since 'recv' as `latency.stage`.
+# current - stamps of the batch being delivered on this thread (set by the
+# UDP dispatcher around on_batch), so subscribers need no extra argument.
+# ----------------------------------------------------------------------------------
+class Metrics():
+    def __init__(self):
+        self.enabled    = False
+        self.lock       = threading.Lock()
+        self.histograms = {}
+        self.gauges     = {}
+        self.latencies  = {}        # stage -> 'latency.' + stage
+        self.local      = threading.local()
+        self.since      = time.perf_counter()
+
+    def histogram(self, name: str):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            with self.lock:
+                histogram = self.histograms.setdefault(name, Histogram())
+        return histogram
+
+    def observe(self, name: str, value: int):
+        (self.histograms.get(name) or self.histogram(name)).observe(value)
+
+    def begin(self, stamp: int = None):
+        return { 'recv' : stamp or time.perf_counter_ns() }
+
+    def stamp(self, stamps: dict, stage: str, now: int = None):
+        if not stamps:
+            return
+        now = now or time.perf_counter_ns()
+        latency = self.latencies.get(stage) or self.latencies.setdefault(stage, 'latency.' + stage)
+        self.observe(stage, now - stamps.get('last', stamps['recv']))
+        self.observe(latency, now - stamps['recv'])
+        stamps[stage] = stamps['last'] = now
+
+    def current(self):
+        return getattr(self.local, 'stamps', None)
+
+    def set_current(self, stamps: dict):
+        self.local.stamps = stamps
+
+    def gauge(self, name: str, func):
+        with self.lock:
+            self.gauges[name] = func
+
+    def remove_gauge(self, name: str):
+        with self.lock:
+            self.gauges.pop(name, None)
+
+    def reset(self):
+        with self.lock:
+            self.histograms = {}
+            self.since = time.perf_counter()
+
+    def snapshot(self):
+        with self.lock:
+            histograms, gauges = dict(self.histograms), dict(self.gauges)
+        values = {}
+        for name, func in gauges.items():
+            try:
+                values[name] = func()
+            except Exception as err:
+                values[name] = str(err)
+        return {
+            'uptime'    : time.perf_counter() - self.since,
+            'stages'    : { name : histogram.snapshot() for name, histogram in sorted(histograms.items()) },
+            'gauges'    : values
+        }
+
+    def dump(self, path: str):
+        with open(path + '.tmp', 'w') as dump_file:
+            json.dump(self.snapshot(), dump_file, indent=2)
+        os.replace(path + '.tmp', path)
+
+
+METRICS = Metrics()
+
+
+#
+# Metrics exporter
+#
+# config 'metrics': { "enabled", "ip", "port", "dump", "interval" s }.
+# A connection to ip:port gets one JSON snapshot and is closed (scrape), the
+# snapshot is also written to `dump` every `interval` seconds and on stop.
+# ----------------------------------------------------------------------------------
+class MetricsExporter(threading.Thread):
+    def __init__(self, config, metrics: Metrics = METRICS, name = 'MetricsExporterThread'):
+        super(MetricsExporter, self).__init__(name=name, daemon=True)
+        self.metrics = metrics
+        self.dump_path = config.get('dump')
+        self.interval = float(config.get('interval', 10))
+        self.thread_stop = threading.Event()
+        self.socket = None
+        if config.get('port') is not None:
+            self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self.socket.bind((str(config.get('ip', '127.0.0.1')), int(config['port'])))
+            self.socket.listen(4)
+            self.socket.settimeout(min(self.interval, 0.5))
+
+    def address(self):
+        return self.socket.getsockname() if self.socket else None
+
+    def stop(self):
+        self.thread_stop.set()
+
+    def serve(self):
+        try:
+            client, address = self.socket.accept()
+        except socket.timeout:
+            return
+        with client:
+            client.sendall(json.dumps(self.metrics.snapshot()).encode() + b'\n')
+
+    def run(self):
+        next_dump = time.perf_counter() + self.interval
+        while not self.thread_stop.is_set():
+            if self.socket:
+                self.serve()
+            else:
+                self.thread_stop.wait(min(self.interval, 0.5))
+            if self.dump_path and time.perf_counter() >= next_dump:
+                self.metrics.dump(self.dump_path)
+                next_dump += self.interval
+        if self.socket:
+            self.socket.close()
+        if self.dump_path:
+            self.metrics.dump(self.dump_path)
+
+
+def metrics_setup(config):
+    # Enables the global registry from config 'metrics'; returns a started exporter or None
+    metrics_config = config.get('metrics')
+    if not metrics_config or not metrics_config.get('enabled'):
+        return None
+    METRICS.enabled = True
+    exporter = MetricsExporter(metrics_config)
+    exporter.start()
+    return exporter
+
+
+def metrics_scrape(ip: str, port: int, timeout: float = 1.0):
+    with socket.create_connection((ip, port), timeout=timeout) as client:
+        chunks = []
+        while True:
+            data = client.recv(65536)
+            if not data:
+                break
+            chunks.append(data)
+    return json.loads(b''.join(chunks))
@@ -0,0 +1,138 @@
+import time
+import threading
+import itertools
+import collections
+from metrics import *
+
+
+#
+# Outbound frame queue of one TCP connection
+#
+# Producers (any thread) push whole packed frames, the dispatcher thread
+# flushes as many of them as the socket takes with one sendmsg() and resumes
+# after partial writes. Pending bytes are bounded by `high_water`:
+#   drop_oldest - the oldest waiting frames are dropped for the new one
+#   block       - the producer waits up to block_timeout, then the new frame is dropped;
+#                 GUI threads push with timeout 0 - dropped at once instead of waiting
+# A frame larger than high_water is always dropped.
+# With METRICS enabled, push -> fully sent time of every frame is observed as 'send'.
+# ----------------------------------------------------------------------------------
+class OutboundQueue():
+    HIGH_WATER  = 256 * 1024
+    MAX_IOV     = 64
+    POLICIES    = ('drop_oldest', 'block')
+
+    def __init__(self, high_water: int = HIGH_WATER, policy: str = 'drop_oldest', block_timeout: float = 1.0, max_iov: int = MAX_IOV):
+        assert policy in self.POLICIES
+        self.high_water     = high_water
+        self.policy         = policy
+        self.block_timeout  = block_timeout
+        self.max_iov        = max_iov
+        self.lock           = threading.Condition()
+        self.frames         = collections.deque()
+        self.stamps         = collections.deque()     # perf_counter_ns() of push per frame, 0 - not measured
+        self.offset         = 0         # sent bytes of frames[0]
+        self.pending_bytes  = 0
+
+        # Counters
+        self.frames_sent    = 0
+        self.bytes_sent     = 0
+        self.syscalls       = 0
+        self.partial_writes = 0
+        self.dropped_frames = 0
+        self.dropped_bytes  = 0
+        self.blocked        = 0
+
+    def __len__(self):
+        return len(self.frames)
+
+    def pending(self):
+        return self.pending_bytes > 0
+
+    def push(self, frame: bytes, timeout: float = None):
+        # Returns False if the frame was dropped; timeout - wait of the block policy, block_timeout by default
+        with self.lock:
+            if len(frame) > self.high_water:
+                self.dropped_frames += 1
+                self.dropped_bytes += len(frame)
+                return False
+            if self.pending_bytes + len(frame) > self.high_water:
+                if self.policy == 'block':
+                    self.blocked += 1
+                    timeout = self.block_timeout if timeout is None else timeout
+                    if not self.lock.wait_for(lambda: self.pending_bytes + len(frame) <= self.high_water, timeout):
+                        self.dropped_frames += 1
+                        self.dropped_bytes += len(frame)
+                        return False
+                else:
+                    # A partially sent frame has to be completed
+                    keep = 1 if self.offset else 0
+                    while self.pending_bytes + len(frame) > self.high_water and len(self.frames) > keep:
+                        dropped = self.frames[keep]
+                        del self.frames[keep]
+                        del self.stamps[keep]
+                        self.pending_bytes -= len(dropped)
+                        self.dropped_frames += 1
+                        self.dropped_bytes += len(dropped)
+            self.frames.append(frame)
+            self.stamps.append(time.perf_counter_ns() if METRICS.enabled else 0)
+            self.pending_bytes += len(frame)
+            return True
+
+    def flush(self, sock):
+        # Non-blocking socket; returns True when everything was sent. Socket errors are raised.
+        with self.lock:
+            while self.frames:
+                views = [memoryview(self.frames[0])[self.offset:]]
+                views.extend(memoryview(frame) for frame in itertools.islice(self.frames, 1, self.max_iov))
+                size = sum(len(view) for view in views)
+                try:
+                    sent = sock.sendmsg(views) if hasattr(sock, 'sendmsg') else sock.send(views[0])
+                except BlockingIOError:
+                    break
+                finally:
+                    for view in views:
+                        view.release()
+                self.syscalls += 1
+                self.bytes_sent += sent
+                self.pending_bytes -= sent
+                if sent < size:
+                    self.partial_writes += 1
+                rest = sent
+                while rest and rest >= len(self.frames[0]) - self.offset:
+                    rest -= len(self.frames[0]) - self.offset
+                    self.frames.popleft()
+                    stamp = self.stamps.popleft()
+                    if stamp:
+                        METRICS.observe('send', time.perf_counter_ns() - stamp)
+                    self.offset = 0
+                    self.frames_sent += 1
+                self.offset += rest
+                if sent < size:
+                    # Socket buffer is full
+                    break
+            self.lock.notify_all()
+            return not self.frames
+
+    def discard_partial(self):
+        # After a disconnect: the rest of a partially sent frame is useless for a new connection
+        with self.lock:
+            if self.offset:
+                self.pending_bytes -= len(self.frames[0]) - self.offset
+                self.frames.popleft()
+                self.stamps.popleft()
+                self.offset = 0
+                self.lock.notify_all()
+
+    def stats(self):
+        return {
+            'depth'             : len(self.frames),
+            'bytes_in_flight'   : self.pending_bytes,
+            'frames_sent'       : self.frames_sent,
+            'bytes_sent'        : self.bytes_sent,
+            'syscalls'          : self.syscalls,
+            'partial_writes'    : self.partial_writes,
+            'dropped_frames'    : self.dropped_frames,
+            'dropped_bytes'     : self.dropped_bytes,
+            'blocked'           : self.blocked
+        }
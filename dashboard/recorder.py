@@ -1,83 +1,184 @@
-
 import os
 import sys
+import json
 import queue
 import wave
 import time
-import struct
 import threading
+import numpy as np
 
-from events import *
 from dispatchers import *
-from PyQt5 import QtCore
 
-class Recorder(QtCore.QThread):
-    def __init__(self, parent=None, queue=None):
-        super(Recorder, self).__init__(parent=parent)
-        self.parent = parent
-        self.config = parent.config
+
+RECORDER_EVENTS = {
+    ExchangeProtocol.GAME_EVENT_UP      : 'U',
+    ExchangeProtocol.GAME_EVENT_DOWN    : 'D',
+    ExchangeProtocol.GAME_EVENT_LEFT    : 'L',
+    ExchangeProtocol.GAME_EVENT_RIGHT   : 'R'
+}
+
+
+#
+# Recording backends
+#
+# write(event, iter, frames) appends one event window, frames: (samples, channels)
+# int16, interleaved as in the file - one write call per window.
+# ----------------------------------------------------------------------------------
+class WaveWriter():
+    # <tm>.wav + <tm>.txt, one event letter per window
+    def __init__(self, path: str, channels: int, sampling_rate: int, sample_width: int):
+        self.wave_file  = wave.open(path + '.wav', 'w')
+        self.event_file = open(path + '.txt', 'w')
+        self.wave_file.setnchannels(channels)
+        self.wave_file.setsampwidth(sample_width)
+        self.wave_file.setframerate(sampling_rate)
+
+    def write(self, event: str, iter: int, frames: np.ndarray):
+        self.wave_file.writeframes(frames.tobytes())
+        self.event_file.write(event)
+
+    def close(self):
+        self.wave_file.close()
+        self.event_file.close()
+
+
+class ChunkWriter():
+    # <tm>.i16 raw interleaved int16 frames + <tm>.json header + <tm>.jsonl index of event windows.
+    # Every window is flushed with its index line, so a session cut off by a crash
+    # keeps the windows written so far; close() only adds `samples` to the header.
+    def __init__(self, path: str, channels: int, sampling_rate: int, sample_width: int, adc_range: float):
+        self.path       = path
+        self.data_file  = open(path + '.i16', 'wb')
+        self.event_file = open(path + '.jsonl', 'w')
+        self.offset     = 0
+        self.index      = {
+            'dtype'         : '<i' + str(sample_width),
+            'channels'      : channels,
+            'sampling_rate' : sampling_rate,
+            'adc_range'     : adc_range,
+            'samples'       : None          # recording
+        }
+        self.save()
+
+    def save(self):
+        with open(self.path + '.json.tmp', 'w') as index_file:
+            json.dump(self.index, index_file, indent=2)
+        os.replace(self.path + '.json.tmp', self.path + '.json')
+
+    def write(self, event: str, iter: int, frames: np.ndarray):
+        self.data_file.write(frames.tobytes())
+        self.data_file.flush()
+        self.event_file.write(json.dumps({ 'event' : event, 'iter' : iter, 'offset' : self.offset, 'samples' : len(frames) }) + '\n')
+        self.event_file.flush()
+        self.offset += len(frames)
+
+    def close(self):
+        self.data_file.close()
+        self.event_file.close()
+        self.index['samples'] = self.offset
+        self.save()
+
+
+def load_chunks(path: str):
+    # Returns (frames memmap (samples, channels), index) of a ChunkWriter recording, index['events'] -
+    # the windows of <tm>.jsonl (or of the .json of older recordings) that are complete in the .i16
+    with open(path + '.json', 'r') as index_file:
+        index = json.load(index_file)
+    if 'events' not in index:
+        index['events'] = []
+        if os.path.exists(path + '.jsonl'):
+            with open(path + '.jsonl', 'r') as event_file:
+                for line in event_file:
+                    try:
+                        index['events'].append(json.loads(line))
+                    except ValueError:
+                        # A line cut off by a crash
+                        break
+    frame_size = np.dtype(index['dtype']).itemsize * index['channels']
+    samples = os.path.getsize(path + '.i16') // frame_size if os.path.exists(path + '.i16') else 0
+    if index.get('samples') is not None:
+        samples = min(samples, index['samples'])
+    index['samples'] = samples
+    index['events'] = [event for event in index['events'] if event['offset'] + event['samples'] <= samples]
+    if not samples:
+        return np.zeros((0, index['channels']), dtype=index['dtype']), index
+    frames = np.memmap(path + '.i16', dtype=index['dtype'], mode='r', shape=(samples, index['channels']))
+    return frames, index
+
+
+#
+# Recorder
+#
+# Queue items are whole event windows: (event_id, iter, adc_values), adc_values
+# (channels, samples) in volts, the channels of all recorded devices. stop()
+# queues a sentinel, everything queued before it is written. on_progress(queue_size: int)
+# is called from the recorder thread after every written event window.
+# dataset.recorder_format: "wav" (default) or "chunks".
+# ----------------------------------------------------------------------------------
+class Recorder(threading.Thread):
+    def __init__(self, config, queue, on_progress = None, channels = None, name = 'RecorderThread'):
+        super(Recorder, self).__init__(name=name)
+        self.config = config
         self.queue = queue
+        self.on_progress = on_progress
+        self.channels = channels or int(self.config['adc']['channels'])
 
         self.adc_range = self.config['adc']['range']
         self.adc_power = 2 ** int(self.config['adc']['resolution'])
+        self.format = str(self.config['dataset'].get('recorder_format', 'wav')).lower()
+
+        self.writer = None
+        self.path = None
 
-        self.thread_stop = False
-        self.wave_file = None
-        self.event_file = None
+        # Counters
+        self.windows = 0
+        self.samples = 0
 
     def start_session(self):
-        tm = str(int(time.time()))
-        wave_file = self.parent.config['dataset']['dest_path'] + '/' + tm + '.wav'
-        event_file = self.parent.config['dataset']['dest_path'] + '/' + tm + '.txt'
+        self.path = self.config['dataset']['dest_path'] + '/' + str(int(time.time()))
+        sampling_rate = int(self.config['adc']['sampling_rate'])            # framerate = sampling rate = 2000Hz
+        sample_width = int(self.config['adc']['resolution'] / 8)            # 16 bit
         try:
-            self.wave_file  = wave.open(wave_file, 'w')
-            self.event_file = open(event_file, 'w')
-
-            self.wave_file.setnchannels(int(self.config['adc']['channels']))        # channels
-            self.wave_file.setsampwidth(int(self.config['adc']['resolution'] / 8))  # 16 bit
-            self.wave_file.setframerate(int(self.config['adc']['sampling_rate']))   # framerate = sampling rate = 2000Hz
+            if self.format == 'chunks':
+                self.writer = ChunkWriter(self.path, self.channels, sampling_rate, sample_width, self.adc_range)
+            else:
+                self.writer = WaveWriter(self.path, self.channels, sampling_rate, sample_width)
         except wave.Error:
-            print("Error: Recorder: WAV file: " + wave_file)
+            print("Error: Recorder: WAV file: " + self.path + '.wav')
         except Exception as err:
             print("Error: Recorder:", err)
         else:
-            self.start(priority=QtCore.QThread.LowestPriority)
+            self.start()
 
     def stop(self):
-        self.thread_stop = True
+        self.queue.put(None)
+
+    def convert(self, adc_values: np.ndarray):
+        # Convert voltage to ADC value (16 bit), (channels, samples) -> interleaved (samples, channels). AD7606!!!
+        values = np.trunc(((np.asarray(adc_values, dtype=np.float64) - self.adc_range / 2) * self.adc_power) / self.adc_range)
+        return np.clip(values, -32768, 32767).astype('<i2').T.copy()
 
     def run(self):
-        threading.current_thread().name = QtCore.QThread.currentThread().objectName()
-        events = {
-            ExchangeProtocol.GAME_EVENT_UP      : 'U',
-            ExchangeProtocol.GAME_EVENT_DOWN    : 'D',
-            ExchangeProtocol.GAME_EVENT_LEFT    : 'L',
-            ExchangeProtocol.GAME_EVENT_RIGHT   : 'R'
-        }
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            event_id, iter, adc_values = item
+            since = time.perf_counter_ns() if METRICS.enabled else 0
+            frames = self.convert(adc_values)
+            self.writer.write(RECORDER_EVENTS.get(event_id, 'X'), iter, frames)
+            if since:
+                METRICS.observe('record', time.perf_counter_ns() - since)
+            self.windows += 1
+            self.samples += len(frames)
+            if self.on_progress:
+                self.on_progress(self.queue.qsize())
 
-        current = {}
-        while not self.thread_stop:
-            try:
-                channel_id, event_id, iter, data = self.queue.get_nowait()
-            except queue.Empty:
-                time.sleep(1)
-            else:
-                if not iter in current:
-                    current[iter] = {
-                        'event_id'   : events.get(event_id, 'X'),
-                        'adc_values' : [0] * int(self.config['adc']['channels']) }
-
-                # Convert voltage to ADC value (16 bit). AD7606!!!
-                current[iter]['adc_values'][channel_id] = [int(((volt - self.adc_range / 2) * self.adc_power) / self.adc_range) for volt in data]
-
-                for key in sorted(current):
-                    if all([type(x) is list for x in current[key]['adc_values']]):
-                        for samples in zip(*current[key]['adc_values']):
-                            for sample in samples:
-                                self.wave_file.writeframes(struct.pack('<h', sample))
-                        self.event_file.write(current[key]['event_id'])
-                        current.pop(key)
-                        QtWidgets.QApplication.postEvent(self.parent, RecorderEvent(self.queue.qsize()))
+        self.writer.close()
 
-        self.wave_file.close()
-        self.event_file.close()
\ No newline at end of file
+    def stats(self):
+        return {
+            'windows'   : self.windows,
+            'samples'   : self.samples,
+            'pending'   : self.queue.qsize()
+        }
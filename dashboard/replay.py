@@ -0,0 +1,159 @@
+import os
+import time
+import struct
+import threading
+import numpy as np
+from recorder import *
+
+
+#
+# Recorded session
+#
+# Memory-maps a Recorder session: <tm>.wav + <tm>.txt or <tm>.i16 + <tm>.json
+# + <tm>.jsonl (chunks). The event index - [{ event, iter, offset, samples }],
+# offsets in frames - is built once when the session is opened: for WAV
+# sessions every letter of the .txt is one window of samples / len(letters)
+# frames.
+# frames: int16 (samples, channels), as written by Recorder.convert().
+# ----------------------------------------------------------------------------------
+def wave_memmap(path: str):
+    # (frames memmap (samples, channels), sampling_rate) of a PCM WAV file, no copy
+    with open(path, 'rb') as wave_file:
+        riff, size, form = struct.unpack('<4sI4s', wave_file.read(12))
+        if riff != b'RIFF' or form != b'WAVE':
+            raise ValueError("Not a WAV file: " + path)
+        channels = sample_width = sampling_rate = None
+        while True:
+            header = wave_file.read(8)
+            if len(header) < 8:
+                raise ValueError("No data chunk: " + path)
+            chunk_id, chunk_size = struct.unpack('<4sI', header)
+            if chunk_id == b'fmt ':
+                fmt = wave_file.read(chunk_size)
+                channels, sampling_rate = struct.unpack_from('<HI', fmt, 2)
+                sample_width = struct.unpack_from('<H', fmt, 14)[0] // 8
+            elif chunk_id == b'data':
+                offset = wave_file.tell()
+                break
+            else:
+                wave_file.seek(chunk_size + (chunk_size & 1), os.SEEK_CUR)
+    if sample_width != 2:
+        raise ValueError("Only 16 bit WAV files are supported: " + path)
+    samples = min(chunk_size, os.path.getsize(path) - offset) // (channels * sample_width)
+    if not samples:
+        return np.zeros((0, channels), dtype='<i2'), sampling_rate
+    return np.memmap(path, dtype='<i2', mode='r', offset=offset, shape=(samples, channels)), sampling_rate
+
+
+class Session():
+    def __init__(self, path: str):
+        # path: <tm>.wav, <tm>.json or <tm>
+        self.path = os.path.splitext(path)[0] if path.endswith(('.wav', '.json', '.jsonl', '.i16', '.txt')) else path
+        if os.path.exists(self.path + '.json'):
+            self.frames, index = load_chunks(self.path)
+            self.sampling_rate = int(index['sampling_rate'])
+            self.events = [dict(event) for event in index['events']]
+        else:
+            self.frames, self.sampling_rate = wave_memmap(self.path + '.wav')
+            letters = ''
+            if os.path.exists(self.path + '.txt'):
+                with open(self.path + '.txt', 'r') as event_file:
+                    letters = event_file.read().strip()
+            window = len(self.frames) // len(letters) if letters else 0
+            self.events = [{ 'event' : letter, 'iter' : None, 'offset' : idx * window, 'samples' : window } for idx, letter in enumerate(letters)]
+        self.channels = self.frames.shape[1]
+
+    def __len__(self):
+        return len(self.frames)
+
+    def event_offset(self, event: int):
+        return self.events[event]['offset']
+
+    def duration(self):
+        return len(self.frames) / self.sampling_rate if self.sampling_rate else 0.0
+
+
+#
+# Session replay
+#
+# Drop-in for UDPDispatcher: streams a recorded session as batch_samples
+# blocks to on_batch(adc_values, lost_packets, device), so everything behind
+# the UDP decode stage (IIR filter, history, recorder, spectrum, subscribers)
+# runs as with live data. A session recorded with several devices is split
+# back into adc.channels per device. Values are converted back to volts with
+# the inverse of Recorder.convert().
+# speed: 1 - real time, N - N x real time, 0 - as fast as possible.
+# seek(event) jumps to an event window, from any thread; `events` limits the
+# replay to [first, last) event windows. on_end() is called after the last block.
+# ----------------------------------------------------------------------------------
+class SessionReplay(threading.Thread):
+    def __init__(self, config, session, on_batch, speed: float = 1.0, events: tuple = None, on_end = None, name = 'SessionReplayThread'):
+        super(SessionReplay, self).__init__(name=name)
+        self.config = config
+        self.session = session if isinstance(session, Session) else Session(session)
+        self.on_batch = on_batch
+        self.on_end = on_end
+        self.speed = speed
+
+        self.adc_channels   = int(self.config['adc']['channels'])
+        self.batch_samples  = int(self.config['dataset']['batch_samples'])
+        self.adc_range      = self.config['adc']['range']
+        self.adc_power      = 2 ** int(self.config['adc']['resolution'])
+        self.devices        = max(1, self.session.channels // self.adc_channels)
+
+        first, last = events or (0, len(self.session.events))
+        self.start_offset = self.session.event_offset(first) if first < len(self.session.events) else 0
+        self.end_offset = self.session.event_offset(last) if last < len(self.session.events) else len(self.session)
+        self.offset = self.start_offset
+        self.seek_offset = None
+        self.thread_stop = False
+        self.since = None
+
+        # Counters
+        self.packets = 0
+        self.samples = 0
+        self.elapsed = 0.0
+
+    def stop(self):
+        self.thread_stop = True
+
+    def seek(self, event: int):
+        self.seek_offset = self.session.event_offset(event)
+
+    def volts(self, frames: np.ndarray):
+        # Inverse of Recorder.convert(): (samples, channels) int16 -> (channels, samples) float32 volts
+        values = frames.T.astype(np.float32) * np.float32(self.adc_range / self.adc_power)
+        return values + np.float32(self.adc_range / 2)
+
+    def stats(self):
+        return {
+            'packets'           : self.packets,
+            'samples'           : self.samples,
+            'position'          : self.offset / self.session.sampling_rate,
+            'duration'          : self.session.duration(),
+            'realtime_factor'   : (self.samples / self.session.sampling_rate) / self.elapsed if self.elapsed else 0.0
+        }
+
+    def run(self):
+        period = self.batch_samples / self.session.sampling_rate / self.speed if self.speed else 0.0
+        self.since = since = time.perf_counter()
+        blocks = 0
+        while not self.thread_stop and self.offset + self.batch_samples <= self.end_offset:
+            if self.seek_offset is not None:
+                self.offset, self.seek_offset = self.seek_offset, None
+                since, blocks = time.perf_counter(), 0
+                continue
+            if period:
+                delay = since + blocks * period - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            adc_values = self.volts(self.session.frames[self.offset:self.offset + self.batch_samples])
+            for device in range(self.devices):
+                self.on_batch(adc_values[device * self.adc_channels:(device + 1) * self.adc_channels], 0, device)
+            self.offset += self.batch_samples
+            self.packets += 1
+            self.samples += self.batch_samples
+            blocks += 1
+            self.elapsed = time.perf_counter() - self.since
+        if self.on_end and not self.thread_stop:
+            self.on_end()
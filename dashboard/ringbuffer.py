@@ -0,0 +1,63 @@
+import numpy as np
+
+
+#
+# Fixed-capacity circular buffer of samples
+#
+# Every sample is stored twice (at idx and idx + capacity), so the ordered
+# window (oldest..newest) is always a contiguous zero-copy slice of the
+# storage. Single or multichannel: samples are the last axis.
+# ----------------------------------------------------------------------------------
+class RingBuffer():
+    def __init__(self, capacity: int, channels: int = None, dtype = np.float32, fill_value = 0):
+        # channels: None, int or tuple of leading dimensions
+        shape = (2 * capacity, ) if channels is None else tuple(np.atleast_1d(channels)) + (2 * capacity, )
+        self.capacity   = capacity
+        self.data       = np.full(shape, fill_value, dtype=dtype)
+        self.head       = 0     # index of the oldest sample
+        self.written    = 0     # samples written so far
+
+    def __len__(self):
+        return self.capacity
+
+    def write(self, values, count: int):
+        # values: scalar or (..., count) array with count <= capacity
+        head = self.head
+        first = min(count, self.capacity - head)
+        rest = count - first
+        if np.ndim(values):
+            self.data[..., head:head + first] = values[..., :first]
+            self.data[..., head + self.capacity:head + self.capacity + first] = values[..., :first]
+            self.data[..., :rest] = values[..., first:]
+            self.data[..., self.capacity:self.capacity + rest] = values[..., first:]
+        else:
+            self.data[..., head:head + first] = values
+            self.data[..., head + self.capacity:head + self.capacity + first] = values
+            self.data[..., :rest] = values
+            self.data[..., self.capacity:self.capacity + rest] = values
+        self.head = (head + count) % self.capacity
+        self.written += count
+
+    def append(self, values: np.ndarray):
+        # O(batch): overwrites the oldest values.shape[-1] samples, only the newest capacity
+        # are stored but `written` counts all of them
+        count = values.shape[-1]
+        if count > self.capacity:
+            self.written += count - self.capacity
+            values = values[..., -self.capacity:]
+            count = self.capacity
+        self.write(values, count)
+
+    def fill(self, value, count: int):
+        # Bulk write of `count` samples of `value` (lost samples), O(capacity) for any count
+        if count > self.capacity:
+            self.written += count - self.capacity
+            count = self.capacity
+        self.write(value, count)
+
+    def view(self):
+        # Ordered (oldest..newest) zero-copy view, its content changes with the next write
+        return self.data[..., self.head:self.head + self.capacity]
+
+    def tail(self, count: int):
+        return self.data[..., self.head + self.capacity - count:self.head + self.capacity]
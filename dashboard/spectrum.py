@@ -0,0 +1,138 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from ringbuffer import *
+
+
+WINDOWS = {
+    'boxcar'    : np.ones,
+    'hann'      : np.hanning,
+    'hamming'   : np.hamming,
+    'blackman'  : np.blackman
+}
+
+# EEG bands, Hz
+BANDS = {
+    'delta'     : (0.5, 4),
+    'theta'     : (4, 8),
+    'alpha'     : (8, 13),
+    'beta'      : (13, 30),
+    'gamma'     : (30, 100)
+}
+
+
+#
+# Sliding-window spectrum engine, all channels at once
+#
+# Keeps the last samples of every channel and computes a windowed rfft frame
+# every `hop` new samples (STFT). Only frames completed by the newly arrived
+# batch are computed. Frequency bins and windows are computed once.
+# ----------------------------------------------------------------------------------
+class SpectrumEngine():
+    def __init__(self, sampling_rate: int, nfft: int, channels: int, hop: int, window: str = 'hann', frames: int = 64, segment: int = None):
+        self.sampling_rate  = sampling_rate
+        self.nfft           = nfft
+        self.channels       = channels
+        self.hop            = hop
+        self.window_name    = window
+        self.segment        = segment or sampling_rate
+        self.pending        = 0
+
+        # Cached bins and window
+        self.freqs          = np.fft.rfftfreq(nfft, 1 / sampling_rate)
+        self.window         = WINDOWS[window](nfft)
+        self.scale          = 1 / self.window.sum()                 # amplitude of a tone = A / 2
+        self.welch_cache    = {}
+        self.band_cache     = {}
+
+        self.history        = RingBuffer(2 * nfft, channels)
+        self.spectrum       = np.zeros((channels, len(self.freqs)), dtype=np.float32)
+        self.spectrogram    = RingBuffer(frames, (channels, len(self.freqs)))
+
+    def update(self, block: np.ndarray):
+        # block: (channels, samples); returns the number of new frames
+        self.history.append(block)
+        self.pending += block.shape[-1]
+        count = self.pending // self.hop
+        if not count:
+            return 0
+        self.pending -= count * self.hop
+
+        # Samples between the end of each new frame and the newest sample, oldest frame first
+        lags = self.pending + self.hop * np.arange(count - 1, -1, -1)
+        lags = lags[lags <= self.history.capacity - self.nfft]
+        starts = self.history.capacity - self.nfft - lags
+        frames = sliding_window_view(self.history.view(), self.nfft, axis=-1)[:, starts]
+        spectra = (np.abs(np.fft.rfft(frames * self.window, axis=-1)) * self.scale).astype(np.float32)
+        self.spectrum = spectra[:, -1]
+        self.spectrogram.append(spectra.transpose(0, 2, 1))
+        return len(lags)
+
+    def welch_setup(self, segment: int):
+        setup = self.welch_cache.get(segment)
+        if setup is None:
+            window = WINDOWS[self.window_name](segment)
+            freqs = np.fft.rfftfreq(segment, 1 / self.sampling_rate)
+            # One-sided power spectral density, V^2/Hz
+            scale = np.full(len(freqs), 2 / (self.sampling_rate * (window ** 2).sum()))
+            scale[0] /= 2
+            if segment % 2 == 0:
+                scale[-1] /= 2
+            setup = self.welch_cache[segment] = (window, freqs, scale)
+        return setup
+
+    def welch(self, segment: int = None, overlap: float = 0.5):
+        # Averaged PSD of the last nfft samples: returns (freqs, (channels, bins))
+        segment = segment or self.segment
+        step = max(1, int(segment * (1 - overlap)))
+        window, freqs, scale = self.welch_setup(segment)
+        frames = sliding_window_view(self.history.tail(self.nfft), segment, axis=-1)[:, ::step]
+        psd = (np.abs(np.fft.rfft(frames * window, axis=-1)) ** 2).mean(axis=1) * scale
+        return freqs, psd
+
+    def band_powers(self, bands: dict = BANDS, segment: int = None):
+        # Returns (channels, bands) absolute band powers, V^2
+        freqs, psd = self.welch(segment)
+        key = (len(freqs), tuple(bands.values()))
+        masks = self.band_cache.get(key)
+        if masks is None:
+            masks = self.band_cache[key] = np.array([(freqs >= low) & (freqs < high) for low, high in bands.values()], dtype=np.float64).T
+        return psd @ masks * (freqs[1] - freqs[0])
+
+
+#
+# Sliding DFT of selected frequencies (Goertzel-like)
+#
+# X[n] = (X[n - 1] + x[n] - x[n - N]) * w, w = exp(2j * pi * k / N)
+# A batch of m samples is applied at once: X = X * w^m + delta @ w^(m - i).
+# The state is recomputed exactly every `resync` batches to bound rounding drift.
+# ----------------------------------------------------------------------------------
+class SlidingDFT():
+    def __init__(self, frequencies: list, sampling_rate: int, nfft: int, channels: int, resync: int = 256):
+        self.nfft       = nfft
+        self.resync     = resync
+        self.updates    = 0
+        self.bins       = np.round(np.asarray(frequencies) * nfft / sampling_rate).astype(int)
+        self.freqs      = self.bins * sampling_rate / nfft
+        self.twiddle    = np.exp(2j * np.pi * self.bins / nfft)
+        self.exact      = self.twiddle[None, :] ** (nfft - np.arange(nfft))[:, None]
+        self.powers     = {}
+        self.history    = RingBuffer(nfft, channels)
+        self.state      = np.zeros((channels, len(self.bins)), dtype=np.complex128)
+
+    def update(self, block: np.ndarray):
+        for start in range(0, block.shape[-1], self.nfft):
+            chunk = block[:, start:start + self.nfft]
+            count = chunk.shape[-1]
+            powers = self.powers.get(count)
+            if powers is None:
+                powers = self.powers[count] = self.twiddle[None, :] ** (count - np.arange(count))[:, None]
+            delta = chunk - self.history.view()[:, :count]
+            self.state = self.state * self.twiddle ** count + delta @ powers
+            self.history.append(chunk)
+        self.updates += 1
+        if self.updates % self.resync == 0:
+            self.state = self.history.view() @ self.exact
+
+    def amplitude(self):
+        # (channels, frequencies), amplitude of a tone = A / 2
+        return np.abs(self.state) / self.nfft
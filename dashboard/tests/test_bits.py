@@ -0,0 +1,49 @@
+import os
+import sys
+import unittest
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from benchmark import LegacyBits
+from bits import *
+
+
+class BitsTest(unittest.TestCase):
+    def setUp(self):
+        self.data = np.random.default_rng(0).integers(0, 256, 64, dtype=np.uint8).tobytes()
+
+    def test_fields(self):
+        # Same fields and writes as the bit by bit implementation
+        rng = np.random.default_rng(1)
+        bits, legacy = Bits(self.data), LegacyBits(self.data)
+        for _ in range(500):
+            size = int(rng.integers(1, 65))
+            offset = int(rng.integers(0, len(self.data) * 8 - size))
+            self.assertEqual(bits.get_ubits(offset, size), legacy.get_ubits(offset, size))
+            self.assertEqual(bits.get_sbits(offset, size), legacy.get_sbits(offset, size))
+            value = int(rng.integers(-2 ** 63, 2 ** 63))
+            bits.set_bits(offset, value, size)
+            legacy.set_bits(offset, value, size)
+            self.assertEqual(bits.get_bytes(), legacy.get_bytes())
+
+    def test_array(self):
+        bits = Bits(self.data)
+        for offset, count, width in ((8, 20, 16), (3, 30, 12), (5, 4, 64), (0, 100, 1)):
+            for signed in (False, True):
+                get = bits.get_sbits if signed else bits.get_ubits
+                self.assertEqual(bits.get_array(offset, count, width, signed).tolist(), [get(offset + idx * width, width) for idx in range(count)])
+
+    def test_empty_array(self):
+        bits = Bits(self.data)
+        self.assertEqual(bits.get_array(0, 0, 16).dtype, np.uint16)
+        self.assertEqual(bits.get_array(len(self.data) * 8, 0, 32, True).dtype, np.int32)
+        self.assertEqual(bits.get_array(3, 0, 12, True).dtype, np.int64)
+        self.assertEqual(len(Bits(b'').get_array(0, 0, 8)), 0)
+
+    def test_out_of_range(self):
+        with self.assertRaises(IndexError):
+            Bits(self.data).get_array(len(self.data) * 8 - 8, 2, 8)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+import os
+import sys
+import unittest
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ad7606 import *
+from crc import *
+
+
+def bitwise_crc16(data: bytes):
+    # CRC16 as computed by the firmware, bit by bit
+    crc = 0xFFFF
+    for byte in data:
+        crc ^= byte
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0xA001 if crc & 1 else crc >> 1
+    return crc
+
+
+def bitwise_crc8(data: bytes):
+    crc = 0xFF
+    for byte in data:
+        crc ^= byte
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x31 if crc & 0x80 else crc << 1) & 0xFF
+    return crc
+
+
+def batch_packet(rng, counter: int = 0):
+    packet = bytearray(BATCH_PACKET_SIZE)
+    packet[0:2] = BATCH_PACKET_SYNC
+    packet[2] = counter & 0xFF
+    packet[BATCH_PACKET_VALUES:BATCH_PACKET_CRC16] = rng.integers(0, 256, BATCH_PACKET_CRC16 - BATCH_PACKET_VALUES, dtype=np.uint8).tobytes()
+    packet[BATCH_PACKET_CRC16:] = bitwise_crc16(packet).to_bytes(2, 'little')
+    return bytes(packet)
+
+
+class CRCTest(unittest.TestCase):
+    def setUp(self):
+        self.rng = np.random.default_rng(0)
+
+    def test_known_values(self):
+        self.assertEqual(crc16(b''), 0xFFFF)
+        self.assertEqual(crc16(b'123456789'), 0x4B37)      # CRC-16/MODBUS check value
+        self.assertEqual(crc8(b''), 0xFF)
+        self.assertEqual(crc8(b'123456789'), bitwise_crc8(b'123456789'))
+
+    def test_bit_exact(self):
+        for _ in range(200):
+            data = self.rng.integers(0, 256, size=int(self.rng.integers(0, 1024)), dtype=np.uint8).tobytes()
+            self.assertEqual(crc16(data), bitwise_crc16(data))
+            self.assertEqual(crc8(data), bitwise_crc8(data))
+            self.assertEqual(crc16_zeros(2, crc16(data)), bitwise_crc16(data + bytes(2)))
+
+    def test_incremental(self):
+        data = self.rng.integers(0, 256, 805, dtype=np.uint8).tobytes()
+        self.assertEqual(crc16(data[300:], crc16(data[:300])), crc16(data))
+        self.assertEqual(crc8(data[300:], crc8(data[:300])), crc8(data))
+
+    def test_check_many(self):
+        # Every sync-aligned window of a receive buffer with a gap of zeros
+        packets = [batch_packet(self.rng, counter) for counter in range(64)]
+        buffer = b''.join(packets)
+        buffer = buffer[:100] + bytes(BATCH_PACKET_SIZE) + buffer[100:]
+        offsets = np.array([idx for idx in range(len(buffer) - BATCH_PACKET_SIZE + 1) if buffer[idx:idx + 2] == BATCH_PACKET_SYNC])
+        valid = crc16_check_many(buffer, offsets, BATCH_PACKET_SIZE)
+        for offset, is_valid in zip(offsets, valid):
+            packet = bytearray(buffer[offset:offset + BATCH_PACKET_SIZE])
+            stored = int.from_bytes(packet[BATCH_PACKET_CRC16:], 'little')
+            packet[BATCH_PACKET_CRC16:] = bytes(2)
+            self.assertEqual(bool(is_valid), stored == bitwise_crc16(packet))
+        self.assertGreaterEqual(int(valid.sum()), len(packets) - 1)
+
+    def test_many(self):
+        packets = [batch_packet(self.rng, counter) for counter in range(8)]
+        buffer = b''.join(packets)
+        offsets = np.arange(len(packets)) * BATCH_PACKET_SIZE
+        values = crc16_many(buffer, offsets, BATCH_PACKET_CRC16)
+        self.assertEqual([int(value) for value in values], [bitwise_crc16(packet[:BATCH_PACKET_CRC16]) for packet in packets])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import os
+import sys
+import tempfile
+import unittest
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from dataset import *
+
+
+class DatasetBuilderTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.sessions = os.path.join(self.dir.name, 'sessions')
+        self.dataset = os.path.join(self.dir.name, 'dataset')
+        os.makedirs(self.sessions)
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def record(self, name: str, letters: str):
+        writer = WaveWriter(os.path.join(self.sessions, name), 5, 2000, 2)
+        for iter, letter in enumerate(letters):
+            writer.write(letter, iter, np.full((400, 5), iter, dtype='<i2'))
+        writer.close()
+        return os.path.join(self.sessions, name)
+
+    def test_empty(self):
+        builder = DatasetBuilder(self.dataset)
+        self.assertEqual(builder.append_dir(self.sessions), 0)
+        dataset = EpochDataset(self.dataset)
+        self.assertEqual(len(dataset), 0)
+        self.assertEqual(list(dataset.batches(4)), [])
+
+    def test_no_events(self):
+        self.record('1', '')
+        builder = DatasetBuilder(self.dataset, settle=0)
+        self.assertEqual(builder.append_dir(self.sessions), 0)
+        self.assertEqual((builder.pending, builder.names), (1, set()))
+        self.assertEqual(len(EpochDataset(self.dataset)), 0)
+
+    def test_recording(self):
+        # Left for a later append while its files are being written
+        path = self.record('1', 'UD')
+        self.assertEqual(DatasetBuilder(self.dataset).append(path), 0)
+        builder = DatasetBuilder(self.dataset, settle=0)
+        self.assertEqual(builder.append(path), 2)
+        self.assertEqual(builder.append(path), 0)
+        dataset = EpochDataset(self.dataset)
+        self.assertEqual(dataset.epochs.shape, (2, 5, 400))
+        self.assertEqual(dataset.labels.tolist(), [0, 1])
+
+
+if __name__ == '__main__':
+    unittest.main()
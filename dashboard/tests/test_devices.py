@@ -0,0 +1,36 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from devices import *
+
+
+class LostPacketsTest(unittest.TestCase):
+    def setUp(self):
+        self.device = BatchDevice({ 'id' : 0, 'name' : 'test' })
+
+    def lost(self, counters):
+        return [self.device.calc_lost_packets(counter) for counter in counters]
+
+    def test_in_order(self):
+        self.assertEqual(self.lost([253, 254, 255, 0, 1]), [0, 0, 0, 0, 0])
+
+    def test_loss(self):
+        self.assertEqual(self.lost([10, 13, 120, 240, 2]), [0, 2, 106, 119, 17])
+        self.assertEqual(self.device.lost_packets, 244)
+
+    def test_reorder(self):
+        # 12 before 11: 11 is counted lost on 12 and dropped when it comes late
+        self.assertEqual(self.lost([10, 12, 11, 13]), [0, 1, None, 0])
+        self.assertEqual((self.device.lost_packets, self.device.late_packets, self.device.packet_counter), (1, 1, 13))
+
+    def test_reorder_wrap(self):
+        self.assertEqual(self.lost([254, 0, 255, 1]), [0, 1, None, 0])
+
+    def test_duplicate(self):
+        self.assertEqual(self.lost([7, 7, 8]), [0, None, 0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+import os
+import sys
+import unittest
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from display import *
+
+
+class DisplayTest(unittest.TestCase):
+    def setUp(self):
+        self.rng = np.random.default_rng(0)
+
+    def test_ringbuffer(self):
+        # More samples than the capacity: the newest are kept, `written` counts all of them
+        ring = RingBuffer(100, 2)
+        ring.append(np.ones((2, 30), dtype=np.float32))
+        ring.append(np.arange(500, dtype=np.float32).reshape(2, 250))
+        self.assertEqual(ring.written, 280)
+        np.testing.assert_array_equal(ring.view(), np.arange(500).reshape(2, 250)[:, -100:])
+        ring.fill(7, 1000)
+        self.assertEqual(ring.written, 1280)
+        np.testing.assert_array_equal(ring.view(), np.full((2, 100), 7))
+        ring.append(np.zeros((2, 10), dtype=np.float32))
+        np.testing.assert_array_equal(ring.tail(11)[:, 0], [7, 7])
+
+    def test_history_fill(self):
+        # fill() of lost samples is append() of as many samples of the value, at every level
+        filled = MipmapHistory(2000, 64, (2, 3), levels=4, factor=4)
+        appended = MipmapHistory(2000, 64, (2, 3), levels=4, factor=4)
+        for _ in range(200):
+            if self.rng.integers(0, 3):
+                block = self.rng.standard_normal((2, 3, int(self.rng.integers(1, 100)))).astype(np.float32)
+                filled.append(block)
+                appended.append(block)
+            else:
+                count = int(self.rng.integers(1, 3000))
+                filled.fill(2.5, count)
+                appended.append(np.full((2, 3, count), 2.5, dtype=np.float32))
+            self.assertEqual(filled.written, appended.written)
+            for level in range(4):
+                self.assertEqual(filled.lows[level].written, appended.lows[level].written)
+                np.testing.assert_array_equal(filled.lows[level].view(), appended.lows[level].view())
+                np.testing.assert_array_equal(filled.highs[level].view(), appended.highs[level].view())
+                if appended.pending[level] is None:
+                    self.assertIsNone(filled.pending[level])
+                else:
+                    np.testing.assert_array_equal(filled.pending[level][0], appended.pending[level][0])
+                    np.testing.assert_array_equal(filled.pending[level][1], appended.pending[level][1])
+        end = filled.written
+        for start in (end - 50, end - 2000, 0):
+            for expected, actual in zip(appended.view(start, end, 40), filled.view(start, end, 40)):
+                np.testing.assert_array_equal(actual, expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
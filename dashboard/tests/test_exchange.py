@@ -0,0 +1,118 @@
+import os
+import sys
+import unittest
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from dispatchers import *
+from benchmark import legacy_crc16_update, legacy_pack_packet, legacy_exchange_recv
+
+
+def reference_packet(data: list, event_code: int = 0, event_iter: int = 0, event_bits: int = 8, data_size: int = 0):
+    # Byte by byte: header, values at their own stride, zero padding, crc16 over the packet with its field zeroed.
+    # The legacy packer put every value at a 2 byte stride: 8 and 32 bit layouts of several values changed
+    width = event_bits // 8
+    packet = bytearray(b'\xAA\xCC') + bytes([event_code, event_iter, event_bits]) + data_size.to_bytes(2, 'little') + bytes(2)
+    for value in data:
+        packet += (value % 2 ** event_bits).to_bytes(width, 'little')
+    packet += bytes(ExchangeProtocol.PACKET_HEADER_SIZE + data_size - len(packet))
+    packet[7:9] = legacy_crc16_update(packet, len(packet)).to_bytes(2, 'little')
+    return bytes(packet)
+
+
+def reference_recv(data: bytes):
+    # (result, data_size, (event_code, event_iter, event_bits, values))
+    if data[0:2] != b'\xAA\xCC':
+        return ExchangeProtocol.RECV_RESULT_NOT_FOUND, 0, None
+    data_size = int.from_bytes(data[5:7], 'little')
+    if len(data) - ExchangeProtocol.PACKET_HEADER_SIZE < data_size:
+        return ExchangeProtocol.RECV_RESULT_AWAITING_DATA, data_size, None
+    packet = bytearray(data[:ExchangeProtocol.PACKET_HEADER_SIZE + data_size])
+    stored = int.from_bytes(packet[7:9], 'little')
+    packet[7:9] = bytes(2)
+    if stored != legacy_crc16_update(packet, len(packet)):
+        return ExchangeProtocol.RECV_RESULT_BAD_CRC16, data_size, None
+    width = packet[4] // 8
+    values = [int.from_bytes(packet[idx:idx + width], 'little') for idx in range(ExchangeProtocol.PACKET_HEADER_SIZE, len(packet), width)]
+    return ExchangeProtocol.RECV_RESULT_FOUND, data_size, (packet[2], packet[3], packet[4], values)
+
+
+class ExchangeCodec(ExchangeProtocol):
+    # ExchangeProtocol without sockets, keeps the last received packet
+    def __init__(self):
+        self.send_buffer = bytearray(ExchangeProtocol.PACKET_HEADER_SIZE)
+        self.packet = None
+
+    def on_packet(self, data: list, event_code: int = 0, event_iter: int = 0, event_bits: int = 8):
+        self.packet = (event_code, event_iter, event_bits, data)
+
+
+class ExchangeTest(unittest.TestCase):
+    def setUp(self):
+        self.rng = np.random.default_rng(0)
+        self.codec = ExchangeCodec()
+
+    def random_packet(self, legacy: bool = False):
+        # legacy - the layouts the legacy packer shares: any number of 16 bit values, at most one 8/32 bit value;
+        # else the 8/32 bit layouts of several values, changed to their own stride
+        event_bits = int(self.rng.choice([8, 16, 32] if legacy else [8, 32]))
+        width = event_bits // 8
+        count = int(self.rng.integers(0, 40)) if event_bits == 16 or not legacy else int(self.rng.integers(0, 2))
+        data = self.rng.integers(-2 ** (event_bits - 1), 2 ** event_bits, count).tolist()
+        data_size = count * width + int(self.rng.integers(0, 2)) * width
+        header = dict(event_code = int(self.rng.integers(0, 256)), event_iter = int(self.rng.integers(0, 256)), event_bits = event_bits, data_size = data_size)
+        return data, header
+
+    def test_pack(self):
+        for _ in range(300):
+            data, header = self.random_packet()
+            self.assertEqual(bytes(self.codec.pack_packet(data, **header)), reference_packet(data, **header))
+
+    def test_legacy(self):
+        # Frames of existing peers: same bytes as the legacy packer, decoded as the legacy recv does,
+        # header, padding and crc16 at every width
+        for _ in range(300):
+            data, header = self.random_packet(legacy=True)
+            packet = legacy_pack_packet(data, **header)
+            self.assertEqual(bytes(self.codec.pack_packet(data, **header)), packet)
+            result, size, expected = legacy_exchange_recv(bytearray(packet))
+            self.assertEqual(self.codec.recv(bytearray(packet)), (result, size))
+            self.assertEqual(result, ExchangeProtocol.RECV_RESULT_FOUND)
+            self.assertEqual(tuple(self.codec.packet[:3]), expected[:3])
+            self.assertEqual(self.codec.packet[3].tolist(), expected[3])
+
+            corrupted = bytearray(packet)
+            corrupted[int(self.rng.integers(0, len(packet)))] ^= 1 << int(self.rng.integers(0, 8))
+            expected = legacy_exchange_recv(bytearray(corrupted))[:2]
+            if expected[0] != ExchangeProtocol.RECV_RESULT_FOUND:
+                self.assertEqual(self.codec.recv(corrupted), expected)
+            self.assertEqual(self.codec.recv(bytearray(packet[:-1])), legacy_exchange_recv(bytearray(packet[:-1]))[:2])
+
+    def test_recv(self):
+        for _ in range(300):
+            data, header = self.random_packet()
+            packet = reference_packet(data, **header)
+            result, size, expected = reference_recv(packet)
+            self.assertEqual(self.codec.recv(bytearray(packet)), (result, size))
+            self.assertEqual(result, ExchangeProtocol.RECV_RESULT_FOUND)
+            self.assertEqual(tuple(self.codec.packet[:3]), expected[:3])
+            self.assertEqual(self.codec.packet[3].tolist(), expected[3])
+
+    def test_corrupted(self):
+        for _ in range(300):
+            data, header = self.random_packet()
+            packet = reference_packet(data, **header)
+            corrupted = bytearray(packet)
+            corrupted[int(self.rng.integers(0, len(packet)))] ^= 1 << int(self.rng.integers(0, 8))
+            expected = reference_recv(bytes(corrupted))[:2]
+            if expected[0] != ExchangeProtocol.RECV_RESULT_FOUND:
+                self.assertEqual(self.codec.recv(corrupted), expected)
+            self.assertEqual(self.codec.recv(bytearray(packet[:-1])), reference_recv(packet[:-1])[:2])
+
+    def test_too_many_values(self):
+        with self.assertRaises(ValueError):
+            self.codec.pack_packet([1, 2, 3], event_bits = 16, data_size = 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import os
+import sys
+import unittest
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from benchmark import LEGACY_IIR_POLYNOMS, legacy_iir_filter
+from filters import *
+
+
+def response(sections: np.ndarray, freq: float, sampling_rate: float):
+    # |H| of the cascade at freq
+    z = np.exp(-2j * np.pi * freq / sampling_rate * np.arange(3))
+    return abs(np.prod([(section[:3] @ z) / (section[3:] @ z) for section in sections]))
+
+
+class ButterworthFilterTest(unittest.TestCase):
+    def test_polynoms(self):
+        # Runtime design matches the hard-coded direct-form polynomials
+        for fcut, polynoms in LEGACY_IIR_POLYNOMS.items():
+            b, a = sos_to_tf(butter_lowpass_sos(10, fcut, 2000))
+            np.testing.assert_allclose(b, polynoms['b'], rtol=1e-6)
+            np.testing.assert_allclose(a[1:], polynoms['a'], rtol=1e-6)
+
+    def test_response(self):
+        for fcut in (30, 60, 200, 500):
+            sections = butter_lowpass_sos(10, fcut, 2000)
+            self.assertAlmostEqual(response(sections, 0, 2000), 1.0, places=9)
+            self.assertAlmostEqual(20 * np.log10(response(sections, fcut, 2000)), -3.0103, places=3)
+            self.assertLess(response(sections, 2 * fcut, 2000), 1e-2)
+            # The engine: steady state amplitude of a tone at fcut
+            t = np.arange(8000) / 2000
+            y = ButterworthFilter(10, fcut, 2000, 1).process(np.sin(2 * np.pi * fcut * t)[None])[0]
+            self.assertAlmostEqual(np.abs(y[-4000:]).max(), 2 ** -0.5, places=2)
+
+    def test_cascade(self):
+        # Block engine == sample by sample cascade on a stream split at random points
+        rng = np.random.default_rng(0)
+        x = rng.standard_normal((5, 4000))
+        iir = ButterworthFilter(10, 60, 2000, 5)
+        y, position = [], 0
+        while position < x.shape[-1]:
+            size = int(rng.integers(1, 400))
+            y.append(iir.process(x[:, position:position + size]))
+            position += size
+        y = np.concatenate(y, axis=-1)
+        sections = butter_lowpass_sos(10, 60, 2000)
+        for channel in range(5):
+            state = np.zeros(2 * len(sections))
+            np.testing.assert_allclose(y[channel], [sos_step(sections, state, value) for value in x[channel]], atol=1e-5)
+
+    def test_legacy(self):
+        # Legacy direct form vs engine, 200 Hz (after the legacy start-up transient)
+        x = np.random.default_rng(0).standard_normal(4000)
+        legacy, _ = legacy_iir_filter(200, [0] * 4000, [], x.tolist())
+        expected = ButterworthFilter(10, 200, 2000, 1).process(x[None])[0]
+        np.testing.assert_allclose(legacy[-2000:], expected[-2000:], atol=1e-3)
+
+    def test_reset(self):
+        # No start transient from the steady state of a constant input
+        iir = ButterworthFilter(10, 60, 2000, 2)
+        iir.reset(np.array([2.5, -1.0]))
+        y = iir.process(np.array([[2.5] * 400, [-1.0] * 400]))
+        np.testing.assert_allclose(y, [[2.5] * 400, [-1.0] * 400], atol=1e-4)
+
+
+if __name__ == '__main__':
+    unittest.main()
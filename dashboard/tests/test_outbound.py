@@ -0,0 +1,35 @@
+import os
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from outbound import *
+
+
+class OutboundQueueTest(unittest.TestCase):
+    def test_oversized(self):
+        for policy in OutboundQueue.POLICIES:
+            queue = OutboundQueue(high_water=100, policy=policy)
+            self.assertFalse(queue.push(bytes(101)))
+            self.assertEqual((len(queue), queue.pending_bytes, queue.dropped_frames), (0, 0, 1))
+            self.assertTrue(queue.push(bytes(100)))
+
+    def test_drop_oldest(self):
+        queue = OutboundQueue(high_water=100)
+        for idx in range(4):
+            self.assertTrue(queue.push(bytes([idx]) * 40))
+        self.assertEqual([frame[0] for frame in queue.frames], [2, 3])
+        self.assertEqual((queue.pending_bytes, queue.dropped_frames), (80, 2))
+
+    def test_block_no_wait(self):
+        queue = OutboundQueue(high_water=100, policy='block', block_timeout=5.0)
+        self.assertTrue(queue.push(bytes(80)))
+        since = time.monotonic()
+        self.assertFalse(queue.push(bytes(40), timeout=0))
+        self.assertLess(time.monotonic() - since, 1.0)
+        self.assertEqual((len(queue), queue.dropped_frames), (1, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
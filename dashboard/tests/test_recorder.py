@@ -0,0 +1,44 @@
+import os
+import sys
+import tempfile
+import unittest
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from replay import *
+
+
+class ChunkWriterTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, '1')
+        self.writer = ChunkWriter(self.path, 5, 2000, 2, 5)
+        for idx in range(3):
+            self.writer.write('UDL'[idx], idx, np.full((100, 5), idx, dtype='<i2'))
+
+    def tearDown(self):
+        self.writer.data_file.close()
+        self.writer.event_file.close()
+        self.dir.cleanup()
+
+    def test_closed(self):
+        self.writer.close()
+        frames, index = load_chunks(self.path)
+        self.assertEqual(frames.shape, (300, 5))
+        self.assertEqual(index['samples'], 300)
+        self.assertEqual([event['event'] for event in index['events']], ['U', 'D', 'L'])
+
+    def test_not_closed(self):
+        # Cut off by a crash: a partial frame and a partial index line
+        self.writer.data_file.write(b'\x01' * 7)
+        self.writer.data_file.flush()
+        self.writer.event_file.write('{"event": "R", "it')
+        self.writer.event_file.flush()
+        session = Session(self.path + '.json')
+        self.assertEqual(len(session), 300)
+        self.assertEqual([event['offset'] for event in session.events], [0, 100, 200])
+        self.assertEqual(int(session.frames[250, 0]), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
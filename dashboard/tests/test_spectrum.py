@@ -0,0 +1,61 @@
+import os
+import sys
+import unittest
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from spectrum import *
+
+
+class SpectrumTest(unittest.TestCase):
+    def setUp(self):
+        self.rng = np.random.default_rng(0)
+
+    def tone(self, freq: float, amplitude: float, samples: int, channels: int = 5):
+        t = np.arange(samples) / 2000
+        return np.repeat((amplitude * np.sin(2 * np.pi * freq * t))[None], channels, axis=0)
+
+    def test_sliding_dft(self):
+        # Bins of the last nfft samples after random size updates, exact resync included
+        dft = SlidingDFT([10, 12.5, 40], 2000, 400, 3, resync=7)
+        x = self.rng.standard_normal((3, 6000))
+        position = 0
+        while position < x.shape[-1]:
+            size = int(self.rng.integers(1, 900))
+            dft.update(x[:, position:position + size])
+            position = min(position + size, x.shape[-1])
+            if position >= dft.nfft:
+                expected = np.fft.fft(x[:, position - dft.nfft:position], axis=-1)[:, dft.bins]
+                np.testing.assert_allclose(dft.state, expected, atol=5e-6)
+        np.testing.assert_allclose(dft.amplitude(), np.abs(expected) / dft.nfft, atol=1e-7)
+
+    def test_stft(self):
+        # A tone on a bin: amplitude A / 2, frames of every hop samples
+        engine = SpectrumEngine(2000, 4000, 5, 400)
+        x = self.tone(10, 2.0, 8000)
+        frames = 0
+        for start in range(0, x.shape[-1], 80):
+            frames += engine.update(x[:, start:start + 80])
+        self.assertEqual(frames, 8000 // 400)
+        self.assertEqual(engine.spectrogram.view().shape, (5, len(engine.freqs), 64))
+        bin = int(np.argmax(engine.spectrum[0]))
+        self.assertEqual(engine.freqs[bin], 10)
+        np.testing.assert_allclose(engine.spectrum[:, bin], 1.0, rtol=1e-4)
+        expected = np.abs(np.fft.rfft(x[0, -4000:] * np.hanning(4000))) / np.hanning(4000).sum()
+        np.testing.assert_allclose(engine.spectrum[0], expected, atol=1e-6)
+
+    def test_band_powers(self):
+        # Tone of amplitude A: power A^2 / 2, all of it in its band
+        engine = SpectrumEngine(2000, 4000, 5, 400)
+        engine.update(self.tone(10, 2.0, 4000) + 0.5)
+        freqs, psd = engine.welch()
+        self.assertEqual(freqs[np.argmax(psd[0])], 10)
+        powers = engine.band_powers()
+        self.assertEqual(powers.shape, (5, len(BANDS)))
+        np.testing.assert_allclose(powers[:, list(BANDS).index('alpha')], 2.0, rtol=1e-2)
+        for band in ('theta', 'beta', 'gamma'):
+            self.assertLess(powers[0, list(BANDS).index(band)], 1e-3)
+
+
+if __name__ == '__main__':
+    unittest.main()